@@ -0,0 +1,35 @@
+"""Helpers shared by the retrieval benchmarks."""
+import resource
+
+import numpy as np
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (Linux reports ru_maxrss in KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile_ms(samples, pct) -> float:
+    return float(np.percentile(samples, pct) * 1000)
+
+
+def clustered_vectors(count, dim, clusters, rng, spread=0.6):
+    """
+    Unit vectors drawn around random centroids, closer to real embeddings than uniform noise.
+
+    Returns:
+        tuple: (vectors, cluster assignment per vector)
+    """
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, count)
+    vectors = centroids[assignments] + spread * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True), assignments
@@ -0,0 +1,119 @@
+"""
+Compare the flat memmap vector backend with ChromaDB on synthetic embeddings.
+
+Each backend runs in its own subprocess so resident memory is measured in isolation.
+
+Usage (from the backend directory):
+    python -m benchmarks.flat_vs_chroma --chunks 5000 --projects 5 --queries 200
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import percentile_ms, rss_mb
+
+
+def synthetic_corpus(chunks, projects, dim, seed=0):
+    """Random unit vectors spread round-robin over projects."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    project_ids = [f"project-{i % projects}" for i in range(chunks)]
+    ids = [f"conv-{i % projects}_{i}" for i in range(chunks)]
+    documents = [f"synthetic chunk {i}" for i in range(chunks)]
+    metadatas = [
+        {"conversation_id": f"conv-{i % projects}", "topic": f"topic-{i % 17}", "project_id": project_ids[i]}
+        for i in range(chunks)
+    ]
+    return ids, documents, metadatas, vectors
+
+
+def open_store(backend, workdir):
+    if backend == "flat":
+        from utils.flat_index import FlatVectorStore
+        return FlatVectorStore(os.path.join(workdir, "flat"))
+    import chromadb
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+    return client.get_or_create_collection("bench")
+
+
+def run_backend(args):
+    """Build, reopen and query one backend; prints a JSON result line."""
+    ids, documents, metadatas, vectors = synthetic_corpus(args.chunks, args.projects, args.dim)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.backend}-")
+    baseline_rss = rss_mb()
+
+    started = time.perf_counter()
+    store = open_store(args.backend, workdir)
+    if args.backend == "flat":
+        # Write each project once; the flat store rewrites a project on every add
+        for p in range(args.projects):
+            rows = list(range(p, args.chunks, args.projects))
+            store.add([ids[r] for r in rows], [documents[r] for r in rows],
+                      [metadatas[r] for r in rows], vectors[rows])
+    else:
+        for start in range(0, args.chunks, 5000):
+            end = start + 5000
+            store.add(ids=ids[start:end], documents=documents[start:end],
+                      metadatas=metadatas[start:end], embeddings=vectors[start:end])
+    build_seconds = time.perf_counter() - started
+    del store
+
+    started = time.perf_counter()
+    store = open_store(args.backend, workdir)
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    latencies = []
+    for q, query in enumerate(queries):
+        where = {"project_id": f"project-{q % args.projects}"}
+        t0 = time.perf_counter()
+        store.query(query_embeddings=[query.tolist()], n_results=args.k, where=where)
+        latencies.append(time.perf_counter() - t0)
+        if q == 0:
+            cold_start_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "backend": args.backend,
+        "chunks": args.chunks,
+        "projects": args.projects,
+        "dim": args.dim,
+        "build_seconds": round(build_seconds, 3),
+        "cold_start_seconds": round(cold_start_seconds, 4),
+        "query_p50_ms": round(percentile_ms(latencies[1:], 50), 3),
+        "query_p99_ms": round(percentile_ms(latencies[1:], 99), 3),
+        "rss_delta_mb": round(rss_mb() - baseline_rss, 1),
+    }))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backend", choices=["flat", "chroma"], help="Run a single backend in-process")
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args)
+        return
+
+    for backend in ("chroma", "flat"):
+        command = [sys.executable, "-m", "benchmarks.flat_vs_chroma", "--backend", backend,
+                   "--chunks", str(args.chunks), "--projects", str(args.projects),
+                   "--dim", str(args.dim), "--queries", str(args.queries), "--k", str(args.k)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        print(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Latency of hot-project searches through the in-memory index cache versus the flat store.
+
+Indexes many projects, then sends a skewed (Zipf) stream of project-scoped queries
+through a HotIndexCache sized to hold only some of them, and reports hit ratio,
+evictions and p50/p99 latency for cache hits, misses and the uncached store path.
+
+Usage (from the backend directory):
+    python -m benchmarks.hot_index_cache --projects 200 --chunks-per-project 2000 --budget-mb 64
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import clustered_vectors, percentile_ms
+from utils.flat_index import FlatVectorStore
+from utils.hot_index_cache import HotIndexCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--chunks-per-project", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    parser.add_argument("--zipf", type=float, default=1.3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench-hot-")
+    store = FlatVectorStore(workdir)
+    for p in range(args.projects):
+        vectors, _ = clustered_vectors(args.chunks_per_project, args.dim, 20, rng)
+        ids = [f"p{p}_{i}" for i in range(args.chunks_per_project)]
+        metadatas = [{"conversation_id": f"conv-{p}", "topic": "t", "project_id": f"project-{p}"}] * len(ids)
+        store.add(ids, ["chunk text"] * len(ids), metadatas, vectors)
+
+    cache = HotIndexCache(max_bytes=args.budget_mb * 1024 * 1024)
+    projects = np.minimum(rng.zipf(args.zipf, args.queries) - 1, args.projects - 1)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    latencies = {"hit": [], "miss": [], "store": []}
+    for project, query in zip(projects, queries):
+        project_id = f"project-{project}"
+        misses = cache.misses
+        started = time.perf_counter()
+        hot_index = cache.get(store, project_id)
+        if hot_index is not None:
+            hot_index.search([query], args.k)
+        else:
+            store.query([query], n_results=args.k, where={"project_id": project_id})
+        elapsed = time.perf_counter() - started
+        latencies["miss" if cache.misses > misses else "hit"].append(elapsed)
+
+        started = time.perf_counter()
+        store.query([query], n_results=args.k, where={"project_id": project_id})
+        latencies["store"].append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "projects": args.projects,
+        "chunks_per_project": args.chunks_per_project,
+        "budget_mb": args.budget_mb,
+        "cache": {key: value for key, value in cache.stats().items() if key != "max_bytes"},
+        **{
+            f"{path}_p{pct}_ms": round(percentile_ms(samples, pct), 3)
+            for path, samples in latencies.items() if samples
+            for pct in (50, 99)
+        },
+    }))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Recall and memory check for int8 quantization of the flat vector backend.
+
+Builds one project from clustered synthetic embeddings, then compares int8 search
+(with full-precision rescoring) against the exact float32 search it replaces.
+
+Usage (from the backend directory):
+    python -m benchmarks.quantization_recall --chunks 20000 --queries 500 --k 5
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import clustered_vectors
+from utils.flat_index import FlatVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, _ = clustered_vectors(args.chunks, args.dim, args.clusters, rng)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    workdir = tempfile.mkdtemp(prefix="bench-quant-")
+    store = FlatVectorStore(workdir)
+    ids = [f"chunk_{i}" for i in range(args.chunks)]
+    metadatas = [{"conversation_id": "bench", "topic": "t", "project_id": "bench"}] * args.chunks
+    store.add(ids, [""] * args.chunks, metadatas, vectors)
+    index = store.load("bench")
+
+    results = {}
+    for mode in ("none", "int8"):
+        started = time.perf_counter()
+        hits = index.search(queries, args.k, quantization=mode, rescore_factor=args.rescore_factor)
+        results[mode] = {
+            "rows": [set(row for _, row in query_hits) for query_hits in hits],
+            "ms_per_query": (time.perf_counter() - started) * 1000 / args.queries,
+        }
+
+    recall = np.mean([
+        len(exact & approx) / len(exact)
+        for exact, approx in zip(results["none"]["rows"], results["int8"]["rows"])
+    ])
+    print(json.dumps({
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "k": args.k,
+        "rescore_factor": args.rescore_factor,
+        "recall_at_k": round(float(recall), 4),
+        "float32_scan_bytes": int(index.vectors.nbytes),
+        "int8_scan_bytes": int(index.codes.nbytes),
+        "memory_reduction": round(index.vectors.nbytes / index.codes.nbytes, 2),
+        "float32_ms_per_query": round(results["none"]["ms_per_query"], 3),
+        "int8_ms_per_query": round(results["int8"]["ms_per_query"], 3),
+    }))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Retrieval benchmark: index build time, query latency, recall@k and memory per backend.
+
+Generates (or loads) an offline corpus of chunks spread over many projects, together
+with labeled queries whose relevant chunk is known. Every backend/setting runs in its
+own subprocess so RSS is measured in isolation, and results are emitted as JSON lines
+that can be diffed between runs.
+
+Settings:
+    chroma      ChromaDB HNSW collection
+    flat        Flat memmap backend, exact float32 scan
+    flat-int8   Flat memmap backend, int8 scan + full-precision rescoring
+    flat-routed Flat memmap backend searching only the chunks of the closest topic centroids
+    lexical     SQLite FTS5 / BM25 over chunk text
+    hybrid      flat + lexical fused with reciprocal-rank fusion
+
+Usage (from the backend directory):
+    python -m benchmarks.retrieval_bench --chunks 10000 --projects 20 --output bench.jsonl
+    python -m benchmarks.retrieval_bench --save-corpus /data/corpus-1m --chunks 1000000 --generate-only
+    python -m benchmarks.retrieval_bench --corpus-dir /data/corpus-1m --settings flat,flat-int8
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.common import clustered_vectors, peak_rss_mb, percentile_ms, rss_mb
+
+SETTINGS = ("chroma", "flat", "flat-int8", "flat-routed", "lexical", "hybrid")
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "be", "so", "pa", "du"]
+
+
+def _word(rng) -> str:
+    return "".join(rng.choice(_SYLLABLES, size=rng.integers(2, 4)))
+
+
+def generate_corpus(path, chunks, projects, dim, clusters, queries, seed=0):
+    """
+    Write a synthetic corpus to path.
+
+    Chunks in the same cluster share vocabulary and sit near the same centroid, and
+    each chunk carries one rare token (like a formula name or a date) so both vector
+    and lexical retrieval have something to find. Each query is derived from one chunk,
+    which is its ground truth, and is scoped to that chunk's project.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    vectors, assignments = clustered_vectors(chunks, dim, clusters, rng)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+
+    cluster_vocab = [[_word(rng) for _ in range(30)] for _ in range(clusters)]
+    common_vocab = [_word(rng) for _ in range(300)]
+    texts = []
+    with open(os.path.join(path, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(chunks):
+            cluster = int(assignments[i])
+            words = list(rng.choice(cluster_vocab[cluster], size=24)) + list(rng.choice(common_vocab, size=16))
+            rng.shuffle(words)
+            words.insert(int(rng.integers(0, len(words))), f"x{i}z")
+            text = " ".join(words)
+            texts.append(text)
+            f.write(json.dumps({
+                "id": f"conv-{i % projects}_{i}",
+                "project_id": f"project-{i % projects}",
+                "conversation_id": f"conv-{i % projects}",
+                "topic": f"topic-{cluster}",
+                "text": text,
+            }) + "\n")
+
+    sources = rng.integers(0, chunks, queries)
+    query_vectors = vectors[sources] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    np.save(os.path.join(path, "query_vectors.npy"), query_vectors)
+    with open(os.path.join(path, "queries.jsonl"), "w", encoding="utf-8") as f:
+        for source in sources:
+            source = int(source)
+            words = list(rng.choice(texts[source].split(), size=3, replace=False))
+            if rng.random() < 0.5:
+                words.append(f"x{source}z")
+            f.write(json.dumps({
+                "project_id": f"project-{source % projects}",
+                "text": " ".join(words),
+                "relevant_ids": [f"conv-{source % projects}_{source}"],
+            }) + "\n")
+
+
+def load_corpus(path):
+    """Load a corpus written by generate_corpus (or hand-built in the same layout)."""
+    with open(os.path.join(path, "chunks.jsonl"), "r", encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f]
+    with open(os.path.join(path, "queries.jsonl"), "r", encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f]
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+    query_vectors = np.load(os.path.join(path, "query_vectors.npy"))
+    return chunks, vectors, queries, query_vectors
+
+
+class _Backend:
+    """Uniform build/search wrapper around one retrieval setting."""
+    def __init__(self, setting, workdir):
+        self.setting = setting
+        self.workdir = workdir
+
+    def build(self, chunks, vectors):
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["text"] for chunk in chunks]
+        metadatas = [
+            {"project_id": c["project_id"], "conversation_id": c["conversation_id"], "topic": c["topic"]}
+            for c in chunks
+        ]
+        if self.setting == "chroma":
+            import chromadb
+            client = chromadb.PersistentClient(path=os.path.join(self.workdir, "chroma"))
+            self.collection = client.get_or_create_collection("bench")
+            batch = client.get_max_batch_size()
+            for start in range(0, len(ids), batch):
+                end = start + batch
+                self.collection.add(ids=ids[start:end], documents=documents[start:end],
+                                    metadatas=metadatas[start:end], embeddings=np.asarray(vectors[start:end]))
+        if self.setting in ("flat", "flat-int8", "flat-routed", "hybrid"):
+            from utils.flat_index import FlatVectorStore
+            quantization = "int8" if self.setting == "flat-int8" else "none"
+            self.store = FlatVectorStore(os.path.join(self.workdir, "flat"), quantization=quantization)
+            # One add call writes every project exactly once
+            self.store.add(ids, documents, metadatas, np.asarray(vectors))
+        if self.setting == "flat-routed":
+            from utils.topic_router import TopicCentroids
+            self.centroids = TopicCentroids(os.path.join(self.workdir, "topics.db"))
+            self.centroids.add(metadatas, np.asarray(vectors))
+        if self.setting in ("lexical", "hybrid"):
+            from utils.lexical_index import LexicalIndex
+            self.lexical = LexicalIndex(os.path.join(self.workdir, "lexical.db"))
+            for start in range(0, len(ids), 10000):
+                end = start + 10000
+                self.lexical.add(ids[start:end], documents[start:end], metadatas[start:end])
+
+    def search(self, query, query_vector, k):
+        """Ranked chunk ids for one labeled query."""
+        where = {"project_id": query["project_id"]}
+        if self.setting == "chroma":
+            result = self.collection.query(query_embeddings=[query_vector.tolist()], n_results=k, where=where)
+            return result["ids"][0]
+        if self.setting in ("flat", "flat-int8"):
+            return self.store.query([query_vector], n_results=k, where=where)["ids"][0]
+        if self.setting == "flat-routed":
+            topics = self.centroids.route(query["project_id"], [query_vector], k, min_chunks=0)[0]
+            if topics:
+                where = {"$and": [where, {"topic": {"$in": topics}}]}
+            return self.store.query([query_vector], n_results=k, where=where)["ids"][0]
+        lexical_hits = self.lexical.search(query["text"], n_results=max(k, 20), project_id=query["project_id"])
+        if self.setting == "lexical":
+            return [chunk_id for chunk_id, _ in lexical_hits[:k]]
+        from utils.lexical_index import reciprocal_rank_fusion
+        result = self.store.query([query_vector], n_results=max(k, 20), where=where)
+        vector_hits = list(zip(result["ids"][0], result["documents"][0]))
+        return [chunk_id for chunk_id, _ in reciprocal_rank_fusion([vector_hits, lexical_hits])[:k]]
+
+
+def run_setting(args):
+    """Benchmark one setting in this process and print a JSON result line."""
+    chunks, vectors, queries, query_vectors = load_corpus(args.corpus_dir)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.run_setting}-")
+    baseline_rss = rss_mb()
+    backend = _Backend(args.run_setting, workdir)
+
+    started = time.perf_counter()
+    backend.build(chunks, vectors)
+    build_seconds = time.perf_counter() - started
+    del chunks
+
+    latencies = []
+    recalls = []
+    for query, query_vector in zip(queries, query_vectors):
+        t0 = time.perf_counter()
+        hits = backend.search(query, query_vector, args.k)
+        latencies.append(time.perf_counter() - t0)
+        relevant = set(query["relevant_ids"])
+        recalls.append(len(relevant.intersection(hits)) / len(relevant))
+
+    print(json.dumps({
+        "setting": args.run_setting,
+        "build_seconds": round(build_seconds, 3),
+        "query_p50_ms": round(percentile_ms(latencies, 50), 3),
+        "query_p99_ms": round(percentile_ms(latencies, 99), 3),
+        f"recall_at_{args.k}": round(float(np.mean(recalls)), 4),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_delta_mb": round(rss_mb() - baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--settings", default=",".join(SETTINGS), help="Comma-separated settings to run")
+    parser.add_argument("--corpus-dir", help="Load an existing corpus instead of generating one")
+    parser.add_argument("--save-corpus", help="Directory to keep the generated corpus in")
+    parser.add_argument("--generate-only", action="store_true", help="Write the corpus and exit")
+    parser.add_argument("--output", help="Append JSON-lines results to this file")
+    parser.add_argument("--run-setting", choices=SETTINGS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_setting:
+        run_setting(args)
+        return
+
+    corpus_dir = args.corpus_dir
+    temporary_corpus = None
+    if not corpus_dir:
+        corpus_dir = args.save_corpus or tempfile.mkdtemp(prefix="bench-corpus-")
+        temporary_corpus = None if args.save_corpus else corpus_dir
+        generate_corpus(corpus_dir, args.chunks, args.projects, args.dim, args.clusters, args.queries)
+    if args.generate_only:
+        print(f"Corpus written to {corpus_dir}")
+        return
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "corpus": corpus_dir if args.corpus_dir else "synthetic",
+        "k": args.k,
+    }
+    if not args.corpus_dir:
+        run.update({"chunks": args.chunks, "projects": args.projects, "dim": args.dim, "queries": args.queries})
+    try:
+        for setting in args.settings.split(","):
+            command = [sys.executable, "-m", "benchmarks.retrieval_bench", "--run-setting", setting,
+                       "--corpus-dir", corpus_dir, "--k", str(args.k)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                result = {"setting": setting, "error": completed.stderr.strip().splitlines()[-1:]}
+            else:
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+            line = json.dumps({**run, **result})
+            print(line)
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+    finally:
+        if temporary_corpus:
+            shutil.rmtree(temporary_corpus, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Application database maintenance commands.
+
+Usage (from the backend directory):
+    python db_admin.py migrate
+    python db_admin.py status
+    python db_admin.py check-plans
+    python db_admin.py train-dictionaries
+    python db_admin.py compress
+    python db_admin.py archive
+
+migrate applies pending schema migrations (the API also does this on startup),
+status lists applied and pending versions, and check-plans runs EXPLAIN QUERY PLAN
+on every hot read and exits non-zero if one scans a table or sorts in a temporary
+B-tree, so a query or index change that loses its index is caught before deploy
+(SQLite only). With DATABASE_BACKEND=postgres every command runs against
+DATABASE_URL and --database is ignored.
+
+train-dictionaries builds new per-content-type compression dictionaries from the
+stored interactive content and source text, and compress rewrites values that are
+uncompressed or use an older dictionary, then vacuums and reports the file size.
+
+archive moves the messages of conversations idle for --days into the archive
+database (the API also does this every ARCHIVE_INTERVAL_HOURS); with --vacuum the
+freed pages are returned to the filesystem and the file sizes are reported.
+"""
+import argparse
+import json
+import os
+import sys
+
+from config import Config
+from utils.database import DatabaseClient
+from utils.db_backends import create_backend
+from utils.migrations import MIGRATIONS, applied_versions, apply_migrations, check_query_plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=Config.DATABASE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Apply pending schema migrations")
+    commands.add_parser("status", help="List applied and pending schema migrations")
+    commands.add_parser("check-plans", help="Fail if a hot query no longer uses an index")
+    train = commands.add_parser("train-dictionaries", help="Train compression dictionaries from stored content")
+    train.add_argument("--samples", type=int, default=500)
+    commands.add_parser("compress", help="Recompress stored content with the current dictionaries and vacuum")
+    archive = commands.add_parser("archive", help="Move messages of idle conversations to the archive database")
+    archive.add_argument("--days", type=int, default=Config.ARCHIVE_AFTER_DAYS)
+    archive.add_argument("--vacuum", action="store_true")
+
+    args = parser.parse_args()
+    if args.command in ("train-dictionaries", "compress", "archive"):
+        client = DatabaseClient(args.database)
+        if args.command == "train-dictionaries":
+            print(json.dumps(client.train_compression_dictionaries(samples=args.samples), indent=2))
+            return
+        if args.command == "archive":
+            before = os.path.getsize(args.database)
+            report = {}
+            while True:
+                batch = client.archive_inactive_conversations(older_than_days=args.days)
+                for key, value in batch.items():
+                    report[key] = report.get(key, 0) + value if key in ("conversations", "messages", "content_bytes", "freed_bytes") else value
+                if not batch["conversations"]:
+                    break
+            if args.vacuum:
+                client.vacuum()
+                report["bytes_before"] = before
+                report["bytes_after"] = os.path.getsize(args.database)
+            print(json.dumps(report, indent=2))
+            return
+        before = os.path.getsize(args.database)
+        rewritten = client.recompress_content()
+        client.vacuum()
+        print(json.dumps({
+            "rewritten": rewritten,
+            "bytes_before": before,
+            "bytes_after": os.path.getsize(args.database),
+        }, indent=2))
+        return
+
+    backend = create_backend(args.database)
+    if args.command == "check-plans" and backend.name != "sqlite":
+        sys.exit("check-plans reads SQLite query plans; use EXPLAIN on Postgres")
+    conn = backend.connect()
+    try:
+        if args.command == "migrate":
+            applied = apply_migrations(conn)
+            print(json.dumps({"applied": applied}, indent=2))
+        elif args.command == "status":
+            applied = applied_versions(conn)
+            print(json.dumps([
+                {"version": version, "description": description, "applied": version in applied}
+                for version, description, _ in MIGRATIONS
+            ], indent=2))
+        else:
+            # Plans are checked against the current schema, so migrate first
+            apply_migrations(conn)
+            problems = check_query_plans(conn)
+            print(json.dumps(problems, indent=2))
+            if any(problems.values()):
+                sys.exit(1)
+    finally:
+        backend.release(conn)
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
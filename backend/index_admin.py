@@ -0,0 +1,100 @@
+"""
+Vector index maintenance commands.
+
+Usage (from the backend directory):
+    python index_admin.py snapshot <project_id> snapshots/<project_id>.tar.gz
+    python index_admin.py restore snapshots/<project_id>.tar.gz [--project-id <new_id>]
+    python index_admin.py report --k 10 --samples 200 --ef 50,100,200
+    python index_admin.py rebuild
+    python index_admin.py compact
+
+Snapshots are portable between nodes and between the chroma and flat backends;
+the target backend is whatever VECTOR_BACKEND is configured on the node. restore
+logs the change in the application database (--database), and a running API drops
+its cached results, hot index and topic centroids for the project within
+READ_CACHE_POLL_SECONDS. On the flat backend that is all it takes; ChromaDB keeps
+its HNSW index in the API process, so restart the API after restoring into it.
+
+rebuild applies the HNSW_* settings from the config by copying the collection into
+a new index (flat backend: rewrites every project), and compact drops the space held
+by deleted and superseded entries. Both run offline: stop the API first. Use report
+before and after a tuning change to compare recall against exact search and latency.
+"""
+import argparse
+import json
+import os
+
+from config import Config
+from utils.database import DatabaseClient
+from utils.flat_index import FlatVectorStore, disk_usage
+from utils.index_maintenance import prune_orphaned_segments, rebuild_collection, recall_report
+from utils.index_snapshot import restore_project, snapshot_project
+from utils.vector_store import Indexer, hnsw_configuration, near_duplicates
+
+
+def _rebuild(indexer, args, configuration=None):
+    """Rebuild or compact the configured backend and report the disk space reclaimed."""
+    collection = indexer.collection
+    if isinstance(collection, FlatVectorStore):
+        before = disk_usage(collection.directory)
+        collection.compact(rebuild=args.command == "rebuild")
+        after = disk_usage(collection.directory)
+        result = {"count": collection.count()}
+    else:
+        before = disk_usage(args.persist_directory)
+        if configuration is None:
+            # Compaction keeps the collection's current parameters
+            current = collection.configuration["hnsw"]
+            configuration = {"hnsw": {name: current[name] for name in hnsw_configuration()["hnsw"]}}
+        result = rebuild_collection(indexer.client, indexer.collection_name, configuration)
+        prune_orphaned_segments(args.persist_directory)
+        after = disk_usage(args.persist_directory)
+    return {**result, "bytes_before": before, "bytes_after": after, "bytes_reclaimed": before - after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--database", default=Config.DATABASE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="Write a compressed snapshot of one project's index")
+    snapshot.add_argument("project_id")
+    snapshot.add_argument("path")
+
+    restore = commands.add_parser("restore", help="Replace a project's index with a snapshot")
+    restore.add_argument("path")
+    restore.add_argument("--project-id", help="Restore under a different project id")
+
+    report = commands.add_parser("report", help="ANN recall@k versus exact search, and query latency")
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--samples", type=int, default=200)
+    report.add_argument("--ef", help="Comma-separated search ef values to compare (ChromaDB only)")
+
+    commands.add_parser("rebuild", help="Rebuild the index with the configured HNSW parameters")
+    commands.add_parser("compact", help="Reclaim space held by deleted and superseded entries")
+
+    args = parser.parse_args()
+    indexer = Indexer(persist_directory=args.persist_directory)
+
+    if args.command == "snapshot":
+        os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+        manifest = snapshot_project(indexer.collection, args.project_id, args.path)
+        print(json.dumps({key: value for key, value in manifest.items() if key != "files"}))
+    elif args.command == "restore":
+        manifest = restore_project(indexer.collection, indexer.lexical_index, args.path, args.project_id,
+                                   topic_centroids=indexer.topic_centroids, near_duplicates=near_duplicates)
+        DatabaseClient(args.database).log_vector_index_change(args.project_id or manifest["project_id"])
+        print(json.dumps({key: value for key, value in manifest.items() if key != "files"}))
+    elif args.command == "report":
+        ef_values = [int(value) for value in args.ef.split(",")] if args.ef else None
+        for line in recall_report(indexer.collection, k=args.k, samples=args.samples, ef_values=ef_values):
+            print(json.dumps(line))
+    elif args.command == "rebuild":
+        print(json.dumps(_rebuild(indexer, args, hnsw_configuration())))
+    else:
+        print(json.dumps(_rebuild(indexer, args)))
+
+
+if __name__ == "__main__":
+    main()
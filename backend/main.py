@@ -9,10 +9,14 @@ from models import QuizRequest, QuizResponse, TimelineResponse, MindmapResponse,
 from utils.gemini_client import GeminiClient
 from prompts.quiz import COMPREHENSIVE_QUIZ_PROMPT
 from utils.preprocessor import Chunker, Extractor
-from utils.vector_store import Indexer, Retriever
+from utils.vector_store import Indexer, Retriever, invalidate_project_index, near_duplicates
+from utils.retrieval_cache import retrieval_cache
+from utils.hot_index_cache import hot_index_cache
 from utils.database import DatabaseClient
+from utils.async_database import AsyncDatabaseClient
 from utils.auth import get_current_user, get_current_user_optional
 from config import Config
+import asyncio
 import uuid
 import time
 
@@ -39,7 +43,48 @@ gemini_client = GeminiClient()
 extractor = Extractor()
 chunker = Chunker()
 indexer = Indexer()
-database_client = DatabaseClient(Config.DATABASE_FILE)
+database_client = AsyncDatabaseClient(DatabaseClient(Config.DATABASE_FILE))
+# Index changes reach the other workers through the invalidation log: this worker's uploads
+# are logged, and snapshot restores run in index_admin.py announce themselves the same way
+retrieval_cache.set_publisher(database_client.client.log_vector_index_change)
+database_client.client.add_invalidation_listener("vector_index", invalidate_project_index)
+
+
+@app.on_event("startup")
+async def start_chat_archival():
+    """Periodically move idle conversations' messages to the archive database."""
+    if Config.ARCHIVE_INTERVAL_HOURS > 0:
+        asyncio.create_task(archive_chat_periodically())
+
+async def archive_chat_periodically():
+    while True:
+        await asyncio.sleep(Config.ARCHIVE_INTERVAL_HOURS * 3600)
+        try:
+            report = await database_client.archive_inactive_conversations()
+            print(f"Chat archival: {report}")
+        except Exception as e:
+            print(f"Chat archival failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_invalidation_polling():
+    """
+    Periodically apply other workers' invalidations (including index restores), so
+    routes that never look up the read cache, like /chat, do not serve stale indexes.
+    """
+    asyncio.create_task(poll_invalidations_periodically())
+
+async def poll_invalidations_periodically():
+    while True:
+        await asyncio.sleep(max(Config.READ_CACHE_POLL_SECONDS, 0.1))
+        try:
+            await database_client.poll_invalidations()
+        except Exception as e:
+            print(f"Invalidation polling failed: {str(e)}")
+
+@app.on_event("shutdown")
+def close_database():
+    """Finish queued database writes before the worker exits."""
+    database_client.close()
 
 # Simple Firebase test route - serves HTML with proper HTTP protocol
 @app.get("/test-auth", response_class=HTMLResponse)
@@ -58,7 +103,7 @@ async def verify_token(current_user: dict = Depends(get_current_user)):
     """Verify Firebase token and register/update user"""
     try:
         # Create or update user in database
-        database_client.create_or_update_user(
+        await database_client.create_or_update_user(
             user_id=current_user["user_id"],
             email=current_user["email"],
             name=current_user.get("name"),
@@ -80,7 +125,7 @@ async def verify_token(current_user: dict = Depends(get_current_user)):
 async def get_user_profile(current_user: dict = Depends(get_current_user)):
     """Get current user profile"""
     try:
-        user_data = database_client.get_user(current_user["user_id"])
+        user_data = await database_client.get_user(current_user["user_id"])
         if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -97,15 +142,20 @@ async def get_user_profile(current_user: dict = Depends(get_current_user)):
 @app.get("/auth/conversations")
 async def get_user_conversations(
     project_id: Optional[str] = Query(None),
+    limit: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all conversations for the authenticated user and project (if provided)"""
+    """Get one page of conversations for the authenticated user and project (if provided), most recent first"""
     try:
-        conversations = database_client.get_user_conversations(current_user["user_id"], project_id)
+        page = await database_client.get_user_conversations_page(current_user["user_id"], project_id, limit=limit, cursor=cursor)
         return {
             "status": "success",
-            "conversations": conversations
+            "conversations": page["items"],
+            "next_cursor": page["next_cursor"]
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -118,10 +168,10 @@ async def debug_user_info(current_user: dict = Depends(get_current_user)):
     """Debug endpoint to show user isolation is working"""
     try:
         # Get user info from database
-        user_info = database_client.get_user(current_user["user_id"])
+        user_info = await database_client.get_user(current_user["user_id"])
         
         # Get user's conversations
-        conversations = database_client.get_user_conversations(current_user["user_id"])
+        conversations = await database_client.get_user_conversations(current_user["user_id"])
         
         return {
             "status": "success",
@@ -142,6 +192,25 @@ async def debug_user_info(current_user: dict = Depends(get_current_user)):
             detail=f"Failed to get debug info: {str(e)}"
         )
 
+@app.get("/debug/retrieval-stats")
+async def debug_retrieval_stats(project_id: Optional[str] = Query(None),
+                                current_user: dict = Depends(get_current_user)):
+    """Retrieval, hot index and read cache hit ratios and group commit sizes for this worker, and near-duplicate ratios of your projects"""
+    if project_id:
+        if not await database_client.get_project(project_id, current_user["user_id"]):
+            raise HTTPException(status_code=404, detail="Project not found")
+        project_ids = [project_id]
+    else:
+        project_ids = [project["id"] for project in await database_client.list_projects(current_user["user_id"])]
+    return {
+        "status": "success",
+        "retrieval_cache": retrieval_cache.stats(),
+        "hot_index_cache": hot_index_cache.stats(),
+        "near_duplicates": near_duplicates.stats(project_ids),
+        "database_writes": database_client.writer.stats(),
+        "read_cache": database_client.client.cache.stats()
+    }
+
 # TEMPORARY: Test endpoint without authentication (for testing)
 @app.get("/auth/test")
 async def test_auth_system():
@@ -165,7 +234,7 @@ async def mock_login(email: str = Form(...)):
         mock_user_id = f"mock_{email.replace('@', '_').replace('.', '_')}"
         
         # Save mock user to database
-        database_client.create_or_update_user(
+        await database_client.create_or_update_user(
             user_id=mock_user_id,
             email=email,
             name=f"Test User ({email})",
@@ -198,7 +267,7 @@ async def check_user_exists(email: str = Form(...)):
     """Check if a user exists in the system (public endpoint)"""
     try:
         # Check if user exists in database by email
-        user_data = database_client.get_user_by_email(email)
+        user_data = await database_client.get_user_by_email(email)
         
         return {
             "status": "success",
@@ -217,7 +286,7 @@ async def register_new_user(current_user: dict = Depends(get_current_user)):
     """Register a new user in the system"""
     try:
         # Check if user already exists
-        existing_user = database_client.get_user(current_user["user_id"])
+        existing_user = await database_client.get_user(current_user["user_id"])
         if existing_user:
             raise HTTPException(
                 status_code=400,
@@ -225,7 +294,7 @@ async def register_new_user(current_user: dict = Depends(get_current_user)):
             )
         
         # Create new user
-        database_client.create_or_update_user(
+        await database_client.create_or_update_user(
             user_id=current_user["user_id"],
             email=current_user["email"],
             name=current_user.get("name"),
@@ -302,21 +371,15 @@ async def upload(
         chunks, topics = await chunker.chunk_with_topics(content)
         conversation_id = indexer.get_conversation_id()
         if chunks and topics:
-            # --- Accumulate topics instead of overwriting ---
-            existing_topics = database_client.read_project_topics(project_id, user_id=current_user["user_id"])
-            if existing_topics:
-                # Merge and deduplicate, preserving order
-                merged_topics = list(dict.fromkeys([t.strip() for t in existing_topics + topics if t and t.strip()]))
-            else:
-                merged_topics = [t.strip() for t in topics if t and t.strip()]
-            database_client.write_topics(project_id, merged_topics, user_id=current_user["user_id"])
+            # --- Accumulate topics instead of overwriting (new topics appended, counts raised) ---
+            await database_client.add_project_topics(project_id, topics, user_id=current_user["user_id"])
             # Index only the new topics/chunks for this upload
             indexer.create_index_with_topics(conversation_id, chunks, topics, project_id=project_id)
         else:
             print("No chunks/topics to index for this upload. Skipping ChromaDB indexing.")
         # Store the source in the database
         source_id = str(uuid.uuid4())
-        database_client.write_source(
+        await database_client.write_source(
             source_id=source_id,
             user_id=current_user["user_id"],
             project_id=project_id,
@@ -342,20 +405,70 @@ async def upload(
 @app.get("/sources")
 async def get_sources(
     project_id: str = Query(...),
+    limit: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: dict = Depends(get_current_user),
 ):
     """
-    List all sources for the current user and project.
+    List one page of sources for the current user and project, newest first.
     """
     try:
-        sources = database_client.list_sources(current_user["user_id"], project_id)
-        return {"status": "success", "sources": sources}
+        page = await database_client.list_sources_page(current_user["user_id"], project_id, limit=limit, cursor=cursor)
+        return {"status": "success", "sources": page["items"], "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch sources: {str(e)}"
         )
 
+@app.get("/search")
+async def search_history(
+    q: str = Query(..., min_length=1, description="Words to look for"),
+    project_id: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=Config.MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Search the current user's chat messages and generated content (optionally in one project).
+    Hits are ranked best first and carry a snippet with the matched terms in **bold**.
+    Messages of archived conversations are found too (from the archive's index);
+    archived_conversations counts the archived conversations that were searched.
+    """
+    try:
+        results = await database_client.search_history(current_user["user_id"], q, project_id=project_id, limit=limit)
+        return {"status": "success", "query": q, **results}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to search history: {str(e)}"
+        )
+
+class RetrieveRequest(BaseModel):
+    project_id: str
+    queries: List[str]
+    n_results: int = 5
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Retrieve chunks of a project for several queries at once (e.g. one per topic, or a
+    question plus reformulations): per-query results and their fused, deduplicated union.
+    """
+    if not request.queries or len(request.queries) > Config.MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {Config.MAX_BATCH_QUERIES} queries")
+    if not 1 <= request.n_results <= Config.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"n_results must be between 1 and {Config.MAX_PAGE_SIZE}")
+    if not await database_client.get_project(request.project_id, current_user["user_id"]):
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        retriever = Retriever(project_id=request.project_id)
+        results = await asyncio.to_thread(retriever.batch_search, request.queries, request.n_results)
+        return {"status": "success", **results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve: {str(e)}")
+
 @app.post("/chat")
 async def chat(
     current_user: dict = Depends(get_current_user),
@@ -374,11 +487,12 @@ async def chat(
                 detail="User input is too short. Please provide at least 2 characters."
             )
         retriever = Retriever(project_id=project_id)
-        # Retrieve context based on user input
-        context = retriever.semantic_search(user_input)
+        # Retrieve context based on user input (vector + BM25 fused, then deduplicated and trimmed);
+        # retrieval blocks on its searches, so it runs off the event loop
+        context = await asyncio.to_thread(retriever.retrieve_context, user_input)
         print(f"Retrieved context: {context}")
         # Retrieve conversation history for multi-turn dialogue
-        conversation_history = database_client.read_chat_messages(conversation_id, user_id=current_user["user_id"])
+        conversation_history = await database_client.read_chat_messages(conversation_id, user_id=current_user["user_id"])
         print(f"Retrieved conversation history: {len(conversation_history) if conversation_history else 0} messages")
         # DEBUG: Print the exact structure of conversation history
         if conversation_history:
@@ -394,8 +508,11 @@ async def chat(
             print(f"DEBUG: Gemini error type: {type(gemini_error).__name__}")
             raise gemini_error
         # Save both user message and assistant response to database with user_id and project_id
-        database_client.write_chat_message(conversation_id, "user", user_input, user_id=current_user["user_id"], project_id=project_id)
-        database_client.write_chat_message(conversation_id, "assistant", response, user_id=current_user["user_id"], project_id=project_id)
+        # Queued together (in order), so both messages share one group commit
+        await asyncio.gather(
+            database_client.write_chat_message(conversation_id, "user", user_input, user_id=current_user["user_id"], project_id=project_id),
+            database_client.write_chat_message(conversation_id, "assistant", response, user_id=current_user["user_id"], project_id=project_id)
+        )
         return {
             "response": response,
             "status": "success",
@@ -423,7 +540,7 @@ async def get_topics(
         print('User:', current_user["user_id"])
         print('Project:', project_id)
         
-        topics = database_client.read_project_topics(project_id, user_id=current_user["user_id"])
+        topics = await database_client.read_project_topics(project_id, user_id=current_user["user_id"])
         print('Topics:', topics)
         
         if not topics:
@@ -449,11 +566,14 @@ async def get_topics(
 @app.get("/conversations/{conversation_id}")
 async def get_conversation_history(
     conversation_id: str,
+    limit: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: dict = Depends(get_current_user),
 ):
     """
     Retrieve conversation history from the database based on conversation ID.
-    This will return all chat messages associated with the conversation.
+    Returns the most recent page of chat messages in chronological order; pass
+    next_cursor back as cursor to load the page of older messages before it.
     """
     
     try:
@@ -464,10 +584,13 @@ async def get_conversation_history(
             )
         
         # Get conversation metadata with user_id
-        conversation_info = database_client.get_conversation_info(conversation_id, user_id=current_user["user_id"])
+        conversation_info = await database_client.get_conversation_info(conversation_id, user_id=current_user["user_id"])
         
-        # Get all chat messages with user_id
-        messages = database_client.read_chat_messages(conversation_id, user_id=current_user["user_id"])
+        # Get one page of chat messages with user_id
+        page = await database_client.read_chat_messages_page(
+            conversation_id, user_id=current_user["user_id"], limit=limit, cursor=cursor
+        )
+        messages = page["items"]
         
         if not messages and not conversation_info:
             raise HTTPException(
@@ -478,10 +601,13 @@ async def get_conversation_history(
         return {
             "conversation_info": conversation_info,
             "messages": messages,
+            "next_cursor": page["next_cursor"],
             "status": "success",
             "message": "Conversation history retrieved successfully"
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -523,9 +649,8 @@ async def generate_interactives(
         quiz_json = await gemini_client.generate_quiz(content, COMPREHENSIVE_QUIZ_PROMPT)
         print(f"✅ Quiz generated successfully!")
         interact_id = str(uuid.uuid4())
-        database_client.write_interactive_content(interact_id, project_id, "quiz", quiz_json, topics, user_id=current_user["user_id"])
+        await database_client.write_interactive(interact_id, project_id, "quiz", quiz_json, topics, user_id=current_user["user_id"])
         print(f"💾 Quiz saved to database successfully!")
-        database_client.write_interactive_history(current_user["user_id"], project_id, "quiz", topics)
         return QuizResponse(
             quiz_data=quiz_json,
             status="success",
@@ -597,9 +722,8 @@ async def generate_timeline(
             )
         
         interact_id = str(uuid.uuid4())
-        database_client.write_interactive_content(interact_id, project_id, "timeline", timeline_json, topics, user_id=current_user["user_id"])
+        await database_client.write_interactive(interact_id, project_id, "timeline", timeline_json, topics, user_id=current_user["user_id"])
         print(f"💾 Timeline saved to database successfully!")
-        database_client.write_interactive_history(current_user["user_id"], project_id, "timeline", topics)
         
         return TimelineResponse(
             timeline_data=timeline_json,
@@ -665,9 +789,8 @@ async def generate_mindmap(
         mindmap_json = json.loads(mindmap_response)
         
         interact_id = str(uuid.uuid4())
-        database_client.write_interactive_content(interact_id, project_id, "mindmap", mindmap_json, topics, user_id=current_user["user_id"])
+        await database_client.write_interactive(interact_id, project_id, "mindmap", mindmap_json, topics, user_id=current_user["user_id"])
         print(f"💾 Mindmap saved to database successfully!")
-        database_client.write_interactive_history(current_user["user_id"], project_id, "mindmap", topics)
         
         return MindmapResponse(
             mindmap_data=mindmap_json,
@@ -733,9 +856,8 @@ async def generate_flashcard(
         flashcard_json = json.loads(flashcard_response)
         
         interact_id = str(uuid.uuid4())
-        database_client.write_interactive_content(interact_id, project_id, "flashcard", flashcard_json, topics, user_id=current_user["user_id"])
+        await database_client.write_interactive(interact_id, project_id, "flashcard", flashcard_json, topics, user_id=current_user["user_id"])
         print(f"💾 Flashcard saved to database successfully!")
-        database_client.write_interactive_history(current_user["user_id"], project_id, "flashcard", topics)
         
         return FlashcardResponse(
             flashcard_data=flashcard_json,
@@ -762,7 +884,7 @@ async def create_project(request: ProjectCreateRequest, current_user: dict = Dep
     """Create a new project for the current user"""
     try:
         project_id = str(uuid.uuid4())
-        database_client.create_project(project_id, current_user["user_id"], request.name)
+        await database_client.create_project(project_id, current_user["user_id"], request.name)
         return {"status": "success", "project": {"id": project_id, "name": request.name}}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create project: {str(e)}")
@@ -771,7 +893,7 @@ async def create_project(request: ProjectCreateRequest, current_user: dict = Dep
 async def list_projects(current_user: dict = Depends(get_current_user)):
     """List all projects for the current user"""
     try:
-        projects = database_client.list_projects(current_user["user_id"])
+        projects = await database_client.list_projects(current_user["user_id"])
         return {"status": "success", "projects": projects}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list projects: {str(e)}")
@@ -780,7 +902,7 @@ async def list_projects(current_user: dict = Depends(get_current_user)):
 async def get_project(project_id: str, current_user: dict = Depends(get_current_user)):
     """Get details of a specific project for the current user"""
     try:
-        project = database_client.get_project(project_id, current_user["user_id"])
+        project = await database_client.get_project(project_id, current_user["user_id"])
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         return {"status": "success", "project": project}
@@ -800,7 +922,7 @@ async def create_new_conversation(
     try:
         conversation_id = str(uuid.uuid4())
         title = f"Conversation {conversation_id[:8]}"
-        database_client.create_conversation(conversation_id, title=title, user_id=current_user["user_id"], project_id=project_id)
+        await database_client.create_conversation(conversation_id, title=title, user_id=current_user["user_id"], project_id=project_id)
         return {
             "status": "success", 
             "id": conversation_id,  # Changed from conversation_id to id
@@ -814,19 +936,24 @@ async def create_new_conversation(
 @app.get("/interact-history")
 async def get_user_interactive_history(
     project_id: str = Query(..., description="Project identifier"),
+    limit: int = Query(10, ge=1, le=Config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Get the 10 most recent interactive history entries for the current user and project.
+    Get the most recent interactive history entries (10 by default) for the current user and project.
     """
     try:
         user_id = current_user["user_id"]
-        history = database_client.read_interactive_history(user_id, project_id, limit=10)
+        page = await database_client.read_interactive_history_page(user_id, project_id, limit=limit, cursor=cursor)
         return {
-            "interactive_history": history,
+            "interactive_history": page["items"],
+            "next_cursor": page["next_cursor"],
             "status": "success",
             "message": "Fetched recent interactive history."
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -843,7 +970,7 @@ async def get_interactive_content(
     Fetch a single interactive element (quiz, timeline, mindmap, flashcard) by its interact_id.
     """
     try:
-        content = database_client.read_interactive_content(interact_id, user_id=current_user["user_id"])
+        content = await database_client.read_interactive_content(interact_id, user_id=current_user["user_id"])
         if not content:
             raise HTTPException(status_code=404, detail="Interactive content not found")
         return {"status": "success", "interactive_content": content}
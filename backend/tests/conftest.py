@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+# Tests import the backend modules the way the API does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def hashed_embeddings(texts, dim=64):
+    """
+    Stand-in for embed_texts: a normalized bag of hashed words, so texts that share
+    words are close and nothing needs the embedding model.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in _WORD_RE.findall(text.lower()):
+            vectors[row, zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+@pytest.fixture
+def vector_stack(tmp_path, monkeypatch):
+    """
+    Indexer and Retriever wired to a flat store, lexical index, topic centroids and
+    near-duplicate index under tmp_path, with fresh caches and hashed_embeddings.
+    """
+    from config import Config
+    from utils import hot_index_cache, index_snapshot, vector_store
+    from utils.flat_index import FlatVectorStore
+    from utils.lexical_index import LexicalIndex
+    from utils.near_duplicates import NearDuplicateIndex
+    from utils.retrieval_cache import RetrievalCache
+    from utils.topic_router import TopicCentroids
+
+    stack = types.SimpleNamespace(
+        store=FlatVectorStore(str(tmp_path / "flat")),
+        lexical=LexicalIndex(str(tmp_path / "lexical.db")),
+        topic_centroids=TopicCentroids(str(tmp_path / "centroids.db")),
+        near_duplicates=NearDuplicateIndex(str(tmp_path / "dedup.db")),
+        retrieval_cache=RetrievalCache(similarity_threshold=0),
+        hot_index_cache=hot_index_cache.HotIndexCache(),
+    )
+    monkeypatch.setattr(Config, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(vector_store, "get_flat_store", lambda: stack.store)
+    monkeypatch.setattr(vector_store, "embed_texts", hashed_embeddings)
+    monkeypatch.setattr(vector_store, "lexical_index", stack.lexical)
+    monkeypatch.setattr(vector_store, "topic_centroids", stack.topic_centroids)
+    monkeypatch.setattr(vector_store, "near_duplicates", stack.near_duplicates)
+    monkeypatch.setattr(vector_store, "hot_index_cache", stack.hot_index_cache)
+    for module in (vector_store, hot_index_cache, index_snapshot):
+        monkeypatch.setattr(module, "retrieval_cache", stack.retrieval_cache)
+    stack.indexer = lambda: vector_store.Indexer()
+    stack.retriever = lambda **kwargs: vector_store.Retriever(**kwargs)
+    return stack
@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.context_compressor import ContextCompressor
+
+
+def _unit(*components):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector / np.linalg.norm(vector)
+
+
+def test_near_duplicates_are_dropped_in_favour_of_the_better_hit():
+    compressor = ContextCompressor(duplicate_threshold=0.95, mmr_lambda=1.0, max_chars_per_chunk=1000)
+    hits = [("a", "first"), ("a-copy", "first again"), ("b", "second")]
+    embeddings = [_unit(1, 0.1), _unit(1, 0.12), _unit(0.6, 0.8)]
+
+    result = compressor.compress("query", _unit(1), hits, embeddings, n_results=3)
+    assert [chunk_id for chunk_id, _ in result] == ["a", "b"]
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_redundant_one():
+    hits = [("a", "a"), ("a-close", "a close"), ("other", "other")]
+    embeddings = [_unit(1, 0, 0), _unit(0.95, 0.31, 0), _unit(0.6, 0, 0.8)]
+    query = _unit(1, 0, 0.3)
+
+    relevance_only = ContextCompressor(duplicate_threshold=1.1, mmr_lambda=1.0, max_chars_per_chunk=1000)
+    assert [c for c, _ in relevance_only.compress("q", query, hits, embeddings, 2)] == ["a", "a-close"]
+    diverse = ContextCompressor(duplicate_threshold=1.1, mmr_lambda=0.5, max_chars_per_chunk=1000)
+    assert [c for c, _ in diverse.compress("q", query, hits, embeddings, 2)] == ["a", "other"]
+
+
+def test_long_chunks_keep_the_sentences_that_match_the_query_in_order():
+    compressor = ContextCompressor(duplicate_threshold=0.95, mmr_lambda=1.0, max_chars_per_chunk=90)
+    document = (
+        "Plants need sunlight to grow. The weather was pleasant that spring. "
+        "Chlorophyll absorbs sunlight during photosynthesis. Lunch was served at noon."
+    )
+    [(_, trimmed)] = compressor.compress(
+        "how does photosynthesis use sunlight", _unit(1), [("a", document)], [_unit(1)], 1
+    )
+    assert trimmed == "Plants need sunlight to grow. Chlorophyll absorbs sunlight during photosynthesis."
+
+    short = "Short chunks are returned unchanged. Even unrelated ones."
+    assert compressor.compress("photosynthesis", _unit(1), [("b", short)], [_unit(1)], 1) == [("b", short)]
+    unrelated = "Nothing here matches. " * 6
+    [(_, leading)] = compressor.compress("photosynthesis", _unit(1), [("c", unrelated)], [_unit(1)], 1)
+    assert unrelated.startswith(leading) and len(leading) <= 90
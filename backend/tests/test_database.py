@@ -0,0 +1,266 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from utils.async_database import AsyncDatabaseClient
+from utils.database import DatabaseClient
+from utils.db_backends import PostgresBackend
+from utils.write_queue import GroupCommitWriter
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn():
+    """
+    Server for the Postgres cases: POSTGRES_DSN when set, otherwise a throwaway
+    container started with testcontainers (needs Docker).
+    """
+    dsn = os.getenv("POSTGRES_DSN")
+    if dsn:
+        yield dsn
+        return
+    postgres = pytest.importorskip("testcontainers.postgres")
+    try:
+        container = postgres.PostgresContainer("postgres:16-alpine", driver=None).start()
+    except Exception as e:
+        pytest.skip(f"POSTGRES_DSN is not set and no Postgres container could be started: {e}")
+    try:
+        yield container.get_connection_url()
+    finally:
+        container.stop()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def db(request, tmp_path):
+    """A DatabaseClient on a fresh, migrated database of each backend."""
+    if request.param == "sqlite":
+        client = DatabaseClient(str(tmp_path / "app.db"))
+        yield client
+        client.close()
+        return
+
+    dsn = request.getfixturevalue("postgres_dsn")
+    psycopg = pytest.importorskip("psycopg")
+    from psycopg.conninfo import make_conninfo
+    name = f"whizardlm_test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(dsn, autocommit=True) as admin:
+        admin.execute(f"CREATE DATABASE {name}")
+    try:
+        client = DatabaseClient(
+            str(tmp_path / "unused.db"), backend=PostgresBackend(make_conninfo(dsn, dbname=name))
+        )
+        yield client
+        client.close()
+    finally:
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+
+
+def test_project_topics_accumulate_chunk_counts(db):
+    db.add_project_topics("p", ["Algebra", "algebra ", "Geometry"], user_id="u")
+    db.add_project_topics("p", ["ALGEBRA", "Calculus"], user_id="u")
+    assert db.read_project_topic_counts("p", "u") == [
+        {"topic": "Algebra", "chunk_count": 3},
+        {"topic": "Geometry", "chunk_count": 1},
+        {"topic": "Calculus", "chunk_count": 1},
+    ]
+
+    db.write_topics("p", ["Statistics"], user_id="u")
+    assert db.read_project_topics("p", "u") == ["Statistics"]
+
+
+def test_chat_message_pages_return_every_message_once(db):
+    db.create_conversation("c", "Title", user_id="u", project_id="p")
+    for i in range(7):
+        db.write_chat_message("c", "user" if i % 2 == 0 else "assistant", f"message {i}", user_id="u", project_id="p")
+
+    contents, cursor = [], None
+    while True:
+        page = db.read_chat_messages_page("c", user_id="u", limit=3, cursor=cursor)
+        contents = [message["content"] for message in page["items"]] + contents
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert contents == [f"message {i}" for i in range(7)]
+    assert [message["content"] for message in db.read_chat_messages("c", user_id="u")] == contents
+    assert db.read_chat_messages("c", user_id="someone else") == []
+
+
+def test_conversation_pages(db):
+    for i in range(5):
+        db.create_conversation(f"c{i}", f"Conversation {i}", user_id="u", project_id="p")
+    db.create_conversation("other", "Other project", user_id="u", project_id="q")
+
+    ids, cursor = [], None
+    while True:
+        page = db.get_user_conversations_page("u", "p", limit=2, cursor=cursor)
+        ids.extend(conversation["id"] for conversation in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(ids) == [f"c{i}" for i in range(5)]
+    assert len(db.get_user_conversations("u")) == 6
+
+
+def test_interactive_content_and_history(db):
+    history_id = db.write_interactive("i1", "p", "quiz", {"title": "Photosynthesis"}, ["Biology"], "u")
+    assert db.read_interactive_content("i1", user_id="u")["content_json"] == {"title": "Photosynthesis"}
+    assert db.read_interactive_content("i1", user_id="someone else") is None
+
+    history = db.read_interactive_history("u", "p")
+    assert [(row["id"], row["interact_id"], row["topics"]) for row in history] == [(history_id, "i1", ["Biology"])]
+    assert db.read_interactive_history_page("u", "p")["items"][0]["interact_id"] == "i1"
+
+
+def test_user_upsert_invalidates_cached_user(db):
+    db.create_or_update_user("u", "old@example.com", name="Old")
+    assert db.get_user("u")["name"] == "Old"
+    db.create_or_update_user("u", "new@example.com", name="New", email_verified=True)
+    user = db.get_user("u")
+    assert (user["email"], user["name"]) == ("new@example.com", "New")
+
+
+def test_invalidation_log_reaches_other_clients(db):
+    other = DatabaseClient(db.db_file, backend=db.backend)
+    other.cache.poll_interval = 0
+    seen = []
+    other.add_invalidation_listener("vector_index", seen.append)
+
+    db.log_vector_index_change("p")
+    other.list_projects("u")
+    assert seen == ["p"]
+
+    # Polled without a cache lookup, and by lookups with the cache disabled
+    db.log_vector_index_change("q")
+    other.poll_invalidations()
+    assert seen == ["p", "q"]
+    other.cache.max_entries = 0
+    db.log_vector_index_change("r")
+    other.list_projects("u")
+    assert seen == ["p", "q", "r"]
+
+
+def test_search_history(db):
+    db.create_conversation("c", "Plants", user_id="u", project_id="p")
+    db.write_chat_message("c", "user", "How does photosynthesis work in plants?", user_id="u", project_id="p")
+    db.write_chat_message("c", "user", "Photosynthesis for someone else", user_id="v", project_id="p")
+    db.write_interactive("i1", "p", "quiz", {"question": "Where does photosynthesis happen?"}, ["Biology"], "u")
+
+    results = db.search_history("u", "photosynthesis")
+    assert [hit["conversation_id"] for hit in results["messages"]] == ["c"]
+    assert [hit["interact_id"] for hit in results["content"]] == ["i1"]
+    assert results["archived_conversations"] == 0
+    assert db.search_history("u", "photosynthesis", project_id="elsewhere") == {
+        "messages": [], "content": [], "archived_conversations": 0
+    }
+
+
+def test_search_history_ranks_rarer_terms_first(db):
+    db.create_conversation("c", "Plants", user_id="u", project_id="p")
+    for i in range(5):
+        db.write_chat_message("c", "user", f"a note about leaves number {i}", user_id="u", project_id="p")
+    db.write_chat_message("c", "user", "chlorophyll makes leaves green", user_id="u", project_id="p")
+
+    hits = db.search_history("u", "what are chlorophyll leaves")["messages"]
+    assert "**chlorophyll**" in hits[0]["snippet"]
+    assert len(hits) == 6 and hits[0]["score"] > hits[1]["score"]
+
+
+def test_search_history_finds_archived_conversations(db):
+    if db.archive is None:
+        pytest.skip("chat archival is SQLite only")
+    db.create_conversation("old", "Plants", user_id="u", project_id="p")
+    db.write_chat_message("old", "user", "How does photosynthesis work?", user_id="u", project_id="p")
+    db.write_chat_message("old", "assistant", "Leaves turn light into sugar", user_id="u", project_id="p")
+    db.create_conversation("other", "Someone else's", user_id="v", project_id="p")
+    db.write_chat_message("other", "user", "photosynthesis photosynthesis", user_id="v", project_id="p")
+    with db._transaction() as cursor:
+        cursor.execute("UPDATE conversations SET updated_at = datetime('now', '-100 days')")
+    assert db.archive_inactive_conversations(older_than_days=90)["conversations"] == 2
+    db.create_conversation("new", "More plants", user_id="u", project_id="p")
+    db.write_chat_message("new", "user", "photosynthesis needs chlorophyll", user_id="u", project_id="p")
+
+    results = db.search_history("u", "photosynthesis")
+    assert results["archived_conversations"] == 1
+    assert sorted((hit["conversation_id"], hit["conversation_title"]) for hit in results["messages"]) == [
+        ("new", "More plants"), ("old", "Plants")
+    ]
+    archived_hit = next(hit for hit in results["messages"] if hit["conversation_id"] == "old")
+    assert archived_hit["type"] == "user" and "**photosynthesis**" in archived_hit["snippet"]
+    assert db.search_history("u", "photosynthesis", project_id="elsewhere") == {
+        "messages": [], "content": [], "archived_conversations": 0
+    }
+
+    # Once restored, the conversation is found in the hot database only
+    db.restore_archived_conversation("old")
+    results = db.search_history("u", "photosynthesis")
+    assert sorted(hit["conversation_id"] for hit in results["messages"]) == ["new", "old"]
+    assert results["archived_conversations"] == 0
+
+    # Conversations archived before the archive had a search index are indexed on startup
+    db.archive_inactive_conversations(older_than_days=90)
+    db.archive._get_connection().execute("DROP TABLE archived_messages_fts")
+    reopened = DatabaseClient(db.db_file)
+    results = reopened.search_history("u", "photosynthesis")
+    assert sorted(hit["conversation_id"] for hit in results["messages"]) == ["new", "old"]
+    reopened.close()
+
+
+def test_background_archival_commits_one_conversation_per_write(tmp_path):
+    client = DatabaseClient(str(tmp_path / "app.db"))
+    for conversation_id in ("a", "b", "c"):
+        client.create_conversation(conversation_id, "Old", user_id="u", project_id="p")
+        for i in range(20):
+            client.write_chat_message(conversation_id, "user", f"{i} " + "leaf " * 800, user_id="u", project_id="p")
+    with client._transaction() as cursor:
+        cursor.execute("UPDATE conversations SET updated_at = datetime('now', '-100 days')")
+
+    async def archive():
+        database = AsyncDatabaseClient(client)
+        submitted = []
+        submit = database.writer.submit
+
+        def record(method, *args, **kwargs):
+            submitted.append(method.__name__)
+            if args[0] == "a":
+                # A message arriving after the conversation was listed keeps it in the hot database
+                client.write_chat_message("a", "user", "back again", user_id="u", project_id="p")
+            return submit(method, *args, **kwargs)
+
+        database.writer.submit = record
+        try:
+            return await database.archive_inactive_conversations(older_than_days=90), submitted
+        finally:
+            database.close()
+
+    report, submitted = asyncio.run(archive())
+    assert submitted == ["archive_conversation"] * 3
+    assert (report["conversations"], report["messages"]) == (2, 40)
+    assert report["freed_bytes"] > 0 and report["archive_bytes"] > 0
+
+    client = DatabaseClient(client.db_file)
+    assert not client.is_archived("a") and client.is_archived("b")
+    again = client.archive_inactive_conversations(older_than_days=90)
+    # Freed bytes are this run's, not the free space the file already had
+    assert (again["conversations"], again["freed_bytes"]) == (0, 0)
+    client.close()
+
+
+def test_group_commit_isolates_a_failing_write(db):
+    def fail():
+        with db._transaction() as cursor:
+            cursor.execute("INSERT INTO projects (id, user_id, name) VALUES (?, ?, ?)", ("bad", "u", "Bad"))
+            raise RuntimeError("boom")
+
+    writer = GroupCommitWriter(db, window_ms=50)
+    good = writer.submit(db.create_project, "p", "u", "Good")
+    bad = writer.submit(fail)
+    writer.close()
+
+    good.result()
+    with pytest.raises(RuntimeError):
+        bad.result()
+    assert [project["id"] for project in db.list_projects("u")] == ["p"]
+    with pytest.raises(RuntimeError):
+        writer.submit(db.create_project, "q", "u", "Late")
@@ -0,0 +1,176 @@
+import re
+
+import pytest
+
+from utils.database import DatabaseClient
+from utils.db_backends import translate_sql
+from utils.pagination import encode_cursor
+
+# Constructs translate_sql() rewrites; none may reach Postgres
+_SQLITE_ONLY_RE = re.compile(
+    r"BEGIN IMMEDIATE|INSERT OR |AUTOINCREMENT|\bBLOB\b|datetime\(|julianday\(|PRAGMA|sqlite_master|fts5|\bMATCH\b",
+    re.IGNORECASE,
+)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+# Single-value aggregates always return a row, so the stand-in answers them with 0
+_AGGREGATE_RE = re.compile(r"\s*SELECT (COUNT|COALESCE|MAX|MIN|SUM)\(", re.IGNORECASE)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM users WHERE user_id = ? AND email = ?", "SELECT * FROM users WHERE user_id = %s AND email = %s"),
+    ("BEGIN IMMEDIATE", "BEGIN"),
+    (
+        "INSERT OR IGNORE INTO topics (project_id) VALUES (?);",
+        "INSERT INTO topics (project_id) VALUES (%s) ON CONFLICT DO NOTHING",
+    ),
+    (
+        "CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB)",
+        "CREATE TABLE IF NOT EXISTS t (id BIGSERIAL PRIMARY KEY, data BYTEA)",
+    ),
+    (
+        "CREATE TABLE IF NOT EXISTS t (id TEXT PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS t (\n    rowid BIGSERIAL NOT NULL,id TEXT PRIMARY KEY)",
+    ),
+    (
+        "DELETE FROM t WHERE created_at < datetime('now', ?)",
+        "DELETE FROM t WHERE created_at < (CURRENT_TIMESTAMP + CAST(%s AS INTERVAL))",
+    ),
+    ("SELECT julianday(c.created_at) FROM c", "SELECT (EXTRACT(EPOCH FROM c.created_at) / 86400.0) FROM c"),
+    # % is doubled for psycopg, inside literals too; ? inside a literal stays
+    ("SELECT * FROM t WHERE name LIKE '50%?' AND id = ?", "SELECT * FROM t WHERE name LIKE '50%%?' AND id = %s"),
+])
+def test_translate_sql_rewrites(sql, expected):
+    assert translate_sql(sql) == expected
+
+
+class _RecordingCursor:
+    """Postgres-dialect cursor that records statements instead of running them; every read is empty."""
+    dialect = "postgres"
+    rowcount = 0
+    lastrowid = 1
+
+    def __init__(self, statements):
+        self._statements = statements
+        self._count = False
+
+    def execute(self, sql, params=()):
+        self._statements.append(sql)
+        self._count = bool(_AGGREGATE_RE.match(sql))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        return self.execute(sql)
+
+    def fetchone(self):
+        return (0,) if self._count else None
+
+    def fetchall(self):
+        return [(0,)] if self._count else []
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class _RecordingConnection:
+    dialect = "postgres"
+    isolation_level = None
+
+    def __init__(self, statements):
+        self._statements = statements
+        self.in_transaction = False
+
+    def cursor(self):
+        return _RecordingCursor(self._statements)
+
+    def execute(self, sql, params=()):
+        # Tracked so nested writes take DatabaseClient's savepoint path, as on a real connection
+        keyword = sql.split()[0].upper()
+        if keyword == "BEGIN":
+            self.in_transaction = True
+        elif keyword in ("COMMIT", "ROLLBACK") and "TO" not in sql.upper().split():
+            self.in_transaction = False
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+class _RecordingBackend:
+    """Stand-in for PostgresBackend: DatabaseClient takes its Postgres code paths."""
+    name = "postgres"
+
+    def __init__(self):
+        self.statements = []
+
+    def connect(self):
+        return _RecordingConnection(self.statements)
+
+    def release(self, conn):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_translate_sql_covers_every_postgres_statement(tmp_path):
+    backend = _RecordingBackend()
+    db = DatabaseClient(str(tmp_path / "unused.db"), backend=backend)
+    db.write_conversation("c", {"messages": []})
+    db.read_conversation("c")
+    db.create_conversation("c", "Title", user_id="u", project_id="p")
+    db.write_chat_message("c", "user", "hello", user_id="u", project_id="p")
+    db.read_chat_messages("c", user_id="u", limit=10)
+    db.read_chat_messages_page("c", user_id="u", limit=2)
+    db.get_conversation_info("c", user_id="u")
+    db.write_topics("p", ["Algebra"], user_id="u")
+    db.add_project_topics("p", ["Algebra"], user_id="u")
+    db.read_topics("c", user_id="u")
+    db.read_project_topics("p", user_id="u")
+    db.read_project_topic_counts("p", user_id="u")
+    db.write_interactive("i", "p", "quiz", {"title": "Quiz"}, ["Algebra"], "u")
+    db.read_interactive_content("i", user_id="u")
+    db.create_or_update_user("u", "u@example.com", name="U")
+    db.get_user("u")
+    db.get_user_by_email("u@example.com")
+    db.get_user_conversations("u")
+    db.get_user_conversations("u", "p")
+    db.get_user_conversations_page("u", "p", limit=2)
+    db.get_user_conversations_page("u", limit=2)
+    db.create_project("p", "u", "Project")
+    db.list_projects("u")
+    db.get_project("p", "u")
+    db.write_source("s", "u", "p", "Source", "pdf", content="text")
+    db.list_sources("u", "p")
+    db.list_sources_page("u", "p", limit=2)
+    db.read_interactive_history("u", "p")
+    db.read_interactive_history_page("u", "p", limit=2)
+    db.search_history("u", "photosynthesis")
+    db.search_history("u", "photosynthesis", project_id="p")
+    db.log_vector_index_change("p")
+    db.poll_invalidations()
+    db.is_archived("c")
+    db.restore_archived_conversation("c")
+    db.archive_inactive_conversations()
+    db.list_archivable_conversations()
+    db.archive_conversation("c")
+    db.storage_bytes()
+    db.vacuum()
+    db.close()
+
+    # Second pages: the keyset statements with an after-cursor
+    cursor = encode_cursor(("2025-01-01 00:00:00", 1))
+    db = DatabaseClient(str(tmp_path / "unused.db"), backend=backend)
+    for read_page in (
+        lambda: db.read_chat_messages_page("c", user_id="u", limit=2, cursor=cursor),
+        lambda: db.get_user_conversations_page("u", "p", limit=2, cursor=cursor),
+        lambda: db.list_sources_page("u", "p", limit=2, cursor=cursor),
+        lambda: db.read_interactive_history_page("u", "p", limit=2, cursor=cursor),
+    ):
+        read_page()
+
+    assert len(set(backend.statements)) > 50
+    for sql in set(backend.statements):
+        translated = translate_sql(sql)
+        assert not _SQLITE_ONLY_RE.search(_LITERAL_RE.sub("''", translated)), translated
+        assert "?" not in _LITERAL_RE.sub("''", translated), translated
+        assert translated.count("%s") == _LITERAL_RE.sub("''", sql).count("?"), translated
@@ -0,0 +1,89 @@
+import numpy as np
+
+from utils.flat_index import FlatVectorStore, ProjectIndex
+
+
+def _add(store, project_id, start, count, seed=0):
+    vectors = np.random.default_rng(seed + start).normal(size=(count, 16)).astype(np.float32)
+    store.add(
+        [f"{project_id}-{row}" for row in range(start, start + count)],
+        [f"chunk {row} of {project_id}" for row in range(start, start + count)],
+        [{"project_id": project_id, "conversation_id": "c", "topic": "t"} for _ in range(count)],
+        vectors / np.linalg.norm(vectors, axis=1, keepdims=True),
+    )
+
+
+def test_get_pages_across_projects_and_segments(tmp_path, monkeypatch):
+    store = FlatVectorStore(str(tmp_path))
+    for project_id, batches in (("a", [7, 3]), ("b", [5]), ("c", [4, 4, 2])):
+        start = 0
+        for count in batches:
+            _add(store, project_id, start, count)
+            start += count
+    everything = store.get(include=["documents", "metadatas", "embeddings"])
+    assert len(everything["ids"]) == 25
+
+    reads = []
+    document = ProjectIndex.document
+    monkeypatch.setattr(ProjectIndex, "document", lambda self, row: reads.append(row) or document(self, row))
+    pages = {"ids": [], "documents": [], "embeddings": []}
+    for offset in range(0, 25, 6):
+        page = store.get(offset=offset, limit=6, include=["documents", "metadatas", "embeddings"])
+        for key in pages:
+            pages[key].extend(page[key])
+    # Only the rows of each page are materialized, not everything before it
+    assert len(reads) == 25
+    assert pages["ids"] == everything["ids"]
+    assert pages["documents"] == everything["documents"]
+    assert np.array_equal(np.stack(pages["embeddings"]), np.stack(everything["embeddings"]))
+
+    assert store.get(offset=25, limit=6)["ids"] == []
+    assert store.get(where={"project_id": "c"}, offset=8)["ids"] == ["c-8", "c-9"]
+
+
+def _corpus(count, dim=32, seed=7):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_query_matches_brute_force_cosine(tmp_path):
+    store = FlatVectorStore(str(tmp_path))
+    vectors = _corpus(500)
+    store.add(
+        [f"chunk-{row}" for row in range(500)], [f"chunk {row}" for row in range(500)],
+        [{"project_id": "p", "conversation_id": f"c{row % 2}", "topic": "t"} for row in range(500)], vectors
+    )
+    queries = _corpus(10, seed=8)
+
+    results = store.query(queries, n_results=10, where={"project_id": "p"})
+    scores = queries @ vectors.T
+    for q, ids in enumerate(results["ids"]):
+        expected = np.argsort(-scores[q])[:10]
+        assert ids == [f"chunk-{row}" for row in expected]
+        assert np.allclose(results["distances"][q], 1.0 - scores[q][expected], atol=1e-5)
+
+    # Metadata filters only return matching rows, still in exact order
+    filtered = store.query(queries[:1], n_results=5, where={"$and": [{"project_id": "p"}, {"conversation_id": "c1"}]})
+    odd = [row for row in np.argsort(-scores[0]) if row % 2][:5]
+    assert filtered["ids"][0] == [f"chunk-{row}" for row in odd]
+
+
+def test_segments_merge_geometrically_and_compact_to_one(tmp_path):
+    store = FlatVectorStore(str(tmp_path))
+    for batch in range(12):
+        _add(store, "p", batch * 10, 10, seed=batch)
+    index = store.load("p")
+    segments = getattr(index, "segments", [index])
+    # Sizes shrink geometrically from the oldest segment, so there are O(log n) of them
+    sizes = [len(segment) for segment in segments]
+    assert len(sizes) <= 4 and sum(sizes) == 120
+    assert all(older > 2 * newer for older, newer in zip(sizes, sizes[1:]))
+    assert [str(chunk_id) for chunk_id in index.ids] == [f"p-{row}" for row in range(120)]
+
+    before = store.get(include=["documents", "embeddings"])
+    store.compact()
+    index = store.load("p")
+    assert not hasattr(index, "segments")
+    after = store.get(include=["documents", "embeddings"])
+    assert after["ids"] == before["ids"] and after["documents"] == before["documents"]
+    assert np.allclose(np.stack(after["embeddings"]), np.stack(before["embeddings"]))
@@ -0,0 +1,57 @@
+import numpy as np
+
+from utils.flat_index import FlatVectorStore
+from utils.hot_index_cache import HotIndexCache
+
+
+def _add_chunks(store, project_id, vectors, start=0):
+    ids = [f"chunk-{start + row}" for row in range(len(vectors))]
+    metadatas = [
+        {"project_id": project_id, "conversation_id": f"c{(start + row) % 3}", "topic": f"t{(start + row) % 4}"}
+        for row in range(len(vectors))
+    ]
+    store.add(ids, [f"document {start + row}" for row in range(len(vectors))], metadatas, vectors)
+
+
+def _vectors(count, seed):
+    vectors = np.random.default_rng(seed).normal(size=(count, 32)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_hot_index_holds_codes_and_matches_exact_search(tmp_path):
+    exact_store = FlatVectorStore(str(tmp_path / "exact"), quantization="none")
+    int8_store = FlatVectorStore(str(tmp_path / "int8"), quantization="int8", rescore_factor=4)
+    # Two batches, so the int8 store's project has one segment per batch, each with its own scales
+    for start, vectors in ((0, _vectors(300, 1)), (300, _vectors(100, 2) * 0.5)):
+        for store in (exact_store, int8_store):
+            _add_chunks(store, "p", vectors, start)
+
+    exact = HotIndexCache(max_bytes=1 << 24).get(exact_store, "p")
+    quantized = HotIndexCache(max_bytes=1 << 24).get(int8_store, "p")
+    assert quantized.vectors is None
+    assert quantized.nbytes < exact.nbytes
+    vector_bytes = sum(codes.nbytes for _, codes, _ in quantized.code_blocks)
+    assert vector_bytes == exact.vectors.nbytes // 4
+
+    queries = _vectors(20, 3)
+    for kwargs in ({}, {"conversation_id": "c1"}, {"topics": ["t0", "t2"]}):
+        expected = exact.search(queries, 5, **kwargs)
+        actual = quantized.search(queries, 5, **kwargs)
+        # Rescoring against the float32 rows restores the exact order for the top hits
+        assert sum(a[0] == e[0] for a, e in zip(actual, expected)) >= 18
+        for hits in actual:
+            assert len(hits) == 5
+            if "conversation_id" in kwargs:
+                assert all(int(chunk_id.split("-")[1]) % 3 == 1 for chunk_id, _ in hits)
+
+
+def test_budget_counts_int8_codes(tmp_path):
+    store = FlatVectorStore(str(tmp_path / "int8"), quantization="int8")
+    _add_chunks(store, "p", _vectors(1000, 4))
+    entry = HotIndexCache(max_bytes=1 << 24).get(store, "p")
+
+    # A budget below the float32 matrix but above the codes still caches the project
+    cache = HotIndexCache(max_bytes=entry.nbytes + 1)
+    assert entry.nbytes < 1000 * 32 * 4
+    assert cache.get(store, "p") is not None
+    assert cache.stats()["bytes"] == entry.nbytes
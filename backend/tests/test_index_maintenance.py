@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import uuid
+
+import numpy as np
+import pytest
+
+from utils.flat_index import FlatVectorStore
+from utils.index_maintenance import prune_orphaned_segments, rebuild_collection, recall_report, recover_collection
+
+
+class _Collection:
+    """In-memory stand-in for a ChromaDB collection: just what rebuild_collection() uses."""
+
+    def __init__(self, client, name, configuration=None):
+        self.client = client
+        self.name = name
+        self.configuration = configuration
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def add(self, ids, documents, metadatas, embeddings):
+        if self.client.fail_after is not None and self.count() + len(ids) > self.client.fail_after:
+            raise RuntimeError("disk full")
+        self.rows.update(zip(ids, zip(documents, metadatas, embeddings)))
+
+    def get(self, offset=0, limit=None, include=None):
+        ids = list(self.rows)[offset:offset + limit]
+        return {
+            "ids": ids,
+            "documents": [self.rows[i][0] for i in ids],
+            "metadatas": [self.rows[i][1] for i in ids],
+            "embeddings": [self.rows[i][2] for i in ids],
+        }
+
+    def modify(self, name=None, configuration=None):
+        if name is not None:
+            self.client.collections[name] = self.client.collections.pop(self.name)
+            self.name = name
+
+
+class _Client:
+    def __init__(self):
+        self.collections = {}
+        self.fail_after = None
+
+    def list_collections(self):
+        return list(self.collections.values())
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def create_collection(self, name, configuration=None):
+        self.collections[name] = _Collection(self, name, configuration)
+        return self.collections[name]
+
+    def delete_collection(self, name):
+        del self.collections[name]
+
+
+def _client_with_chunks(count=25):
+    client = _Client()
+    chunks = client.create_collection("chunks", configuration={"hnsw": {"space": "cosine"}})
+    chunks.add([f"c{i}" for i in range(count)], [f"doc {i}" for i in range(count)],
+               [{"project_id": "p"}] * count, [[float(i), 1.0] for i in range(count)])
+    return client
+
+
+def test_rebuild_copies_every_chunk_under_the_original_name():
+    client = _client_with_chunks()
+    result = rebuild_collection(client, "chunks", {"hnsw": {"space": "cosine", "M": 32}}, batch_size=10)
+
+    assert result["count"] == 25
+    assert set(client.collections) == {"chunks"}
+    rebuilt = client.get_collection("chunks")
+    assert rebuilt.configuration == {"hnsw": {"space": "cosine", "M": 32}}
+    assert rebuilt.get(limit=25)["documents"] == [f"doc {i}" for i in range(25)]
+
+
+def test_failed_rebuild_keeps_the_original():
+    client = _client_with_chunks()
+    original = client.get_collection("chunks")
+    client.fail_after = 20
+    with pytest.raises(RuntimeError):
+        rebuild_collection(client, "chunks", {"hnsw": {"M": 32}}, batch_size=10)
+    assert client.get_collection("chunks") is original and original.count() == 25
+
+
+@pytest.mark.parametrize("leftovers, expected_action, expected_source", [
+    # Crashed after the original was renamed to the backup: the complete copy is adopted
+    ({"chunks_backup": "old", "chunks_rebuild": "new"}, "adopted", "new"),
+    # Only the backup survived: it is put back
+    ({"chunks_backup": "old"}, "restored", "old"),
+    # Crashed before the backup was deleted
+    ({"chunks": "new", "chunks_backup": "old"}, "cleaned", "new"),
+    # Crashed mid-copy: the original stays live, the staging copy waits for the next rebuild
+    ({"chunks": "old", "chunks_rebuild": "partial"}, None, "old"),
+])
+def test_recover_collection_after_an_interrupted_rebuild(leftovers, expected_action, expected_source):
+    client = _Client()
+    for name, label in leftovers.items():
+        client.create_collection(name).label = label
+
+    assert recover_collection(client, "chunks") == expected_action
+    assert client.get_collection("chunks").label == expected_source
+    assert "chunks_backup" not in client.collections
+
+
+def test_prune_orphaned_segments_keeps_live_segments(tmp_path):
+    live, orphan = str(uuid.uuid4()), str(uuid.uuid4())
+    connection = sqlite3.connect(tmp_path / "chroma.sqlite3")
+    connection.execute("CREATE TABLE segments (id TEXT)")
+    connection.execute("INSERT INTO segments VALUES (?)", (live,))
+    connection.commit()
+    connection.close()
+    for segment in (live, orphan):
+        os.makedirs(tmp_path / segment)
+        (tmp_path / segment / "data_level0.bin").write_bytes(b"\0" * 4096)
+    os.makedirs(tmp_path / "not-a-segment")
+
+    assert prune_orphaned_segments(str(tmp_path)) >= 4096
+    assert sorted(os.listdir(tmp_path)) == sorted(["chroma.sqlite3", live, "not-a-segment"])
+
+
+def test_recall_report_on_the_exact_flat_backend(tmp_path):
+    store = FlatVectorStore(str(tmp_path))
+    vectors = np.random.default_rng(1).normal(size=(300, 32)).astype(np.float32)
+    store.add([str(i) for i in range(300)], ["doc"] * 300, [{"project_id": "p"}] * 300, vectors)
+
+    [report] = recall_report(store, k=10, samples=40)
+    assert report["quantization"] == store.quantization and report["queries"] == 40
+    assert report["recall_at_10"] == 1.0
+    assert recall_report(FlatVectorStore(str(tmp_path / "empty"))) == []
@@ -0,0 +1,93 @@
+import io
+import json
+import tarfile
+
+import numpy as np
+import pytest
+
+from config import Config
+from utils.flat_index import FlatVectorStore
+from utils.index_snapshot import restore_project, snapshot_project
+from utils.lexical_index import LexicalIndex
+from utils.near_duplicates import NearDuplicateIndex
+from utils.topic_router import TopicCentroids
+
+
+def _index_project(vector_stack, monkeypatch, count=120):
+    monkeypatch.setattr(Config, "DEDUP_ENABLED", False)
+    chunks = ((f"Chunk {i} explains subject{i} with term{i % 13}.", f"topic{i % 4}") for i in range(count))
+    vector_stack.indexer().index_stream("conv", chunks, project_id="p", batch_size=50)
+
+
+def _rewrite(snapshot_path, edit):
+    """Repack a snapshot, passing each (member, data) through edit()."""
+    with tarfile.open(snapshot_path, "r:gz") as archive:
+        members = [(m, archive.extractfile(m).read() if m.isfile() else None) for m in archive.getmembers()]
+    with tarfile.open(snapshot_path, "w:gz") as archive:
+        for member, data in members:
+            member, data = edit(member, data)
+            archive.addfile(member, io.BytesIO(data) if data is not None else None)
+
+
+def test_restored_project_answers_queries_like_the_original(vector_stack, monkeypatch, tmp_path):
+    _index_project(vector_stack, monkeypatch)
+    snapshot_path = str(tmp_path / "p.tar.gz")
+    manifest = snapshot_project(vector_stack.store, "p", snapshot_path)
+    assert manifest["count"] == 120
+
+    target = FlatVectorStore(str(tmp_path / "node2"))
+    lexical = LexicalIndex(str(tmp_path / "node2-lexical.db"))
+    centroids = TopicCentroids(str(tmp_path / "node2-centroids.db"))
+    restore_project(target, lexical, snapshot_path, topic_centroids=centroids,
+                    near_duplicates=NearDuplicateIndex(str(tmp_path / "node2-dedup.db")))
+
+    queries = np.random.default_rng(0).normal(size=(5, 64)).astype(np.float32)
+    expected = vector_stack.store.query(queries, n_results=8, where={"project_id": "p"})
+    actual = target.query(queries, n_results=8, where={"project_id": "p"})
+    assert actual["ids"] == expected["ids"] and actual["documents"] == expected["documents"]
+    assert np.allclose(actual["distances"], expected["distances"])
+    assert lexical.count() == 120 and centroids.count() == 4
+
+    # Restoring under another id keeps the source project's rows apart
+    restore_project(target, lexical, snapshot_path, project_id="copy")
+    copied = target.query(queries, n_results=8, where={"project_id": "copy"})
+    assert copied["ids"] == expected["ids"]
+    assert {m["project_id"] for hits in copied["metadatas"] for m in hits} == {"copy"}
+
+
+def test_tampered_snapshot_is_rejected(vector_stack, monkeypatch, tmp_path):
+    _index_project(vector_stack, monkeypatch, count=20)
+    snapshot_path = str(tmp_path / "p.tar.gz")
+    snapshot_project(vector_stack.store, "p", snapshot_path)
+
+    def corrupt_manifest(member, data):
+        if member.name == "manifest.json":
+            manifest = json.loads(data)
+            name = sorted(manifest["files"])[0]
+            manifest["files"][name] = "0" * 64
+            data = json.dumps(manifest).encode("utf-8")
+            member.size = len(data)
+        return member, data
+
+    _rewrite(snapshot_path, corrupt_manifest)
+    target = FlatVectorStore(str(tmp_path / "node2"))
+    with pytest.raises(ValueError, match="checksum"):
+        restore_project(target, LexicalIndex(str(tmp_path / "lexical.db")), snapshot_path)
+    assert target.load("p") is None
+
+
+def test_snapshot_members_outside_the_restore_directory_are_rejected(vector_stack, monkeypatch, tmp_path):
+    _index_project(vector_stack, monkeypatch, count=20)
+    snapshot_path = str(tmp_path / "p.tar.gz")
+    snapshot_project(vector_stack.store, "p", snapshot_path)
+
+    def escape(member, data):
+        if member.name == "manifest.json":
+            member.name = "../manifest.json"
+        return member, data
+
+    _rewrite(snapshot_path, escape)
+    with pytest.raises((ValueError, tarfile.TarError)):
+        restore_project(FlatVectorStore(str(tmp_path / "node2")), LexicalIndex(str(tmp_path / "lexical.db")),
+                        snapshot_path)
+    assert not (tmp_path / "manifest.json").exists()
@@ -0,0 +1,63 @@
+from config import Config
+from utils.near_duplicates import NearDuplicateIndex
+
+_WORDS = ["light", "energy", "water", "carbon", "leaf", "root", "cell", "sugar", "oxygen", "growth",
+          "enzyme", "membrane", "protein", "nucleus", "soil", "stem", "seed", "flower", "pollen", "season"]
+
+
+def _passage(i, words=40):
+    """A passage whose word order is unique to i, so distinct passages share few shingles."""
+    return " ".join(f"{_WORDS[(i * 7 + j * (i + 3)) % len(_WORDS)]}{j % 9}" for j in range(words)) + "."
+
+
+def test_signatures_estimate_jaccard_similarity(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.db"))
+    original = _passage(1)
+    edited = original.replace(original.split()[-1], "ending", 1)
+
+    def similarity(a, b):
+        return (index.signature(a) == index.signature(b)).mean()
+
+    assert similarity(original, original) == 1.0
+    assert similarity(original, edited) >= Config.DEDUP_THRESHOLD
+    assert similarity(original, _passage(2)) < 0.2
+
+
+def test_duplicate_chunks_are_linked_instead_of_stored(vector_stack, monkeypatch):
+    monkeypatch.setattr(Config, "DEDUP_ENABLED", True)
+    indexer = vector_stack.indexer()
+    originals = [_passage(i) for i in range(10)]
+    assert indexer.index_stream("lecture", ((text, "biology") for text in originals), project_id="p") == 10
+
+    # A review sheet repeating six passages with a word changed, one of them twice in the same stream
+    repeats = [text.replace(text.split()[-1], "ending", 1) for text in originals[:6]] + [originals[0]]
+    new = [_passage(i) for i in range(10, 13)]
+    assert indexer.index_stream("review", ((t, "review") for t in repeats + new), project_id="p", batch_size=4) == 3
+    assert vector_stack.store.count() == 13
+    assert vector_stack.lexical.count() == 13
+
+    # Topic retrieval still returns the text of the skipped chunks, through the chunks they link to
+    review = vector_stack.retriever(project_id="p").retrieve_content_with_topics(["review"])
+    assert sorted(review) == sorted(new + originals[:6])
+    assert sorted(vector_stack.retriever(conversation_id="review", project_id="p")
+                  .retrieve_content_with_topics(["review"])) == sorted(new)
+    assert vector_stack.retriever(project_id="p").retrieve_content_with_topics(["biology"]) == originals
+
+    stats = vector_stack.near_duplicates.stats()
+    assert (stats["chunks_seen"], stats["duplicates"]) == (20, 7)
+    assert stats["projects"] == [{"project_id": "p", "chunks_seen": 20, "duplicates": 7, "dedup_ratio": 0.35}]
+    assert vector_stack.near_duplicates.stats(project_ids=["other"])["duplicates"] == 0
+
+
+def test_reset_project_drops_links_but_still_detects_duplicates(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.db"))
+    session = index.session("p")
+    batch = {"ids": ["a", "b"], "documents": [_passage(1), _passage(1)],
+             "metadatas": [{"topic": "t"}, {"topic": "u"}]}
+    session.commit(session.filter(batch))
+    assert batch["ids"] == ["a"] and index.linked_chunk_ids("p", ["u"]) == ["a"]
+
+    index.reset_project("p", ["a"], [_passage(1)])
+    assert index.linked_chunk_ids("p", ["u"]) == [] and index.stats()["chunks_seen"] == 1
+    again = index.session("p").filter({"ids": ["c"], "documents": [_passage(1)], "metadatas": [{"topic": "v"}]})
+    assert again["ids"] == [] and again["duplicates"][0][2] == "a"
@@ -0,0 +1,25 @@
+import pytest
+
+from utils.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("key", [("2025-01-01 00:00:00", 42), ("2025-01-01 00:00:00", "conv-1"), (1.5, 2)])
+def test_cursor_round_trip(key):
+    assert decode_cursor(encode_cursor(key)) == list(key)
+
+
+@pytest.mark.parametrize("key", [
+    ["2025-01-01 00:00:00", None],
+    ["2025-01-01 00:00:00", [1]],
+    [{"a": 1}, 2],
+    ["2025-01-01 00:00:00", True],
+])
+def test_cursor_rejects_non_scalar_values(key):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(key))
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(["only one"]), encode_cursor({"a": 1})])
+def test_cursor_rejects_malformed(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
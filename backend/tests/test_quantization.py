@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from utils.flat_index import FlatVectorStore, ProjectIndex, quantize_int8
+
+
+def _corpus(count, dim=48, seed=3):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_codes_reconstruct_within_half_a_step():
+    vectors = _corpus(200)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and codes.nbytes * 4 == vectors.nbytes
+    assert np.all(np.abs(codes * scales - vectors) <= scales / 2 + 1e-6)
+
+
+def test_int8_search_rescores_candidates_at_full_precision(tmp_path):
+    vectors = _corpus(2000)
+    metadatas = [{"project_id": "p", "conversation_id": "c", "topic": "t"} for _ in range(2000)]
+    ids = [f"chunk-{row}" for row in range(2000)]
+    exact = FlatVectorStore(str(tmp_path / "exact"))
+    quantized = FlatVectorStore(str(tmp_path / "int8"), quantization="int8", rescore_factor=4)
+    for store in (exact, quantized):
+        store.add(ids, ids, metadatas, vectors)
+    queries = _corpus(50, seed=4)
+
+    expected = exact.query(queries, n_results=10, where={"project_id": "p"})
+    actual = quantized.query(queries, n_results=10, where={"project_id": "p"})
+    recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(actual["ids"], expected["ids"])])
+    assert recall >= 0.95
+    # Returned distances come from the float32 rows, not the codes
+    for query, hit_ids, distances in zip(queries, actual["ids"], actual["distances"]):
+        rows = [int(chunk_id.split("-")[1]) for chunk_id in hit_ids]
+        assert np.allclose(distances, 1.0 - vectors[rows] @ query, atol=1e-5)
+        assert distances == sorted(distances)
+
+
+def test_versions_without_stored_codes_are_quantized_on_load(tmp_path):
+    store = FlatVectorStore(str(tmp_path), quantization="int8")
+    vectors = _corpus(100)
+    store.add([str(row) for row in range(100)], ["doc"] * 100, [{"project_id": "p"}] * 100, vectors)
+    index = store.load("p")
+    os.remove(os.path.join(index.path, "codes_int8.npy"))
+    os.remove(os.path.join(index.path, "code_scales.npy"))
+
+    legacy = ProjectIndex("p", index.path)
+    assert np.array_equal(legacy.codes, index.codes) and np.allclose(legacy.scales, index.scales)
+    assert legacy.search(vectors[:1], 1, quantization="int8")[0][0][1] == 0
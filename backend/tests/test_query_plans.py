@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from utils import migrations
+from utils.migrations import apply_migrations, check_query_plans
+from utils.queries import HOT_QUERIES
+
+
+@pytest.fixture
+def migrated_db(tmp_path):
+    conn = sqlite3.connect(tmp_path / "app.db")
+    apply_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_have_good_plans(migrated_db):
+    assert {name: steps for name, steps in check_query_plans(migrated_db).items() if steps} == {}
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_never_scans(migrated_db, name):
+    sql, params = HOT_QUERIES[name]
+    steps = [row[-1] for row in migrated_db.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    assert steps
+    assert not [step for step in steps if step.startswith("SCAN") or "TEMP B-TREE" in step]
+
+
+def _indexes(conn, table):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))}
+
+
+def test_interactive_content_has_no_timestamp_join_index(migrated_db):
+    # History reads go by interact_id since migration 4; content writes should not maintain the old join index
+    assert not {"idx_interactive_content_history", "idx_interactive_content_backfill"} & _indexes(
+        migrated_db, "interactive_content"
+    )
+
+
+def test_migrations_drop_the_join_index_of_older_databases(tmp_path, monkeypatch):
+    conn = sqlite3.connect(tmp_path / "app.db")
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:3])
+    apply_migrations(conn)
+    # What migration 3 used to create, and history written before interact_id existed
+    conn.execute("""
+        CREATE INDEX idx_interactive_content_history
+        ON interactive_content (user_id, project_id, content_type, created_at)
+    """)
+    conn.execute("""
+        INSERT INTO interactive_content (interact_id, user_id, project_id, content_type, content_json, topics_used, created_at)
+        VALUES ('i1', 'u', 'p', 'quiz', '{}', '[]', '2025-01-01 10:00:00')
+    """)
+    conn.execute("""
+        INSERT INTO interactive_history (user_id, project_id, content_type, topics, created_at)
+        VALUES ('u', 'p', 'quiz', '[]', '2025-01-01 10:00:01')
+    """)
+    conn.commit()
+    monkeypatch.undo()
+
+    assert apply_migrations(conn) == [version for version, _, _ in migrations.MIGRATIONS[3:]]
+    assert conn.execute("SELECT interact_id FROM interactive_history").fetchall() == [("i1",)]
+    assert not {"idx_interactive_content_history", "idx_interactive_content_backfill"} & _indexes(
+        conn, "interactive_content"
+    )
+    conn.close()
@@ -0,0 +1,40 @@
+from utils.database import DatabaseClient
+from utils.retrieval_cache import RetrievalCache
+
+SCOPE = ("p", None)
+
+
+def _worker(db_file):
+    """One API worker: its own database client and retrieval cache, wired as main.py does."""
+    client = DatabaseClient(db_file)
+    cache = RetrievalCache(max_entries=16, similarity_threshold=0)
+    cache.set_publisher(client.log_vector_index_change)
+    client.add_invalidation_listener("vector_index", lambda project_id: cache.bump_generation(project_id, publish=False))
+    return client, cache
+
+
+def test_index_change_in_one_worker_invalidates_the_other(tmp_path):
+    db_file = str(tmp_path / "app.db")
+    indexing_client, indexing_cache = _worker(db_file)
+    serving_client, serving_cache = _worker(db_file)
+    try:
+        serving_cache.put(SCOPE, "What is photosynthesis?", ["old hit"], serving_cache.generation("p"))
+        assert serving_cache.get(SCOPE, "what is photosynthesis") == ["old hit"]
+
+        # The other worker indexes new chunks for the project
+        indexing_cache.bump_generation("p")
+        assert serving_cache.get(SCOPE, "what is photosynthesis") == ["old hit"]
+
+        serving_client.poll_invalidations()
+        assert serving_cache.get(SCOPE, "what is photosynthesis") is None
+        assert serving_cache.stats()["stale"] == 1
+
+        # Applying a logged change does not log it again
+        indexing_client.poll_invalidations()
+        serving_cache.put(SCOPE, "What is photosynthesis?", ["new hit"], serving_cache.generation("p"))
+        indexing_client.poll_invalidations()
+        serving_client.poll_invalidations()
+        assert serving_cache.get(SCOPE, "what is photosynthesis") == ["new hit"]
+    finally:
+        indexing_client.close()
+        serving_client.close()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from config import Config
+from utils.topic_router import TopicCentroids
+
+
+def _axis(i, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def _centroids(tmp_path, topics=6, per_topic=10):
+    """Topic t's chunks all point along axis t, so its centroid is that axis."""
+    centroids = TopicCentroids(str(tmp_path / "centroids.db"))
+    metadatas = [{"project_id": "p", "topic": f"topic{t}"} for t in range(topics) for _ in range(per_topic)]
+    centroids.add(metadatas, np.stack([_axis(t) for t in range(topics) for _ in range(per_topic)]))
+    return centroids
+
+
+def test_route_picks_the_closest_topics(tmp_path):
+    centroids = _centroids(tmp_path)
+    query = _axis(2) + 0.5 * _axis(4)
+
+    [route] = centroids.route("p", [query], n_results=5, max_topics=2, min_chunks=10, min_similarity=0.3)
+    assert route == ["topic2", "topic4"]
+
+
+def test_route_falls_back_to_the_whole_project(tmp_path):
+    centroids = _centroids(tmp_path)
+    query = _axis(1)
+
+    # Project smaller than min_chunks, or no more topics than would be searched anyway
+    assert centroids.route("p", [query], 5, max_topics=2, min_chunks=1000, min_similarity=0.3) == [None]
+    assert centroids.route("p", [query], 5, max_topics=6, min_chunks=10, min_similarity=0.3) == [None]
+    assert centroids.route("p", [query], 5, max_topics=0, min_chunks=10, min_similarity=0.3) == [None]
+    assert centroids.route("unknown", [query], 5, max_topics=2, min_chunks=10, min_similarity=0.3) == [None]
+    # Per query: no centroid is similar enough, or the chosen topics hold too few chunks
+    routes = centroids.route("p", [_axis(7), query, query], 5, max_topics=2, min_chunks=10, min_similarity=0.3)
+    assert routes[0] is None and routes[1] is not None
+    assert centroids.route("p", [query], 21, max_topics=2, min_chunks=10, min_similarity=0.3) == [None]
+
+
+def test_centroids_fold_in_new_batches(tmp_path):
+    centroids = _centroids(tmp_path, topics=3, per_topic=2)
+    [before] = centroids.route("p", [_axis(0) + 2 * _axis(5)], 1, max_topics=1, min_chunks=1, min_similarity=0.3)
+    assert before == ["topic0"]
+    # Enough topic1 chunks along axis 5 move its centroid past topic0's
+    centroids.add([{"project_id": "p", "topic": "topic1"}] * 20, np.stack([_axis(5)] * 20))
+    [after] = centroids.route("p", [_axis(0) + 2 * _axis(5)], 1, max_topics=1, min_chunks=1, min_similarity=0.3)
+    assert after == ["topic1"] and centroids.count() == 3
+
+
+def test_retriever_searches_everything_when_routed_topics_come_up_short(vector_stack, monkeypatch):
+    monkeypatch.setattr(Config, "DEDUP_ENABLED", False)
+    chunks = [(f"Chunk {i} about shared words and item{i}.", "narrow" if i < 2 else f"topic{i % 3}") for i in range(30)]
+    vector_stack.indexer().index_stream("conv", iter(chunks), project_id="p")
+    retriever = vector_stack.retriever(project_id="p")
+    query = "shared words item1"
+
+    monkeypatch.setattr(vector_stack.topic_centroids, "route", lambda project_id, embeddings, n: [None] * len(embeddings))
+    full = retriever.semantic_search(query, n_results=4)
+    assert len(full) == 4
+
+    # Routed to a topic with only two chunks: the query is searched again over the whole project
+    monkeypatch.setattr(vector_stack.topic_centroids, "route", lambda project_id, embeddings, n: [["narrow"]] * len(embeddings))
+    vector_stack.retrieval_cache.bump_generation("p")
+    assert retriever.semantic_search(query, n_results=4) == full
+    # Enough chunks in the routed topic: only that topic is searched
+    routed = retriever.semantic_search("shared words item25", n_results=2)
+    assert sorted(routed) == ["Chunk 0 about shared words and item0.", "Chunk 1 about shared words and item1."]
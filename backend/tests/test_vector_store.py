@@ -0,0 +1,68 @@
+import pytest
+
+from config import Config
+
+
+def _chunks(count, start=0):
+    for i in range(start, start + count):
+        yield f"Chunk {i} covers subject{i} in words unique{i} and detail{i * 7}.", f"topic{i % 5}"
+
+
+def test_index_stream_writes_bounded_batches(vector_stack, monkeypatch):
+    monkeypatch.setattr(Config, "DEDUP_ENABLED", False)
+    indexer = vector_stack.indexer()
+    progress = []
+    added = []
+    add = vector_stack.store.add
+    monkeypatch.setattr(vector_stack.store, "add", lambda **batch: added.append(len(batch["ids"])) or add(**batch))
+
+    assert indexer.index_stream("conv", _chunks(250), project_id="p", batch_size=64, on_progress=progress.append) == 250
+
+    assert added == [64, 64, 64, 58]
+    assert progress == [64, 128, 192, 250]
+    assert vector_stack.store.count() == 250
+    assert vector_stack.lexical.count() == 250
+    assert vector_stack.topic_centroids.count() == 5
+
+
+def test_index_stream_keeps_batches_written_before_a_failure(vector_stack, monkeypatch):
+    monkeypatch.setattr(Config, "DEDUP_ENABLED", False)
+    indexer = vector_stack.indexer()
+
+    def failing_source():
+        yield from _chunks(100)
+        raise RuntimeError("extractor failed")
+
+    with pytest.raises(RuntimeError, match="extractor failed"):
+        indexer.index_stream("conv", failing_source(), project_id="p", batch_size=64)
+    # The first batch was complete and written; the partial second batch never was
+    assert vector_stack.store.count() == 64
+    assert vector_stack.lexical.count() == 64
+
+
+def test_batch_search_matches_one_search_per_query(vector_stack, monkeypatch):
+    from utils import vector_store
+    from utils.lexical_index import reciprocal_rank_fusion
+    from utils.retrieval_cache import RetrievalCache
+
+    vector_stack.indexer().index_stream("conv", _chunks(60), project_id="p")
+    queries = ["subject3 unique3", "detail14 subject2", "words unique40 subject41"]
+
+    retriever = vector_stack.retriever(project_id="p")
+    batch = retriever.batch_search(queries, n_results=4)
+
+    # Per-query searches against a fresh cache, so none is answered by the batch above
+    monkeypatch.setattr(vector_store, "retrieval_cache", RetrievalCache(similarity_threshold=0))
+    single = [retriever.semantic_search(query, n_results=4) for query in queries]
+    assert batch["results"] == single
+    assert batch["results"][0][0].startswith("Chunk 3 ")
+    fused = reciprocal_rank_fusion([list(zip(docs, docs)) for docs in single], k=Config.RRF_K)
+    assert batch["merged"] == [document for document, _ in fused]
+    assert len(batch["merged"]) == len(set(batch["merged"]))
+
+    # A repeated batch is answered from the cache without embedding anything
+    embedded = []
+    embed = vector_store.embed_texts
+    monkeypatch.setattr(vector_store, "embed_texts", lambda texts: embedded.append(texts) or embed(texts))
+    assert retriever.batch_search(queries, n_results=4) == batch
+    assert embedded == []
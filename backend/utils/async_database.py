@@ -0,0 +1,104 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from utils.database import DatabaseClient
+from utils.write_queue import GroupCommitWriter
+
+# DatabaseClient methods that write; everything else public is a read
+_WRITE_METHODS = {
+    "write_conversation",
+    "create_conversation",
+    "write_chat_message",
+    "write_topics",
+    "add_project_topics",
+    "write_interactive_content",
+    "write_interactive_history",
+    "write_interactive",
+    "create_or_update_user",
+    "create_project",
+    "write_source",
+    "log_vector_index_change",
+    "archive_conversation",
+    "restore_archived_conversation",
+}
+
+
+class AsyncDatabaseClient:
+    """
+    Awaitable front for DatabaseClient, for use from async routes.
+
+    Every public DatabaseClient method is available under the same name and
+    signature as a coroutine. Reads run on a small pool of DB threads, each with its
+    own long-lived connection; writes go to a GroupCommitWriter, which commits them
+    in arrival order, many per transaction. The event loop only awaits the result,
+    so a slow fsync or a large read no longer stalls unrelated requests on the worker.
+
+    Reading an archived conversation's messages first restores it through the
+    writer, so reader threads never write.
+    """
+    def __init__(self, client: DatabaseClient, read_threads: int = Config.SQLITE_READ_THREADS):
+        self.client = client
+        self._readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="db-read")
+        self.writer = GroupCommitWriter(client)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+
+        if name in _WRITE_METHODS:
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return await asyncio.wrap_future(self.writer.submit(method, *args, **kwargs))
+        else:
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return await self._read(method, *args, **kwargs)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def _read(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._readers, functools.partial(method, *args, **kwargs))
+
+    async def _restore_if_archived(self, conversation_id):
+        if await self._read(self.client.is_archived, conversation_id):
+            await self.restore_archived_conversation(conversation_id)
+
+    async def read_chat_messages(self, conversation_id, *args, **kwargs):
+        await self._restore_if_archived(conversation_id)
+        return await self._read(self.client.read_chat_messages, conversation_id, *args, **kwargs)
+
+    async def read_chat_messages_page(self, conversation_id, *args, **kwargs):
+        await self._restore_if_archived(conversation_id)
+        return await self._read(self.client.read_chat_messages_page, conversation_id, *args, **kwargs)
+
+    async def archive_inactive_conversations(self, older_than_days=Config.ARCHIVE_AFTER_DAYS, max_conversations=500):
+        """
+        DatabaseClient.archive_inactive_conversations() as many small writes: each
+        conversation is its own writer call, so chat writes queued meanwhile are
+        committed between them instead of waiting for the whole run.
+        """
+        before = await self._read(self.client.storage_bytes)
+        report = {"conversations": 0, "messages": 0, "content_bytes": 0}
+        candidates = await self._read(self.client.list_archivable_conversations, older_than_days, max_conversations)
+        for conversation_id in candidates:
+            moved = await self.archive_conversation(conversation_id, older_than_days)
+            if moved is not None:
+                report["conversations"] += 1
+                report["messages"] += moved["messages"]
+                report["content_bytes"] += moved["content_bytes"]
+        report.update(await self._read(self.client.archival_storage_report, before))
+        if report["conversations"]:
+            print(f"Archived {report['messages']} messages of {report['conversations']} conversations")
+        return report
+
+    def close(self):
+        """Wait for queued writes to finish, stop the DB threads and release their connections."""
+        self.writer.close()
+        self._readers.shutdown(wait=True)
+        self.client.close()
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+
+from config import Config
+from utils.lexical_index import fts_phrase
+
+
+class ChatArchive:
+    """
+    Cold storage for the messages of inactive conversations, in its own SQLite file.
+
+    Each archived conversation is one row holding all of its messages as a single
+    compressed JSON payload (compressed by the caller), so the hot database keeps
+    neither the rows nor their index entries and backups of it stay small. Rows
+    stay here after a conversation is restored; the next archival of that
+    conversation replaces them with a superset.
+
+    Archived messages are also indexed in an FTS5 table (with the same tokenizer as
+    chat_messages_fts, keyed by message id) so history search still finds them. The
+    index stores the message text uncompressed: it costs archive space, not space in
+    the hot database.
+    """
+    def __init__(self, db_file, decode=None):
+        """
+        Args:
+            db_file: Archive database file
+            decode: payload -> message rows; needed to index conversations archived
+                before the search index existed
+        """
+        self.db_file = db_file
+        self._local = threading.local()
+        conn = self._get_connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS archived_conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    message_count INTEGER NOT NULL,
+                    first_timestamp TIMESTAMP,
+                    last_timestamp TIMESTAMP,
+                    payload BLOB NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+            )
+            indexed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_messages_fts'"
+            ).fetchone()
+            conn.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS archived_messages_fts USING fts5(
+                    message_content,
+                    user_id,
+                    conversation_id UNINDEXED,
+                    message_type UNINDEXED,
+                    timestamp UNINDEXED,
+                    tokenize = 'porter unicode61'
+                );
+                """
+            )
+            if not indexed and decode is not None:
+                # Created in the same transaction, so a crash cannot leave it half filled
+                for conversation_id, payload in conn.execute(
+                    "SELECT conversation_id, payload FROM archived_conversations"
+                ).fetchall():
+                    self._index(conn, conversation_id, decode(payload))
+
+    def _get_connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout = {Config.SQLITE_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def get(self, conversation_id):
+        """Compressed payload of an archived conversation, or None."""
+        row = self._get_connection().execute(
+            "SELECT payload FROM archived_conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, conversation_id, user_id, messages, payload):
+        """
+        Store (or replace) a conversation's archived messages.
+
+        Args:
+            conversation_id: Conversation ID
+            user_id: Owner of the conversation
+            messages: The archived message rows, in order (for the summary columns)
+            payload: Compressed payload holding those rows
+        """
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO archived_conversations
+                    (conversation_id, user_id, message_count, first_timestamp, last_timestamp, payload)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                (conversation_id, user_id, len(messages), messages[0][4], messages[-1][4], payload)
+            )
+            self._index(conn, conversation_id, messages)
+
+    @staticmethod
+    def _index(conn, conversation_id, messages):
+        # The rows replace a superset of what was archived before, so their ids cover the old entries
+        conn.executemany("DELETE FROM archived_messages_fts WHERE rowid = ?", [(row[0],) for row in messages])
+        conn.executemany(
+            """
+            INSERT INTO archived_messages_fts (rowid, message_content, user_id, conversation_id, message_type, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            [(row[0], row[2], row[3], conversation_id, row[1], row[4]) for row in messages]
+        )
+
+    def search(self, match, user_id, limit):
+        """
+        Newest archived messages matching an FTS5 query, for ranking with rank_highlighted()
+
+        Args:
+            match: FTS5 query over message_content and user_id
+            user_id: Owner the hits must belong to (exact, unlike the tokenized user_id column)
+            limit: Maximum number of matches
+
+        Returns:
+            tuple: ([(message_id, conversation_id, highlighted text)], messages searched)
+        """
+        conn = self._get_connection()
+        rows = conn.execute(
+            """
+            SELECT rowid, conversation_id, highlight(archived_messages_fts, 0, char(1), char(2))
+            FROM archived_messages_fts
+            WHERE archived_messages_fts MATCH ? AND user_id = ?
+            ORDER BY rowid DESC LIMIT ?
+            """,
+            (match, user_id, limit)
+        ).fetchall()
+        scope = f'user_id : "{fts_phrase(user_id)}"'
+        total = conn.execute("SELECT COUNT(*) FROM archived_messages_fts WHERE archived_messages_fts MATCH ?", (scope,))
+        return rows, total.fetchone()[0]
+
+    def hits(self, match, message_ids):
+        """
+        Details of archived search hits
+
+        Returns:
+            dict: message_id -> (conversation_id, message_type, timestamp, snippet)
+        """
+        if not message_ids:
+            return {}
+        rows = self._get_connection().execute(
+            f"""
+            SELECT rowid, conversation_id, message_type, timestamp,
+                   snippet(archived_messages_fts, 0, '**', '**', '…', 16)
+            FROM archived_messages_fts
+            WHERE archived_messages_fts MATCH ? AND rowid IN ({", ".join("?" * len(message_ids))})
+            """,
+            [match, *message_ids]
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def size(self) -> int:
+        """Bytes on disk of the archive file and its WAL."""
+        return sum(
+            os.path.getsize(path) for path in (self.db_file, f"{self.db_file}-wal") if os.path.exists(path)
+        )
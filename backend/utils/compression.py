@@ -0,0 +1,121 @@
+import re
+import struct
+import threading
+import zlib
+from collections import Counter
+
+from config import Config
+
+# Stored values start with MAGIC and the id of the preset dictionary (0 = none);
+# anything else is a legacy uncompressed value and is returned as-is
+MAGIC = b"WZC1"
+_HEADER = struct.Struct(">4sI")
+# zlib only looks back 32 KB, so a larger preset dictionary is never used
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+# JSON keys with their punctuation, and runs of words, as they appear in payloads
+_SEGMENT_RE = re.compile(r'"[^"\\]{1,48}"\s*:\s*[\[{"]?|[A-Za-z][\w ,.\'-]{7,63}')
+
+
+def train_dictionary(samples, size: int = MAX_DICTIONARY_BYTES) -> bytes:
+    """
+    Build a zlib preset dictionary from sample payloads.
+
+    Segments (JSON keys and word runs) are scored by the number of samples they
+    occur in times their length, and the best ones are concatenated with the most
+    valuable last, where zlib reaches them with the shortest distances.
+
+    Args:
+        samples: Payload strings of one content type
+        size: Maximum dictionary size in bytes
+
+    Returns:
+        bytes: The dictionary (empty when nothing repeats across samples)
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(_SEGMENT_RE.findall(sample)))
+    scored = sorted(
+        ((count * len(segment), segment) for segment, count in counts.items() if count > 1),
+        reverse=True
+    )
+    chosen, total = [], 0
+    for _, segment in scored:
+        encoded = segment.encode("utf-8")
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class ContentCompressor:
+    """
+    zlib compression of large text columns with a preset dictionary per content type.
+
+    Dictionaries live in the compression_dictionaries table and are never changed
+    once written, so every stored value names the dictionary it was compressed
+    with. Writes use the newest dictionary of their content type; reads load older
+    or newer (trained by another process) dictionaries by id on demand.
+    """
+    def __init__(self, enabled: bool = Config.CONTENT_COMPRESSION, level: int = Config.CONTENT_COMPRESSION_LEVEL):
+        self.enabled = enabled
+        self.level = level
+        self._dictionaries = {}
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def load(self, conn):
+        """(Re)load every dictionary from the database."""
+        rows = conn.execute("SELECT id, content_type, dictionary FROM compression_dictionaries ORDER BY id").fetchall()
+        with self._lock:
+            for dictionary_id, content_type, dictionary in rows:
+                self._dictionaries[dictionary_id] = bytes(dictionary)
+                self._current[content_type] = dictionary_id
+
+    def compress(self, content_type, text):
+        """
+        Compress a text value for storage.
+
+        Returns:
+            bytes, or the text unchanged when compression is disabled
+        """
+        if text is None or not self.enabled:
+            return text
+        dictionary_id = self._current.get(content_type, 0)
+        if dictionary_id:
+            compressor = zlib.compressobj(self.level, zdict=self._dictionaries[dictionary_id])
+        else:
+            compressor = zlib.compressobj(self.level)
+        data = compressor.compress(text.encode("utf-8")) + compressor.flush()
+        return _HEADER.pack(MAGIC, dictionary_id) + data
+
+    def decompress(self, value, reload=None):
+        """
+        Text of a stored value; legacy uncompressed values are returned unchanged.
+
+        Args:
+            value: Column value as read from SQLite
+            reload: Called to reload dictionaries when the value names an unknown one
+        """
+        dictionary_id = self.stored_dictionary(value)
+        if dictionary_id is None:
+            return value
+        if dictionary_id:
+            if dictionary_id not in self._dictionaries and reload is not None:
+                reload()
+            decompressor = zlib.decompressobj(zdict=self._dictionaries[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj()
+        return (decompressor.decompress(value[_HEADER.size:]) + decompressor.flush()).decode("utf-8")
+
+    def current_dictionary(self, content_type):
+        """Id of the dictionary new writes of this content type use (0 = none, None = uncompressed)."""
+        return self._current.get(content_type, 0) if self.enabled else None
+
+    @staticmethod
+    def stored_dictionary(value):
+        """Id of the dictionary a stored value was compressed with (None = uncompressed)."""
+        if not isinstance(value, bytes) or not value.startswith(MAGIC):
+            return None
+        return _HEADER.unpack_from(value)[1]
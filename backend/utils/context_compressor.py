@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+
+from config import Config
+from utils.embeddings import normalize_rows
+from utils.lexical_index import STOPWORDS
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _terms(text: str) -> set:
+    return {word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS}
+
+
+class ContextCompressor:
+    """
+    Shrinks retrieved chunks before they are interpolated into the chat prompt:
+    drops near-duplicates, diversifies the selection with MMR and trims each chunk
+    to the sentences that overlap the query most.
+    """
+    def __init__(self,
+                 duplicate_threshold: float = Config.CONTEXT_DUPLICATE_THRESHOLD,
+                 mmr_lambda: float = Config.CONTEXT_MMR_LAMBDA,
+                 max_chars_per_chunk: int = Config.CONTEXT_MAX_CHARS_PER_CHUNK):
+        self.duplicate_threshold = duplicate_threshold
+        self.mmr_lambda = mmr_lambda
+        self.max_chars_per_chunk = max_chars_per_chunk
+
+    def compress(self, query, query_embedding, hits, embeddings, n_results):
+        """
+        Select and trim context chunks.
+
+        Args:
+            query: User query
+            query_embedding: Query vector
+            hits: Candidate (chunk_id, document) tuples, best match first
+            embeddings: Stored vector for each hit, in the same order
+            n_results: Maximum number of chunks to keep
+
+        Returns:
+            list: (chunk_id, trimmed document) tuples
+        """
+        if not hits:
+            return []
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+
+        candidates = self._drop_duplicates(vectors)
+        selected = self._mmr(query_vector, vectors, candidates, n_results)
+        query_terms = _terms(query)
+        return [(hits[i][0], self._trim(hits[i][1], query_terms)) for i in selected]
+
+    def _drop_duplicates(self, vectors):
+        """Indices of hits kept after dropping any hit too similar to a better-ranked one."""
+        kept = []
+        for i in range(len(vectors)):
+            if kept and float(np.max(vectors[kept] @ vectors[i])) >= self.duplicate_threshold:
+                continue
+            kept.append(i)
+        return kept
+
+    def _mmr(self, query_vector, vectors, candidates, n_results):
+        """Maximal marginal relevance selection over the candidate indices."""
+        relevance = vectors @ query_vector
+        selected = []
+        remaining = list(candidates)
+        while remaining and len(selected) < n_results:
+            if selected:
+                redundancy = np.max(vectors[remaining] @ vectors[selected].T, axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            selected.append(remaining.pop(int(np.argmax(scores))))
+        return selected
+
+    def _trim(self, document, query_terms):
+        """
+        Keep the sentences that share terms with the query, best first, in their
+        original order and within max_chars_per_chunk. Chunks that fit are returned
+        unchanged; chunks with no overlapping sentence keep their leading sentences.
+        """
+        if len(document) <= self.max_chars_per_chunk:
+            return document
+        sentences = [s for s in _SENTENCE_SPLIT_RE.split(document) if s.strip()]
+        overlap = [len(_terms(sentence) & query_terms) for sentence in sentences]
+        ranked = sorted((i for i in range(len(sentences)) if overlap[i]), key=lambda i: (-overlap[i], i))
+        if not ranked:
+            ranked = list(range(len(sentences)))
+
+        keep = []
+        length = 0
+        for i in ranked:
+            if keep and length + len(sentences[i]) > self.max_chars_per_chunk:
+                continue
+            keep.append(i)
+            length += len(sentences[i]) + 1
+        return " ".join(sentences[i] for i in sorted(keep))
@@ -1,232 +1,252 @@
 # setup sqlite database
-import sqlite3
-from sqlite3 import Error
+import threading
+from contextlib import contextmanager
 import json
+import os
 
-def create_connection(db_file):
-    """
-    Create a database connection to the SQLite database specified by db_file.
-    :param db_file: Database file path
-    :return: Connection object or None
-    """
-    conn = None
-    try:
-        conn = sqlite3.connect(db_file)
-        print(f"Connected to database: {db_file}")
-    except Error as e:
-        print(f"Error connecting to database: {e}")
-    return conn
+from config import Config
+from utils.chat_archive import ChatArchive
+from utils.compression import ContentCompressor, train_dictionary
+from utils.db_backends import create_backend
+from utils.lexical_index import build_match_query, fts_phrase, query_terms, rank_highlighted
+from utils.migrations import apply_migrations, normalize_topic, searchable_text
+from utils.pagination import decode_cursor, encode_cursor
+from utils import queries
+from utils.read_cache import ReadThroughCache
+
+def _search_results(message_rows, content_rows, score):
+    """Hits of both search queries as API dicts; score turns the backend's rank into higher-is-better."""
+    return {
+        "messages": [
+            {"message_id": row[0], "conversation_id": row[1], "conversation_title": row[2], "type": row[3],
+             "timestamp": row[4], "snippet": row[5], "score": score(row[6])}
+            for row in message_rows
+        ],
+        "content": [
+            {"interact_id": row[0], "content_type": row[1], "project_id": row[2], "created_at": row[3],
+             "snippet": row[4], "score": score(row[5])}
+            for row in content_rows
+        ],
+    }
+
+# Conversations idle for the ? interval with messages still in the hot database
+_ARCHIVABLE_CONDITION = """
+    updated_at < datetime('now', ?) AND (archived_at IS NULL OR archived_at < updated_at)
+    AND EXISTS (SELECT 1 FROM chat_messages m WHERE m.conversation_id = conversations.conversation_id)"""
 
-def create_table(conn, create_table_sql):
+def _commit(conn):
     """
-    Create a table from the create_table_sql statement.
-    :param conn: Connection object
-    :param create_table_sql: CREATE TABLE statement
+    COMMIT the connection's transaction. If the commit itself fails (e.g. SQLite is
+    busy past the timeout) the transaction is rolled back, so the connection is not
+    left inside it for the next write on this thread.
     """
     try:
-        c = conn.cursor()
-        c.execute(create_table_sql)
-        print("Table created successfully")
-    except Error as e:
-        print(f"Error creating table: {e}")
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
 
-def migrate_database(conn):
-    """
-    Add user_id columns to existing tables for user data isolation
-    Also add project_id to conversations if missing
-    """
-    cursor = conn.cursor()
-    
-    # Check if user_id column exists in topics table
-    cursor.execute("PRAGMA table_info(topics)")
-    topics_columns = [col[1] for col in cursor.fetchall()]
-    if 'user_id' not in topics_columns:
-        cursor.execute("ALTER TABLE topics ADD COLUMN user_id TEXT")
-        print("Added user_id column to topics table")
-    
-    # Check if user_id column exists in conversations table
-    cursor.execute("PRAGMA table_info(conversations)")
-    conversations_columns = [col[1] for col in cursor.fetchall()]
-    if 'user_id' not in conversations_columns:
-        cursor.execute("ALTER TABLE conversations ADD COLUMN user_id TEXT")
-        print("Added user_id column to conversations table")
-    
-    # Check if user_id column exists in chat_messages table
-    cursor.execute("PRAGMA table_info(chat_messages)")
-    chat_messages_columns = [col[1] for col in cursor.fetchall()]
-    if 'user_id' not in chat_messages_columns:
-        cursor.execute("ALTER TABLE chat_messages ADD COLUMN user_id TEXT")
-        print("Added user_id column to chat_messages table")
-    
-    # Check if user_id column exists in interactive_content table
-    cursor.execute("PRAGMA table_info(interactive_content)")
-    interactive_content_columns = [col[1] for col in cursor.fetchall()]
-    if 'user_id' not in interactive_content_columns:
-        cursor.execute("ALTER TABLE interactive_content ADD COLUMN user_id TEXT")
-        print("Added user_id column to interactive_content table")
-
-    # Check if project_id column exists in conversations table
-    cursor.execute("PRAGMA table_info(conversations)")
-    conversations_columns = [col[1] for col in cursor.fetchall()]
-    if 'project_id' not in conversations_columns:
-        cursor.execute("ALTER TABLE conversations ADD COLUMN project_id TEXT")
-        print("Added project_id column to conversations table")
-
-def initialize_database(db_file):
-    """
-    Initialize the SQLite database and create necessary tables.
-    :param db_file: Database file path
-    """
-    conn = create_connection(db_file)
-    if conn is not None:
-        # Create topics table - MODIFIED: now uses project_id instead of conversation_id
-        create_topics_table_sql = """
-        CREATE TABLE IF NOT EXISTS topics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project_id TEXT NOT NULL,
-            topics_json TEXT NOT NULL,
-            user_id TEXT,
-            UNIQUE(project_id)
-        );
-        """
-        create_table(conn, create_topics_table_sql)
-        
-        # Create conversations table - now with project_id
-        create_conversations_table_sql = """
-        CREATE TABLE IF NOT EXISTS conversations (
-            conversation_id TEXT PRIMARY KEY,
-            title TEXT,
-            user_id TEXT,
-            project_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_conversations_table_sql)
-        
-        # Create chat_messages table - NEW: proper message storage
-        create_chat_messages_table_sql = """
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id TEXT NOT NULL,
-            message_type TEXT NOT NULL CHECK (message_type IN ('user', 'assistant')),
-            message_content TEXT NOT NULL,
-            user_id TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
-        );
-        """
-        create_table(conn, create_chat_messages_table_sql)
-        
-        # Create interactive_content table
-        create_interactive_content_table_sql = """
-        CREATE TABLE IF NOT EXISTS interactive_content (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            interact_id TEXT NOT NULL,
-            project_id TEXT NOT NULL,
-            content_type TEXT NOT NULL,
-            content_json TEXT NOT NULL,
-            topics_used TEXT NOT NULL,
-            user_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_interactive_content_table_sql)
-        
-        # Create users table - NEW: for authentication
-        create_users_table_sql = """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT,
-            email_verified BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_users_table_sql)
-        
-        # Create projects table
-        create_projects_table_sql = """
-        CREATE TABLE IF NOT EXISTS projects (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_projects_table_sql)
-        
-        # Create sources table
-        create_sources_table_sql = """
-        CREATE TABLE IF NOT EXISTS sources (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            project_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            content TEXT,
-            url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_sources_table_sql)
-        
-        # Create interactive_history table
-        create_interactive_history_table_sql = """
-        CREATE TABLE IF NOT EXISTS interactive_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            project_id TEXT NOT NULL,
-            content_type TEXT NOT NULL,
-            topics TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        create_table(conn, create_interactive_history_table_sql)
-        
-        # Run migration for existing databases
-        migrate_database(conn)
-        
-        conn.commit()
-        conn.close()
-    else:
-        print("Failed to initialize database")
 
 class DatabaseClient:
-    def __init__(self, db_file):
+    """
+    Data access for users, projects, conversations and generated content.
+
+    Storage is a backend from utils.db_backends: a local SQLite file (default) or a
+    shared Postgres database for running several nodes. Statements are written in
+    SQLite's dialect and the Postgres backend translates them.
+
+    Each thread keeps one long-lived connection (WAL mode on SQLite), so readers
+    never block the writer or each other. Writes go through _transaction(), which
+    serializes writers within the process and relies on the database's own locking
+    across processes.
+    """
+    def __init__(self, db_file, archive_file=None, backend=None):
         self.db_file = db_file
-        initialize_database(db_file)
+        self.backend = backend or create_backend(db_file)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        apply_migrations(self._connection())
+        # Postgres compresses large values itself (TOAST), and its TEXT columns cannot hold bytes
+        self._compressor = ContentCompressor(enabled=Config.CONTENT_COMPRESSION and self.backend.name == "sqlite")
+        self._compressor.load(self._connection())
+        # Only invalidations logged after startup matter: nothing is cached yet
+        self._invalidation_seq = self._connection().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations"
+        ).fetchone()[0]
+        self._invalidation_listeners = {}
+        self.cache = ReadThroughCache(poll=self._poll_invalidations)
+        # The archive keeps the SQLite file small; a Postgres database has no such limit
+        self.archive = None
+        if self.backend.name == "sqlite":
+            root, ext = os.path.splitext(db_file)
+            self.archive = ChatArchive(
+                archive_file or f"{root}-archive{ext}", decode=lambda payload: json.loads(self._decompress(payload))
+            )
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.backend.connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Release every thread's connection (back to the pool on Postgres)."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            self.backend.release(conn)
+        self.backend.close()
+        self._local = threading.local()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block as one write transaction and yield a cursor.
+        Commits on success and rolls back if the block raises. Nested inside another
+        transaction on this thread (including group_transaction()), the block runs
+        in a savepoint of the outer transaction instead.
+        """
+        conn = self._connection()
+        if conn.in_transaction:
+            conn.execute("SAVEPOINT write")
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                raise
+            conn.execute("RELEASE write")
+            return
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            _commit(conn)
+
+    @contextmanager
+    def group_transaction(self):
+        """
+        Run several write calls on this thread as one transaction with a single commit.
+        Each write call gets its own savepoint, so a failing call only undoes itself.
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            _commit(conn)
+
+    def _keyset_page(self, page, params, limit, cursor=None):
+        """
+        One page of rows, newest first, by keyset pagination on two sort columns.
+
+        The page starts after the row the cursor was made from, so every page costs an
+        index range scan of limit rows no matter how deep it is.
+        :param page: (select, where, key_columns) as in utils.queries; the select's last
+            two columns are the sort key and where has no keyset bound
+        :param params: Parameters of the WHERE condition
+        :param limit: Rows per page
+        :param cursor: next_cursor of the previous page, or None for the first page
+        :return: (rows, next_cursor); next_cursor is None on the last page
+        """
+        params = list(params)
+        if cursor:
+            params.extend(decode_cursor(cursor))
+        rows = self._connection().execute(
+            queries.keyset_page_sql(*page, after=bool(cursor)), params + [limit + 1]
+        ).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_cursor(rows[-1][-2:])
+        return rows, None
+
+    def _invalidate(self, cursor, namespace, key):
+        """
+        Drop a cache key here and log it for the other workers, in the caller's write
+        transaction so the log entry becomes visible together with the change.
+        """
+        cursor.execute("INSERT INTO cache_invalidations (namespace, cache_key) VALUES (?, ?)", (namespace, key))
+        if cursor.lastrowid % 1000 == 0:
+            cursor.execute("DELETE FROM cache_invalidations WHERE created_at < datetime('now', '-1 day')")
+        self.cache.invalidate(namespace, key)
+
+    def _poll_invalidations(self):
+        """Cache keys invalidated by any worker since the last poll (own writes included)."""
+        rows = self._connection().execute(
+            "SELECT seq, namespace, cache_key FROM cache_invalidations WHERE seq > ? ORDER BY seq",
+            (self._invalidation_seq,)
+        ).fetchall()
+        if rows:
+            self._invalidation_seq = rows[-1][0]
+        for _, namespace, key in rows:
+            for listener in self._invalidation_listeners.get(namespace, ()):
+                listener(key)
+        return [(namespace, key) for _, namespace, key in rows]
+
+    def poll_invalidations(self):
+        """
+        Apply every invalidation other workers have logged since the last poll, to the
+        read cache and the invalidation listeners, without waiting for a cache lookup.
+        """
+        self.cache.poll_invalidations(force=True)
+
+    def add_invalidation_listener(self, namespace, listener):
+        """
+        Call listener(key) whenever a key of the namespace shows up in the invalidation
+        log, for state cached outside the database (e.g. the vector index caches).
+        Runs on the polling thread (a cache lookup or poll_invalidations()), so the
+        listener must be cheap and thread-safe.
+        """
+        self._invalidation_listeners.setdefault(namespace, []).append(listener)
+
+    def log_vector_index_change(self, project_id):
+        """
+        Record that a project's vector index was replaced outside the API (e.g. by a
+        snapshot restore), so every worker drops its cached results for the project.
+        """
+        with self._transaction() as cursor:
+            self._invalidate(cursor, "vector_index", project_id)
+
+    def _decompress(self, value):
+        """Text of a compressed column value (legacy plain text passes through)."""
+        return self._compressor.decompress(value, reload=lambda: self._compressor.load(self._connection()))
 
     # DEPRECATED: Old conversation method - keeping for backward compatibility
     def write_conversation(self, conversation_id, conversation_dict):
         """DEPRECATED: Use write_chat_message instead"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        conversation_json = json.dumps(conversation_dict)
-        cursor.execute(
-            """
-            INSERT INTO conversations (conversation_id, conversation_json)
-            VALUES (?, ?)
-            ON CONFLICT(conversation_id) DO UPDATE SET conversation_json=excluded.conversation_json;
-            """,
-            (conversation_id, conversation_json)
-        )
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            conversation_json = json.dumps(conversation_dict)
+            cursor.execute(
+                """
+                INSERT INTO conversations (conversation_id, conversation_json)
+                VALUES (?, ?)
+                ON CONFLICT(conversation_id) DO UPDATE SET conversation_json=excluded.conversation_json;
+                """,
+                (conversation_id, conversation_json)
+            )
 
     # DEPRECATED: Old conversation method - keeping for backward compatibility
     def read_conversation(self, conversation_id):
         """DEPRECATED: Use read_chat_messages instead"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         cursor.execute(
             "SELECT conversation_json FROM conversations WHERE conversation_id = ?",
             (conversation_id,)
         )
         row = cursor.fetchone()
-        conn.close()
         if row:
             return json.loads(row[0])
         return None
@@ -234,17 +254,18 @@ class DatabaseClient:
     # NEW: Proper conversation management
     def create_conversation(self, conversation_id, title=None, user_id=None, project_id=None):
         """Create a new conversation record"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        with self._transaction() as cursor:
+            self._insert_conversation(cursor, conversation_id, title, user_id, project_id)
+
+    def _insert_conversation(self, cursor, conversation_id, title=None, user_id=None, project_id=None):
         cursor.execute(
             """
-            INSERT OR IGNORE INTO conversations (conversation_id, title, user_id, project_id)
-            VALUES (?, ?, ?, ?);
+            INSERT INTO conversations (conversation_id, title, user_id, project_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(conversation_id) DO NOTHING;
             """,
             (conversation_id, title or f"Conversation {conversation_id[:8]}", user_id, project_id)
         )
-        conn.commit()
-        conn.close()
 
     # NEW: Proper message storage
     def write_chat_message(self, conversation_id, message_type, message_content, user_id=None, project_id=None):
@@ -256,60 +277,53 @@ class DatabaseClient:
         :param user_id: User ID for data isolation
         :param project_id: Project ID for project isolation
         """
-        # Ensure conversation exists
-        self.create_conversation(conversation_id, user_id=user_id, project_id=project_id)
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO chat_messages (conversation_id, message_type, message_content, user_id)
-            VALUES (?, ?, ?, ?);
-            """,
-            (conversation_id, message_type, message_content, user_id)
-        )
-        # Update conversation's updated_at timestamp
-        if user_id:
+        with self._transaction() as cursor:
+            # Ensure conversation exists (same transaction, so one commit per message)
+            self._insert_conversation(cursor, conversation_id, user_id=user_id, project_id=project_id)
             cursor.execute(
                 """
-                UPDATE conversations 
-                SET updated_at = CURRENT_TIMESTAMP 
-                WHERE conversation_id = ? AND user_id = ?;
+                INSERT INTO chat_messages (conversation_id, message_type, message_content, user_id)
+                VALUES (?, ?, ?, ?);
                 """,
-                (conversation_id, user_id)
+                (conversation_id, message_type, message_content, user_id)
             )
-        else:
-            cursor.execute(
-                """
-                UPDATE conversations 
-                SET updated_at = CURRENT_TIMESTAMP 
-                WHERE conversation_id = ?;
-                """,
-                (conversation_id,)
-            )
-        conn.commit()
-        conn.close()
+            # Update conversation's updated_at timestamp
+            if user_id:
+                cursor.execute(
+                    """
+                    UPDATE conversations 
+                    SET updated_at = CURRENT_TIMESTAMP 
+                    WHERE conversation_id = ? AND user_id = ?;
+                    """,
+                    (conversation_id, user_id)
+                )
+            else:
+                cursor.execute(
+                    """
+                    UPDATE conversations 
+                    SET updated_at = CURRENT_TIMESTAMP 
+                    WHERE conversation_id = ?;
+                    """,
+                    (conversation_id,)
+                )
 
     # NEW: Read all messages for a conversation
-    def read_chat_messages(self, conversation_id, user_id=None):
+    def read_chat_messages(self, conversation_id, user_id=None, limit=None):
         """
         Read all chat messages for a conversation in chronological order
         :param conversation_id: Conversation ID
         :param user_id: User ID for data isolation
+        :param limit: Only read the most recent limit messages
         :return: List of messages with type and content
+        Messages of an archived conversation are not read; restore it first with
+        restore_archived_conversation() (AsyncDatabaseClient does so on every read).
         """
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        if limit:
+            return self.read_chat_messages_page(conversation_id, user_id=user_id, limit=limit)["items"]
+        cursor = self._connection().cursor()
         
         if user_id:
-            cursor.execute(
-                """
-                SELECT message_type, message_content, timestamp 
-                FROM chat_messages 
-                WHERE conversation_id = ? AND user_id = ?
-                ORDER BY timestamp ASC;
-                """,
-                (conversation_id, user_id)
-            )
+            cursor.execute(queries.READ_CHAT_MESSAGES, (conversation_id, user_id))
         else:
             cursor.execute(
                 """
@@ -322,7 +336,6 @@ class DatabaseClient:
             )
         
         rows = cursor.fetchall()
-        conn.close()
         
         if rows:
             messages = []
@@ -335,11 +348,29 @@ class DatabaseClient:
             return messages
         return []
 
+    def read_chat_messages_page(self, conversation_id, user_id=None, limit=50, cursor=None):
+        """
+        Read one page of a conversation's messages, starting from the most recent
+        :param conversation_id: Conversation ID
+        :param user_id: User ID for data isolation
+        :param limit: Messages per page
+        :param cursor: next_cursor of the previous page (older messages), or None
+        :return: {"items": messages in chronological order, "next_cursor": cursor or None}
+        Like read_chat_messages(), this does not restore an archived conversation.
+        """
+        if user_id:
+            page, params = queries.CHAT_MESSAGES_PAGE, [conversation_id, user_id]
+        else:
+            select, _, key_columns = queries.CHAT_MESSAGES_PAGE
+            page, params = (select, "conversation_id = ?", key_columns), [conversation_id]
+        rows, next_cursor = self._keyset_page(page, params, limit, cursor)
+        messages = [{"type": row[0], "content": row[1], "timestamp": row[2]} for row in reversed(rows)]
+        return {"items": messages, "next_cursor": next_cursor}
+
     # NEW: Get conversation info
     def get_conversation_info(self, conversation_id, user_id=None):
         """Get conversation metadata"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         
         if user_id:
             cursor.execute(
@@ -361,7 +392,6 @@ class DatabaseClient:
             )
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -375,24 +405,45 @@ class DatabaseClient:
     # MODIFIED: Topics methods now work with project_id instead of conversation_id
     def write_topics(self, project_id, topics_list, user_id=None):
         """
-        Write topics for a project
+        Replace the topics of a project
         :param project_id: Project ID
         :param topics_list: List of topics
         :param user_id: User ID for data isolation
         """
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        topics_json = json.dumps(topics_list)
-        cursor.execute(
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM project_topics WHERE project_id = ?", (project_id,))
+            self._add_project_topics(cursor, project_id, topics_list, user_id)
+            self._invalidate(cursor, "topics", project_id)
+
+    def add_project_topics(self, project_id, topics, user_id=None):
+        """
+        Add the topics of newly indexed chunks to a project
+        Topics the project already has only get their chunk counts raised, so concurrent
+        uploads to the same project never overwrite each other's topics.
+        :param project_id: Project ID
+        :param topics: Topic of each new chunk (repeats count as more chunks)
+        :param user_id: User ID for data isolation
+        """
+        with self._transaction() as cursor:
+            self._add_project_topics(cursor, project_id, topics, user_id)
+            self._invalidate(cursor, "topics", project_id)
+
+    def _add_project_topics(self, cursor, project_id, topics, user_id):
+        counts = {}
+        for topic in topics:
+            if topic and topic.strip():
+                key = normalize_topic(topic)
+                spelling, count = counts.get(key, (topic.strip(), 0))
+                counts[key] = (spelling, count + 1)
+        cursor.executemany(
             """
-            INSERT INTO topics (project_id, topics_json, user_id)
-            VALUES (?, ?, ?)
-            ON CONFLICT(project_id) DO UPDATE SET topics_json=excluded.topics_json, user_id=excluded.user_id;
+            INSERT INTO project_topics (project_id, user_id, normalized_topic, topic, chunk_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(project_id, normalized_topic)
+            DO UPDATE SET chunk_count = project_topics.chunk_count + excluded.chunk_count;
             """,
-            (project_id, topics_json, user_id)
+            [(project_id, user_id, key, spelling, count) for key, (spelling, count) in counts.items()]
         )
-        conn.commit()
-        conn.close()
 
     def read_topics(self, conversation_id, user_id=None):
         """
@@ -400,8 +451,7 @@ class DatabaseClient:
         Read topics for a conversation (legacy method)
         """
         # Get project_id from conversation
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         
         if user_id:
             cursor.execute(
@@ -415,7 +465,6 @@ class DatabaseClient:
             )
         
         row = cursor.fetchone()
-        conn.close()
         
         if row and row[0]:
             return self.read_project_topics(row[0], user_id)
@@ -423,79 +472,84 @@ class DatabaseClient:
 
     def read_project_topics(self, project_id, user_id=None):
         """
-        Read topics for a project
+        Read topics for a project, in the order they were first added
         :param project_id: Project ID
         :param user_id: User ID for data isolation
         :return: List of topics or None
         """
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        
+        return [row["topic"] for row in self.read_project_topic_counts(project_id, user_id)] or None
+
+    def read_project_topic_counts(self, project_id, user_id=None):
+        """
+        Read topics for a project with the number of chunks indexed under each
+        :return: List of {"topic", "chunk_count"} in the order topics were first added
+        """
+        return self.cache.get_or_load(
+            "topics", project_id, lambda: self._load_project_topic_counts(project_id, user_id), variant=user_id
+        )
+
+    def _load_project_topic_counts(self, project_id, user_id):
+        cursor = self._connection().cursor()
         if user_id:
-            cursor.execute(
-                "SELECT topics_json FROM topics WHERE project_id = ? AND user_id = ?",
-                (project_id, user_id)
-            )
+            cursor.execute(queries.PROJECT_TOPIC_COUNTS, (project_id, user_id))
         else:
             cursor.execute(
-                "SELECT topics_json FROM topics WHERE project_id = ?",
+                "SELECT topic, chunk_count FROM project_topics WHERE project_id = ? ORDER BY id",
                 (project_id,)
             )
-        
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return json.loads(row[0])
-        return None
+        return [{"topic": row[0], "chunk_count": row[1]} for row in cursor.fetchall()]
 
     def write_interactive_content(self, interact_id, project_id, content_type, content_json, topics_used, user_id=None):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        content_json_str = json.dumps(content_json)
-        topics_used_str = json.dumps(topics_used)
-        cursor.execute(
-            """
-            INSERT INTO interactive_content (interact_id, project_id, content_type, content_json, topics_used, user_id)
-            VALUES (?, ?, ?, ?, ?, ?);
-            """,
-            (interact_id, project_id, content_type, content_json_str, topics_used_str, user_id)
-        )
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            content_json_str = self._compressor.compress(content_type, json.dumps(content_json))
+            topics_used_str = json.dumps(topics_used)
+            cursor.execute(
+                """
+                INSERT INTO interactive_content (interact_id, project_id, content_type, content_json, topics_used, user_id)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                (interact_id, project_id, content_type, content_json_str, topics_used_str, user_id)
+            )
+            if self.backend.name == "sqlite":
+                cursor.execute(
+                    """
+                    INSERT INTO interactive_content_fts (rowid, body, user_id, project_id, interact_id, content_type)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                    """,
+                    (cursor.lastrowid, searchable_text(content_json), user_id, project_id, interact_id, content_type)
+                )
 
-    def write_interactive_history(self, user_id, project_id, content_type, topics):
+    def write_interactive_history(self, user_id, project_id, content_type, topics, interact_id=None):
         """Insert a new interactive history record for a user and project."""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO interactive_history (user_id, project_id, content_type, topics)
-            VALUES (?, ?, ?, ?);
-            """,
-            (user_id, project_id, content_type, json.dumps(topics))
-        )
-        # Get the ID of the inserted row
-        cursor.execute("SELECT last_insert_rowid()")
-        last_id = cursor.fetchone()[0]
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO interactive_history (user_id, project_id, content_type, topics, interact_id)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                (user_id, project_id, content_type, json.dumps(topics), interact_id)
+            )
+            # Get the ID of the inserted row
+            last_id = cursor.lastrowid
         return last_id
 
+    def write_interactive(self, interact_id, project_id, content_type, content_json, topics, user_id):
+        """
+        Store generated interactive content and its history record in one transaction.
+        The history row references the content by interact_id.
+        :return: ID of the history record
+        """
+        with self._transaction():
+            self.write_interactive_content(interact_id, project_id, content_type, content_json, topics, user_id=user_id)
+            return self.write_interactive_history(user_id, project_id, content_type, topics, interact_id=interact_id)
+
     def read_interactive_content(self, interact_id, user_id=None):
         print(f"📖 Reading interactive content for interact_id: {interact_id}, user_id: {user_id}")
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         
         if user_id:
             print(f"🔍 Querying with user_id filter")
-            cursor.execute(
-                """
-                SELECT content_type, content_json, topics_used, created_at 
-                FROM interactive_content 
-                WHERE interact_id = ? AND user_id = ?
-                """,
-                (str(interact_id), user_id)
-            )
+            cursor.execute(queries.READ_INTERACTIVE_CONTENT, (str(interact_id), user_id))
         else:
             print(f"🔍 Querying without user_id filter")
             cursor.execute(
@@ -508,13 +562,12 @@ class DatabaseClient:
             )
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             print(f"✅ Found interactive content of type: {row[0]}")
             return {
                 "content_type": row[0],
-                "content_json": json.loads(row[1]),
+                "content_json": json.loads(self._decompress(row[1])),
                 "topics_used": json.loads(row[2]),
                 "created_at": row[3]
             }
@@ -524,33 +577,32 @@ class DatabaseClient:
     # NEW: User management methods
     def create_or_update_user(self, user_id, email, name=None, email_verified=False):
         """Create or update user record"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO users (user_id, email, name, email_verified, last_login)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id) DO UPDATE SET 
-                email=excluded.email,
-                name=excluded.name,
-                email_verified=excluded.email_verified,
-                last_login=CURRENT_TIMESTAMP;
-            """,
-            (user_id, email, name, email_verified)
-        )
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO users (user_id, email, name, email_verified, last_login)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET 
+                    email=excluded.email,
+                    name=excluded.name,
+                    email_verified=excluded.email_verified,
+                    last_login=CURRENT_TIMESTAMP;
+                """,
+                (user_id, email, name, email_verified)
+            )
+            self._invalidate(cursor, "user", user_id)
 
     def get_user(self, user_id):
         """Get user information"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        return self.cache.get_or_load("user", user_id, lambda: self._load_user(user_id))
+
+    def _load_user(self, user_id):
+        cursor = self._connection().cursor()
         cursor.execute(
             "SELECT user_id, email, name, email_verified, created_at, last_login FROM users WHERE user_id = ?",
             (user_id,)
         )
         row = cursor.fetchone()
-        conn.close()
         if row:
             return {
                 "user_id": row[0],
@@ -564,14 +616,12 @@ class DatabaseClient:
 
     def get_user_by_email(self, email):
         """Get user information by email address"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         cursor.execute(
             "SELECT user_id, email, name, email_verified, created_at, last_login FROM users WHERE email = ?",
             (email,)
         )
         row = cursor.fetchone()
-        conn.close()
         if row:
             return {
                 "user_id": row[0],
@@ -585,30 +635,12 @@ class DatabaseClient:
 
     def get_user_conversations(self, user_id, project_id=None):
         """Get all conversations for a user and project"""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._connection().cursor()
         if project_id:
-            cursor.execute(
-                """
-                SELECT conversation_id, title, created_at, updated_at 
-                FROM conversations 
-                WHERE user_id = ? AND project_id = ?
-                ORDER BY updated_at DESC;
-                """,
-                (user_id, project_id)
-            )
+            cursor.execute(queries.USER_CONVERSATIONS, (user_id, project_id))
         else:
-            cursor.execute(
-                """
-                SELECT conversation_id, title, created_at, updated_at 
-                FROM conversations 
-                WHERE user_id = ?
-                ORDER BY updated_at DESC;
-                """,
-                (user_id,)
-            )
+            cursor.execute(queries.USER_CONVERSATIONS_ALL_PROJECTS, (user_id,))
         rows = cursor.fetchall()
-        conn.close()
         conversations = []
         for row in rows:
             conversations.append({
@@ -619,31 +651,46 @@ class DatabaseClient:
             })
         return conversations
 
+    def get_user_conversations_page(self, user_id, project_id=None, limit=50, cursor=None):
+        """
+        Get one page of a user's conversations, most recently updated first
+        The keyset is (updated_at, rowid) and updated_at moves when a message is added,
+        so a conversation updated while a client pages through the list jumps to the
+        front: a later page skips it, and one updated from above the cursor to below
+        it is returned twice. Clients should de-duplicate by id and reload from the
+        first page to see recent activity.
+        :return: {"items": conversations, "next_cursor": cursor or None}
+        """
+        if project_id:
+            page, params = queries.USER_CONVERSATIONS_PAGE, [user_id, project_id]
+        else:
+            page, params = queries.USER_CONVERSATIONS_ALL_PROJECTS_PAGE, [user_id]
+        rows, next_cursor = self._keyset_page(page, params, limit, cursor)
+        conversations = [
+            {"id": row[0], "title": row[1], "created_at": row[2], "updated_at": row[3]} for row in rows
+        ]
+        return {"items": conversations, "next_cursor": next_cursor}
+
     def create_project(self, project_id, user_id, name):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO projects (id, user_id, name)
-            VALUES (?, ?, ?)
-            ON CONFLICT(id) DO NOTHING;
-            """,
-            (project_id, user_id, name)
-        )
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO projects (id, user_id, name)
+                VALUES (?, ?, ?)
+                ON CONFLICT(id) DO NOTHING;
+                """,
+                (project_id, user_id, name)
+            )
+            self._invalidate(cursor, "projects", user_id)
+            self._invalidate(cursor, "project", project_id)
 
     def list_projects(self, user_id):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, name, created_at, last_accessed_at FROM projects WHERE user_id = ? ORDER BY last_accessed_at DESC;
-            """,
-            (user_id,)
-        )
+        return self.cache.get_or_load("projects", user_id, lambda: self._load_projects(user_id))
+
+    def _load_projects(self, user_id):
+        cursor = self._connection().cursor()
+        cursor.execute(queries.LIST_PROJECTS, (user_id,))
         rows = cursor.fetchall()
-        conn.close()
         projects = []
         for row in rows:
             projects.append({
@@ -655,16 +702,14 @@ class DatabaseClient:
         return projects
 
     def get_project(self, project_id, user_id):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, name, created_at, last_accessed_at FROM projects WHERE id = ? AND user_id = ?;
-            """,
-            (project_id, user_id)
+        return self.cache.get_or_load(
+            "project", project_id, lambda: self._load_project(project_id, user_id), variant=user_id
         )
+
+    def _load_project(self, project_id, user_id):
+        cursor = self._connection().cursor()
+        cursor.execute(queries.GET_PROJECT, (project_id, user_id))
         row = cursor.fetchone()
-        conn.close()
         if row:
             return {
                 "id": row[0],
@@ -675,30 +720,20 @@ class DatabaseClient:
         return None
 
     def write_source(self, source_id, user_id, project_id, name, type_, content=None, url=None):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO sources (id, user_id, project_id, name, type, content, url)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET name=excluded.name, type=excluded.type, content=excluded.content, url=excluded.url;
-            """,
-            (source_id, user_id, project_id, name, type_, content, url)
-        )
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO sources (id, user_id, project_id, name, type, content, url)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET name=excluded.name, type=excluded.type, content=excluded.content, url=excluded.url;
+                """,
+                (source_id, user_id, project_id, name, type_, self._compressor.compress("source", content), url)
+            )
 
     def list_sources(self, user_id, project_id):
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, name, type, created_at FROM sources WHERE user_id = ? AND project_id = ? ORDER BY created_at DESC;
-            """,
-            (user_id, project_id)
-        )
+        cursor = self._connection().cursor()
+        cursor.execute(queries.LIST_SOURCES, (user_id, project_id))
         rows = cursor.fetchall()
-        conn.close()
         sources = []
         for row in rows:
             sources.append({
@@ -709,27 +744,20 @@ class DatabaseClient:
             })
         return sources
 
+    def list_sources_page(self, user_id, project_id, limit=50, cursor=None):
+        """
+        List one page of a project's sources, newest first
+        :return: {"items": sources, "next_cursor": cursor or None}
+        """
+        rows, next_cursor = self._keyset_page(queries.SOURCES_PAGE, [user_id, project_id], limit, cursor)
+        sources = [{"id": row[0], "name": row[1], "type": row[2], "created_at": row[3]} for row in rows]
+        return {"items": sources, "next_cursor": next_cursor}
+
     def read_interactive_history(self, user_id, project_id, limit=10):
         """Fetch the most recent interactive history records for a user and project (default 10)."""
-        conn = create_connection(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT h.id, h.content_type, h.topics, h.created_at, c.interact_id
-            FROM interactive_history h
-            LEFT JOIN interactive_content c ON 
-                c.project_id = h.project_id AND 
-                c.content_type = h.content_type AND 
-                c.user_id = h.user_id AND
-                c.created_at = h.created_at
-            WHERE h.user_id = ? AND h.project_id = ?
-            ORDER BY h.created_at DESC
-            LIMIT ?
-            """,
-            (user_id, project_id, limit)
-        )
+        cursor = self._connection().cursor()
+        cursor.execute(queries.READ_INTERACTIVE_HISTORY, (user_id, project_id, limit))
         rows = cursor.fetchall()
-        conn.close()
         history = []
         for row in rows:
             history.append({
@@ -740,4 +768,406 @@ class DatabaseClient:
                 "interact_id": row[4]
             })
         return history
-    
\ No newline at end of file
+
+    def read_interactive_history_page(self, user_id, project_id, limit=10, cursor=None):
+        """
+        Fetch one page of interactive history records for a user and project, newest first
+        :return: {"items": history records, "next_cursor": cursor or None}
+        """
+        rows, next_cursor = self._keyset_page(
+            queries.INTERACTIVE_HISTORY_PAGE, [user_id, project_id], limit, cursor
+        )
+        history = [
+            {"id": row[0], "content_type": row[1], "topics": json.loads(row[2]), "created_at": row[4], "interact_id": row[3]}
+            for row in rows
+        ]
+        return {"items": history, "next_cursor": next_cursor}
+
+    def search_history(self, user_id, query, project_id=None, limit=20):
+        """
+        Full-text search over a user's chat messages and generated interactive content
+        Terms are OR-ed and hits ranked by BM25 (ts_rank on Postgres), best first;
+        snippets mark matched terms with **. On SQLite the SEARCH_MAX_CANDIDATES newest
+        matches of each kind are ranked, with BM25 statistics taken from the user's own
+        history (see rank_highlighted()), so the cost does not grow with other users' data.
+        Messages of archived conversations are searched in the archive's own index and
+        ranked together with the others; archived_conversations counts the archived
+        conversations in scope.
+        :param user_id: User whose history is searched
+        :param query: Free text
+        :param project_id: Only search this project
+        :param limit: Maximum hits of each kind
+        :return: {"messages": [...], "content": [...], "archived_conversations": int},
+                 each hit with a score (higher is better)
+        """
+        if self.backend.name != "sqlite":
+            results = self._search_history_postgres(user_id, query, project_id, limit)
+        else:
+            results = self._search_history_sqlite(user_id, query, project_id, limit)
+        sql = "SELECT COUNT(*) FROM conversations WHERE user_id = ? AND archived_at IS NOT NULL"
+        params = [user_id]
+        if project_id:
+            sql += " AND project_id = ?"
+            params.append(project_id)
+        results["archived_conversations"] = self._connection().execute(sql, params).fetchone()[0]
+        return results
+
+    def _search_history_sqlite(self, user_id, query, project_id, limit):
+        terms = build_match_query(query, skip_stopwords=True)
+        if not terms:
+            return {"messages": [], "content": []}
+        scope = f'user_id : "{fts_phrase(user_id)}"'
+        if project_id:
+            content_scope = f'{scope} AND project_id : "{fts_phrase(project_id)}"'
+        else:
+            content_scope = scope
+        message_match = f"{scope} AND message_content : ({terms})"
+        content_match = f"{content_scope} AND body : ({terms})"
+        candidates = Config.SEARCH_MAX_CANDIDATES
+        conn = self._connection()
+
+        # Newest matches with their matched tokens marked, ranked here rather than with bm25()
+        # user_id is matched inside the index; the exact comparisons guard against tokenizer case folding
+        sql = """
+            SELECT m.id, highlight(chat_messages_fts, 0, char(1), char(2))
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            JOIN conversations c ON c.conversation_id = m.conversation_id
+            WHERE chat_messages_fts MATCH ? AND m.user_id = ?
+        """
+        params = [message_match, user_id]
+        if project_id:
+            sql += " AND c.project_id = ?"
+            params.append(project_id)
+        sql += " ORDER BY chat_messages_fts.rowid DESC LIMIT ?"
+        matches = conn.execute(sql, params + [candidates]).fetchall()
+        total = conn.execute(
+            "SELECT COUNT(*) FROM chat_messages_fts WHERE chat_messages_fts MATCH ?", (scope,)
+        ).fetchone()[0]
+        archived_titles = self._archived_titles(user_id, project_id) if self.archive is not None else {}
+        archived_matches = []
+        if archived_titles:
+            # The archive keeps a restored conversation's rows, which are then also found above
+            archived_matches, archived_total = self.archive.search(message_match, user_id, candidates)
+            archived_matches = [(row[0], row[2]) for row in archived_matches if row[1] in archived_titles]
+            total += archived_total
+        ranked = rank_highlighted(matches + archived_matches, total)[:limit]
+        archived_ids = {message_id for message_id, _ in archived_matches}
+        message_rows = self._search_hits(
+            conn, [hit for hit in ranked if hit[0] not in archived_ids],
+            """
+            SELECT m.id, m.id, m.conversation_id, c.title, m.message_type, m.timestamp,
+                   snippet(chat_messages_fts, 0, '**', '**', '…', 16)
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            JOIN conversations c ON c.conversation_id = m.conversation_id
+            WHERE chat_messages_fts MATCH ? AND chat_messages_fts.rowid IN ({})
+            """,
+            message_match
+        )
+        if archived_ids:
+            position = {message_id: i for i, (message_id, _) in enumerate(ranked)}
+            scores = dict(ranked)
+            archived_hits = self.archive.hits(message_match, [hit[0] for hit in ranked if hit[0] in archived_ids])
+            message_rows += [
+                (message_id, conversation_id, archived_titles[conversation_id], message_type, timestamp, snippet,
+                 scores[message_id])
+                for message_id, (conversation_id, message_type, timestamp, snippet) in archived_hits.items()
+            ]
+            message_rows.sort(key=lambda row: position[row[0]])
+
+        rows = conn.execute(
+            """
+            SELECT rowid, highlight(interactive_content_fts, 0, char(1), char(2))
+            FROM interactive_content_fts
+            WHERE interactive_content_fts MATCH ? AND user_id = ? AND (? IS NULL OR project_id = ?)
+            ORDER BY rowid DESC LIMIT ?
+            """,
+            (content_match, user_id, project_id, project_id, candidates)
+        ).fetchall()
+        total = conn.execute(
+            "SELECT COUNT(*) FROM interactive_content_fts WHERE interactive_content_fts MATCH ?", (content_scope,)
+        )
+        content_rows = self._search_hits(
+            conn, rank_highlighted(rows, total.fetchone()[0])[:limit],
+            """
+            SELECT f.rowid, f.interact_id, f.content_type, f.project_id, c.created_at,
+                   snippet(interactive_content_fts, 0, '**', '**', '…', 16)
+            FROM interactive_content_fts f
+            JOIN interactive_content c ON c.id = f.rowid
+            WHERE interactive_content_fts MATCH ? AND f.rowid IN ({})
+            """,
+            content_match
+        )
+        return _search_results(message_rows, content_rows, lambda score: score)
+
+    def _archived_titles(self, user_id, project_id):
+        """conversation_id -> title of the user's archived conversations (in one project if given)."""
+        sql = "SELECT conversation_id, title FROM conversations WHERE user_id = ? AND archived_at IS NOT NULL"
+        params = [user_id]
+        if project_id:
+            sql += " AND project_id = ?"
+            params.append(project_id)
+        return dict(self._connection().execute(sql, params).fetchall())
+
+    @staticmethod
+    def _search_hits(conn, ranked, sql, match):
+        """
+        Rows of the ranked (rowid, score) hits, in rank order: sql selects the rowid then the
+        hit's columns for a MATCH and a rowid IN list; the score is appended to each row.
+        """
+        if not ranked:
+            return []
+        scores = dict(ranked)
+        position = {rowid: i for i, (rowid, _) in enumerate(ranked)}
+        rows = conn.execute(sql.format(", ".join("?" * len(ranked))), [match, *scores]).fetchall()
+        rows.sort(key=lambda row: position[row[0]])
+        return [(*row[1:], scores[row[0]]) for row in rows]
+
+    def _search_history_postgres(self, user_id, query, project_id, limit):
+        terms = query_terms(query)
+        if not terms:
+            return {"messages": [], "content": []}
+        ts_query = " | ".join(terms)
+        headline = "'StartSel=**, StopSel=**, MaxWords=16, MinWords=6, MaxFragments=1'"
+        conn = self._connection()
+        sql = f"""
+            SELECT m.id, m.conversation_id, c.title, m.message_type, m.timestamp,
+                   ts_headline('english', m.message_content, to_tsquery('english', ?), {headline}),
+                   ts_rank(to_tsvector('english', m.message_content), to_tsquery('english', ?)) AS score
+            FROM chat_messages m
+            JOIN conversations c ON c.conversation_id = m.conversation_id
+            WHERE to_tsvector('english', m.message_content) @@ to_tsquery('english', ?) AND m.user_id = ?
+        """
+        params = [ts_query, ts_query, ts_query, user_id]
+        if project_id:
+            sql += " AND c.project_id = ?"
+            params.append(project_id)
+        message_rows = conn.execute(sql + " ORDER BY score DESC LIMIT ?", params + [limit]).fetchall()
+
+        sql = f"""
+            SELECT interact_id, content_type, project_id, created_at,
+                   ts_headline('english', content_json, to_tsquery('english', ?), {headline}),
+                   ts_rank(to_tsvector('english', content_json), to_tsquery('english', ?)) AS score
+            FROM interactive_content
+            WHERE to_tsvector('english', content_json) @@ to_tsquery('english', ?) AND user_id = ?
+        """
+        params = [ts_query, ts_query, ts_query, user_id]
+        if project_id:
+            sql += " AND project_id = ?"
+            params.append(project_id)
+        content_rows = conn.execute(sql + " ORDER BY score DESC LIMIT ?", params + [limit]).fetchall()
+        return _search_results(message_rows, content_rows, lambda rank: rank)
+
+    def train_compression_dictionaries(self, samples=500):
+        """
+        Train a new compression dictionary per content type from recently stored values.
+        New writes use the new dictionaries; existing values keep theirs until recompressed.
+        :param samples: Values sampled per content type
+        :return: {content_type: dictionary size in bytes}
+        """
+        sources = {
+            content_type: (
+                "SELECT content_json FROM interactive_content WHERE content_type = ? ORDER BY id DESC LIMIT ?",
+                (content_type, samples)
+            )
+            for (content_type,) in self._connection().execute("SELECT DISTINCT content_type FROM interactive_content")
+        }
+        sources["source"] = ("SELECT content FROM sources WHERE content IS NOT NULL ORDER BY rowid DESC LIMIT ?", (samples,))
+        trained = {}
+        for content_type, (query, params) in sources.items():
+            values = [self._decompress(row[0]) for row in self._connection().execute(query, params)]
+            dictionary = train_dictionary(values)
+            if not dictionary:
+                continue
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO compression_dictionaries (content_type, dictionary, sample_count) VALUES (?, ?, ?)",
+                    (content_type, dictionary, len(values))
+                )
+            trained[content_type] = len(dictionary)
+        self._compressor.load(self._connection())
+        return trained
+
+    def recompress_content(self, batch_size=500):
+        """
+        Rewrite stored interactive content and source text that is uncompressed or uses
+        an older dictionary than its content type's current one, in small transactions.
+        :return: Number of rewritten values
+        """
+        rewritten = 0
+        tables = [
+            ("interactive_content", "id", "content_json", "content_type"),
+            ("sources", "rowid", "content", "'source'"),
+        ]
+        for table, key, column, content_type in tables:
+            last_key = 0
+            while True:
+                rows = self._connection().execute(
+                    f"SELECT {key}, {content_type}, {column} FROM {table} "
+                    f"WHERE {key} > ? AND {column} IS NOT NULL ORDER BY {key} LIMIT ?",
+                    (last_key, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                last_key = rows[-1][0]
+                updates = []
+                for row_key, row_type, value in rows:
+                    if self._compressor.stored_dictionary(value) != self._compressor.current_dictionary(row_type):
+                        updates.append((self._compressor.compress(row_type, self._decompress(value)), row_key))
+                if updates:
+                    with self._transaction() as cursor:
+                        cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE {key} = ?", updates)
+                    rewritten += len(updates)
+        return rewritten
+
+    def vacuum(self):
+        """Rebuild the database file to release free pages, and checkpoint the WAL into it."""
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("VACUUM")
+            if self.backend.name == "sqlite":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def archive_inactive_conversations(self, older_than_days=Config.ARCHIVE_AFTER_DAYS, max_conversations=500):
+        """
+        Move the messages of conversations not updated for older_than_days into the
+        archive database, one conversation per transaction. Conversations without
+        messages in the hot database have nothing to move and are skipped.
+        :param older_than_days: Inactivity before a conversation is archived
+        :param max_conversations: Conversations archived per call
+        :return: Counts, bytes of message text moved, archive size, and the bytes this
+                 call freed for reuse in the hot database file
+        """
+        before = self.storage_bytes()
+        report = {"conversations": 0, "messages": 0, "content_bytes": 0}
+        for conversation_id in self.list_archivable_conversations(older_than_days, max_conversations):
+            moved = self.archive_conversation(conversation_id, older_than_days)
+            if moved is not None:
+                report["conversations"] += 1
+                report["messages"] += moved["messages"]
+                report["content_bytes"] += moved["content_bytes"]
+        report.update(self.archival_storage_report(before))
+        if report["conversations"]:
+            print(f"Archived {report['messages']} messages of {report['conversations']} conversations")
+        return report
+
+    def list_archivable_conversations(self, older_than_days=Config.ARCHIVE_AFTER_DAYS, limit=500):
+        """
+        Conversations not updated for older_than_days with messages left to archive, oldest first
+        :param older_than_days: Inactivity before a conversation is archived
+        :param limit: Maximum number of conversation ids returned
+        :return: List of conversation ids (empty without an archive database)
+        """
+        if self.archive is None:
+            return []
+        rows = self._connection().execute(
+            f"""
+            SELECT conversation_id FROM conversations
+            WHERE {_ARCHIVABLE_CONDITION}
+            ORDER BY updated_at LIMIT ?;
+            """,
+            (f"-{older_than_days} days", limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def archive_conversation(self, conversation_id, older_than_days=Config.ARCHIVE_AFTER_DAYS):
+        """
+        Move one conversation's messages into the archive database in a single short
+        transaction. The conversation is checked again inside it, so one that received
+        a message since it was listed stays where it is.
+        :param conversation_id: Conversation ID
+        :param older_than_days: Inactivity before a conversation is archived
+        :return: {"messages": int, "content_bytes": int}, or None if it was not archived
+        """
+        if self.archive is None:
+            return None
+        with self._transaction() as cursor:
+            still_inactive = cursor.execute(
+                f"SELECT 1 FROM conversations WHERE conversation_id = ? AND {_ARCHIVABLE_CONDITION}",
+                (conversation_id, f"-{older_than_days} days")
+            ).fetchone()
+            if still_inactive is None:
+                return None
+            rows = [list(row) for row in cursor.execute(
+                """
+                SELECT id, message_type, message_content, user_id, timestamp FROM chat_messages
+                WHERE conversation_id = ? ORDER BY timestamp, id;
+                """,
+                (conversation_id,)
+            )]
+            moved = {"messages": len(rows), "content_bytes": sum(len(row[2].encode("utf-8")) for row in rows)}
+            # Messages written after an earlier archival are merged with the archived ones
+            archived = self.archive.get(conversation_id)
+            if archived is not None:
+                hot_ids = {row[0] for row in rows}
+                rows = sorted(
+                    [row for row in json.loads(self._decompress(archived)) if row[0] not in hot_ids] + rows,
+                    key=lambda row: (row[4], row[0])
+                )
+            if rows:
+                # Archive first: if this transaction fails, the messages are still in both places
+                self.archive.put(
+                    conversation_id, rows[0][3], rows,
+                    self._compressor.compress("chat_archive", json.dumps(rows))
+                )
+                cursor.execute("DELETE FROM chat_messages WHERE conversation_id = ?", (conversation_id,))
+            cursor.execute(
+                "UPDATE conversations SET archived_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+        return moved
+
+    def storage_bytes(self):
+        """
+        Size of the archive database and bytes of free pages in the hot database file
+        (reused by later writes, or returned to the file system by vacuum())
+        :return: {"archive_bytes": int, "free_bytes": int}, zeros without an archive database
+        """
+        if self.archive is None:
+            return {"archive_bytes": 0, "free_bytes": 0}
+        conn = self._connection()
+        return {
+            "archive_bytes": self.archive.size(),
+            "free_bytes": conn.execute("PRAGMA freelist_count").fetchone()[0]
+                          * conn.execute("PRAGMA page_size").fetchone()[0],
+        }
+
+    def archival_storage_report(self, before):
+        """
+        Storage part of an archival report, given storage_bytes() from before the run
+        :return: {"archive_bytes": archive size now, "freed_bytes": free pages this run added}
+        """
+        after = self.storage_bytes()
+        # Writes landing during the run may reuse some of the pages it freed
+        return {"archive_bytes": after["archive_bytes"], "freed_bytes": max(0, after["free_bytes"] - before["free_bytes"])}
+
+    def is_archived(self, conversation_id):
+        """Whether a conversation's messages are in the archive database."""
+        row = self._connection().execute(
+            "SELECT archived_at FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return bool(row and row[0] is not None)
+
+    def restore_archived_conversation(self, conversation_id):
+        """
+        Bring an archived conversation's messages back into chat_messages so they can be read
+        :param conversation_id: Conversation ID
+        :return: True if the conversation was archived
+        """
+        if not self.is_archived(conversation_id):
+            return False
+        with self._transaction() as cursor:
+            # Read under the write lock so a concurrent archival cannot swap the payload underneath
+            payload = self.archive.get(conversation_id)
+            if payload is not None:
+                cursor.executemany(
+                    """
+                    INSERT OR IGNORE INTO chat_messages (id, conversation_id, message_type, message_content, user_id, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                    """,
+                    [(row[0], conversation_id, row[1], row[2], row[3], row[4])
+                     for row in json.loads(self._decompress(payload))]
+                )
+            cursor.execute("UPDATE conversations SET archived_at = NULL WHERE conversation_id = ?", (conversation_id,))
+        return True
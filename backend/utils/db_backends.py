@@ -0,0 +1,186 @@
+import re
+import sqlite3
+from functools import lru_cache
+
+from config import Config
+
+try:
+    import psycopg
+    from psycopg.types.string import TextLoader
+    from psycopg_pool import ConnectionPool
+except ImportError:  # only needed with DATABASE_BACKEND=postgres
+    psycopg = None
+
+
+def create_backend(db_file):
+    """Storage backend selected by Config.DATABASE_BACKEND; db_file is only used by SQLite."""
+    if Config.DATABASE_BACKEND == "postgres":
+        return PostgresBackend(Config.DATABASE_URL)
+    return SQLiteBackend(db_file)
+
+
+class SQLiteBackend:
+    """
+    One SQLite file on local disk. Connections are opened per thread by the caller
+    and tuned for a single host: WAL, a large page cache and memory-mapped reads.
+    """
+    name = "sqlite"
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        conn = sqlite3.connect(db_file)
+        # journal_mode is persistent, so setting it once for the file is enough
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+        print(f"Connected to database: {db_file}")
+
+    def connect(self):
+        """Open a tuned connection in autocommit mode: reads take no transaction, writes open one explicitly."""
+        conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {Config.SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA synchronous = {Config.SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{Config.SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {Config.SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def release(self, conn):
+        conn.close()
+
+    def close(self):
+        pass
+
+
+# psycopg takes %s placeholders and needs every literal % (even inside quotes) doubled
+_LITERAL_OR_PLACEHOLDER_RE = re.compile(r"'(?:[^']|'')*'|\?|%")
+_CREATE_TABLE_RE = re.compile(r"^CREATE TABLE IF NOT EXISTS \w+\s*\(", re.IGNORECASE)
+
+
+def _placeholder(match):
+    token = match.group(0)
+    if token == "?":
+        return "%s"
+    if token == "%":
+        return "%%"
+    return token.replace("%", "%%")
+
+
+@lru_cache(maxsize=1024)
+def translate_sql(sql: str) -> str:
+    """
+    Postgres form of a statement written for SQLite, as used by DatabaseClient and
+    the migrations. Only the constructs those use are rewritten:
+
+    - ? placeholders, BEGIN IMMEDIATE and INSERT OR IGNORE
+    - INTEGER PRIMARY KEY AUTOINCREMENT and BLOB column types
+    - datetime('now', modifier) and julianday(column)
+    - rowid: tables without an AUTOINCREMENT key get an explicit rowid column
+    """
+    sql = sql.strip().rstrip(";").strip()
+    if sql.upper() == "BEGIN IMMEDIATE":
+        return "BEGIN"
+    if sql.upper().startswith("INSERT OR IGNORE "):
+        sql = "INSERT " + sql[len("INSERT OR IGNORE "):] + " ON CONFLICT DO NOTHING"
+    if _CREATE_TABLE_RE.match(sql) and "AUTOINCREMENT" not in sql.upper():
+        end = _CREATE_TABLE_RE.match(sql).end()
+        sql = f"{sql[:end]}\n    rowid BIGSERIAL NOT NULL,{sql[end:]}"
+    sql = re.sub(r"INTEGER PRIMARY KEY AUTOINCREMENT", "BIGSERIAL PRIMARY KEY", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bBLOB\b", "BYTEA", sql)
+    sql = re.sub(r"datetime\('now',\s*([^)]+)\)", r"(CURRENT_TIMESTAMP + CAST(\1 AS INTERVAL))", sql)
+    sql = re.sub(r"julianday\(([\w.]+)\)", r"(EXTRACT(EPOCH FROM \1) / 86400.0)", sql)
+    return _LITERAL_OR_PLACEHOLDER_RE.sub(_placeholder, sql)
+
+
+class _PostgresCursor:
+    """sqlite3-style cursor over a psycopg cursor, translating every statement."""
+    dialect = "postgres"
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [tuple(params) for params in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        """Id generated by the last INSERT into a BIGSERIAL table on this connection."""
+        return self._cursor.connection.execute("SELECT lastval()").fetchone()[0]
+
+
+class _PostgresConnection:
+    """sqlite3-style connection over a pooled psycopg connection in autocommit mode."""
+    dialect = "postgres"
+    isolation_level = None
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self):
+        return _PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != psycopg.pq.TransactionStatus.IDLE
+
+
+def _configure_connection(conn):
+    # Timestamps come back as text, as they do from SQLite, so API responses and
+    # page cursors (which are JSON) are the same on both backends
+    conn.adapters.register_loader("timestamp", TextLoader)
+    conn.adapters.register_loader("timestamptz", TextLoader)
+
+
+class PostgresBackend:
+    """
+    A shared Postgres database, so several API nodes can serve the same users.
+
+    Connections come from a psycopg pool; DatabaseClient keeps one per DB thread,
+    so POSTGRES_POOL_MAX must cover the read threads plus the writer thread.
+    Statements are written for SQLite and translated by translate_sql().
+    """
+    name = "postgres"
+
+    def __init__(self, url, min_size: int = Config.POSTGRES_POOL_MIN, max_size: int = Config.POSTGRES_POOL_MAX):
+        if psycopg is None:
+            raise ImportError("DATABASE_BACKEND=postgres needs psycopg: pip install \"psycopg[binary,pool]\"")
+        if not url:
+            raise ValueError("DATABASE_BACKEND=postgres needs DATABASE_URL")
+        self.pool = ConnectionPool(
+            url, min_size=min_size, max_size=max_size, open=True,
+            kwargs={"autocommit": True, "options": "-c timezone=UTC"},
+            configure=_configure_connection,
+        )
+        print(f"Connected to Postgres pool ({min_size}-{max_size} connections)")
+
+    def connect(self):
+        return _PostgresConnection(self.pool.getconn())
+
+    def release(self, conn):
+        self.pool.putconn(conn.raw)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,43 @@
+import threading
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """
+    Return the shared embedding function.
+    This is the same model ChromaDB uses for collections created without an
+    explicit embedding function, so precomputed vectors match the stored ones.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_lock:
+            if _embedding_function is None:
+                _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def embed_texts(texts) -> np.ndarray:
+    """
+    Embed a batch of texts in a single model call.
+
+    Args:
+        texts: List of strings
+
+    Returns:
+        np.ndarray: float32 matrix of shape (len(texts), dim)
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray(get_embedding_function()(list(texts)), dtype=np.float32)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
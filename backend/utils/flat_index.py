@@ -0,0 +1,586 @@
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+
+from config import Config
+from utils.embeddings import normalize_rows
+
+# Metadata fields stored as columns next to the vectors; project_id is implied by the directory
+METADATA_COLUMNS = ("conversation_id", "topic")
+GLOBAL_PROJECT = "_global"
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9_.-]")
+# Rows scored per matmul when searching int8 codes, bounding the float32 temporary
+_SCAN_BLOCK_ROWS = 16384
+# Trailing segments are merged while the older one has at most this many times the
+# newer one's rows, so sizes shrink geometrically: O(log n) segments per project
+# and every row rewritten O(log n) times over a project's life
+_MERGE_RATIO = 2
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Symmetric per-dimension int8 scalar quantization.
+
+    Returns:
+        tuple: (codes int8 matrix, float32 scale per dimension) with vectors ~= codes * scales
+    """
+    if not len(vectors):
+        return np.zeros(vectors.shape, dtype=np.int8), np.ones(vectors.shape[1:], dtype=np.float32)
+    scales = np.abs(vectors).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def project_key(project_id) -> str:
+    """Directory name used for a project's index files."""
+    if not project_id:
+        return GLOBAL_PROJECT
+    return _UNSAFE_CHARS_RE.sub("_", str(project_id))
+
+
+def disk_usage(path) -> int:
+    """Total size in bytes of a file or directory tree."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+class ProjectIndex:
+    """
+    One immutable version of a project's index.
+    Vectors are memory-mapped; ids, metadata columns and document offsets are small
+    enough to load eagerly. Documents are sliced out of a single UTF-8 blob on demand.
+
+    Every version also stores int8 codes of the vectors. With int8 quantization the
+    scan touches only the codes (a quarter of the float32 bytes) and the float32
+    rows are read back just for the few candidates that get rescored.
+    """
+    def __init__(self, project_id, path):
+        self.project_id = project_id
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if os.path.exists(os.path.join(path, "codes_int8.npy")):
+            self.codes = np.load(os.path.join(path, "codes_int8.npy"), mmap_mode="r")
+            self.scales = np.load(os.path.join(path, "code_scales.npy"))
+        else:
+            # Versions written before int8 codes were stored
+            self.codes, self.scales = quantize_int8(np.asarray(self.vectors))
+        self.ids = np.load(os.path.join(path, "ids.npy"))
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"))
+            for name in METADATA_COLUMNS
+        }
+        self.document_offsets = np.load(os.path.join(path, "document_offsets.npy"))
+        self._documents = np.memmap(os.path.join(path, "documents.bin"), dtype=np.uint8, mode="r") \
+            if self.document_offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def document(self, row: int) -> str:
+        start, end = self.document_offsets[row], self.document_offsets[row + 1]
+        return bytes(self._documents[start:end]).decode("utf-8")
+
+    def vector(self, row: int) -> np.ndarray:
+        """One float32 row, read from the memmap."""
+        return np.asarray(self.vectors[row])
+
+    def metadata(self, row: int) -> dict:
+        metadata = {name: str(values[row]) for name, values in self.columns.items()}
+        if self.project_id:
+            metadata["project_id"] = self.project_id
+        return metadata
+
+    def search(self, queries, k, rows=None, quantization="none", rescore_factor=4):
+        """
+        Top-k rows by cosine similarity.
+
+        Args:
+            queries: Normalized float32 query matrix
+            k: Results per query
+            rows: Optional row subset to search (defaults to all rows)
+            quantization: "none" for an exact float32 scan, "int8" to scan codes then
+                rescore the best k * rescore_factor candidates at full precision
+            rescore_factor: Candidate multiplier for int8 rescoring
+
+        Returns:
+            list: Per query, a list of (score, row) best first
+        """
+        all_rows = rows is None
+        rows = np.arange(len(self)) if all_rows else rows
+        k = min(k, len(rows))
+        if not k:
+            return [[] for _ in range(len(queries))]
+
+        if quantization == "int8":
+            candidates = min(len(rows), k * rescore_factor)
+            scaled_queries = queries * self.scales
+            approx = np.empty((len(queries), len(rows)), dtype=np.float32)
+            for start in range(0, len(rows), _SCAN_BLOCK_ROWS):
+                end = min(start + _SCAN_BLOCK_ROWS, len(rows))
+                codes = self.codes[start:end] if all_rows else self.codes[rows[start:end]]
+                approx[:, start:end] = scaled_queries @ codes.astype(np.float32).T
+        else:
+            candidates = k
+            vectors = self.vectors if all_rows else self.vectors[rows]
+            approx = queries @ vectors.T
+
+        results = []
+        for q in range(len(queries)):
+            positions = np.argpartition(-approx[q], candidates - 1)[:candidates]
+            top = rows[positions]
+            if quantization == "int8":
+                # Rescore the candidate set against the full-precision vectors
+                scores = self.vectors[top] @ queries[q]
+            else:
+                scores = approx[q][positions]
+            order = np.argsort(-scores)[:k]
+            results.append([(float(scores[i]), int(top[i])) for i in order])
+        return results
+
+    def mask(self, conditions) -> np.ndarray:
+        """Boolean row mask for metadata conditions other than project_id."""
+        return _column_mask(self.columns, len(self), conditions)
+
+
+def _column_mask(columns, size, conditions) -> np.ndarray:
+    mask = np.ones(size, dtype=bool)
+    for field, allowed in conditions:
+        if field not in columns:
+            return np.zeros(size, dtype=bool)
+        mask &= np.isin(columns[field], list(allowed))
+    return mask
+
+
+class SegmentedProjectIndex:
+    """
+    A project's index as the ordered list of its segments (each a ProjectIndex).
+    Rows are numbered across the segments in order, so this offers the same
+    interface as a single ProjectIndex; search runs per segment and merges.
+    """
+    def __init__(self, project_id, segments):
+        self.project_id = project_id
+        self.segments = segments
+        self.offsets = np.cumsum([0] + [len(segment) for segment in segments])
+        self.ids = np.concatenate([segment.ids for segment in segments])
+        self.columns = {
+            name: np.concatenate([segment.columns[name] for segment in segments])
+            for name in METADATA_COLUMNS
+        }
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _locate(self, row: int):
+        position = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        return self.segments[position], row - int(self.offsets[position])
+
+    def document(self, row: int) -> str:
+        segment, local = self._locate(row)
+        return segment.document(local)
+
+    def vector(self, row: int) -> np.ndarray:
+        """One float32 row, read from its segment without concatenating the others."""
+        segment, local = self._locate(row)
+        return segment.vector(local)
+
+    def metadata(self, row: int) -> dict:
+        segment, local = self._locate(row)
+        return segment.metadata(local)
+
+    @property
+    def vectors(self):
+        """All float32 rows; memory-mapped for one segment, copied into one array otherwise."""
+        if len(self.segments) == 1:
+            return self.segments[0].vectors
+        return np.concatenate([segment.vectors for segment in self.segments])
+
+    @property
+    def codes(self):
+        """All int8 codes (for size accounting: every segment has its own scales)."""
+        if len(self.segments) == 1:
+            return self.segments[0].codes
+        return np.concatenate([segment.codes for segment in self.segments])
+
+    def mask(self, conditions) -> np.ndarray:
+        """Boolean row mask for metadata conditions other than project_id."""
+        return _column_mask(self.columns, len(self), conditions)
+
+    def search(self, queries, k, rows=None, quantization="none", rescore_factor=4):
+        """Top-k rows by cosine similarity; arguments and result as ProjectIndex.search."""
+        merged = [[] for _ in range(len(queries))]
+        for segment, start in zip(self.segments, self.offsets):
+            start = int(start)
+            local_rows = None
+            if rows is not None:
+                local_rows = rows[(rows >= start) & (rows < start + len(segment))] - start
+                if not len(local_rows):
+                    continue
+            hits = segment.search(queries, k, rows=local_rows, quantization=quantization, rescore_factor=rescore_factor)
+            for q, query_hits in enumerate(hits):
+                merged[q].extend((score, row + start) for score, row in query_hits)
+        return [sorted(query_hits, key=lambda hit: hit[0], reverse=True)[:k] for query_hits in merged]
+
+
+def write_project_index(path, ids, documents, metadatas, vectors):
+    """
+    Write a complete project index version into an empty directory.
+
+    Args:
+        path: Target directory (created)
+        ids: Chunk ids
+        documents: Chunk texts
+        metadatas: Metadata dicts
+        vectors: float32 matrix, one normalized row per chunk
+    """
+    os.makedirs(path)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    codes, scales = quantize_int8(vectors)
+    np.save(os.path.join(path, "codes_int8.npy"), codes)
+    np.save(os.path.join(path, "code_scales.npy"), scales)
+    np.save(os.path.join(path, "ids.npy"), np.asarray(ids, dtype=str))
+    for name in METADATA_COLUMNS:
+        column = [str(metadata.get(name) or "") for metadata in metadatas]
+        np.save(os.path.join(path, f"{name}.npy"), np.asarray(column, dtype=str))
+
+    encoded = [document.encode("utf-8") for document in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+    np.save(os.path.join(path, "document_offsets.npy"), offsets)
+    with open(os.path.join(path, "documents.bin"), "wb") as f:
+        for blob in encoded:
+            f.write(blob)
+
+
+class FlatVectorStore:
+    """
+    In-process exact vector index with memory-mapped .npy files per project.
+
+    Search is a single matmul per segment over the project's normalized vectors
+    followed by argpartition, so it is exact and needs no service or background
+    index build. The class mirrors the subset of ChromaDB's collection API that
+    Indexer and Retriever use (add/query/get/count); distances are cosine distances.
+
+    A project is a list of immutable segment directories named in its MANIFEST.json
+    (which also records the real project_id). add() writes only the new rows as a
+    segment, so ingest costs are proportional to the batch; trailing segments are
+    merged geometrically. Every change writes a new manifest and atomically
+    replaces it, so readers always see a complete index. Segments a manifest drops
+    are deleted on the following publish, after readers have moved to the new one.
+    """
+    def __init__(self, directory: str = Config.FLAT_INDEX_DIRECTORY,
+                 quantization: str = Config.VECTOR_QUANTIZATION,
+                 rescore_factor: int = Config.VECTOR_RESCORE_FACTOR):
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        os.makedirs(directory, exist_ok=True)
+        self._loaded = {}
+        self._segments = {}
+        self._lock = threading.RLock()
+
+    # ---- storage ----
+
+    def _project_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _manifest(self, key):
+        """The project's manifest, or None if it has no index."""
+        project_dir = self._project_dir(key)
+        try:
+            with open(os.path.join(project_dir, "MANIFEST.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        try:
+            # Directories written before manifests: CURRENT names one version directory
+            with open(os.path.join(project_dir, "CURRENT"), "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return {
+            "project_id": None if key == GLOBAL_PROJECT else key,
+            "version": int(version[1:]),
+            "segments": [version],
+            "retired": [],
+        }
+
+    def _project_ids(self):
+        """project_id of every indexed project (None for the global one)."""
+        project_ids = []
+        for key in sorted(os.listdir(self.directory)):
+            manifest = self._manifest(key)
+            if manifest is not None:
+                project_ids.append(manifest["project_id"])
+        return project_ids
+
+    def _segment(self, key, project_id, name):
+        """Open segment, shared by every loaded version that contains it."""
+        segment = self._segments.get((key, name))
+        if segment is None:
+            segment = ProjectIndex(project_id, os.path.join(self._project_dir(key), name))
+            self._segments[(key, name)] = segment
+        return segment
+
+    def load(self, project_id):
+        """Return the current index of a project, or None if it has no chunks."""
+        key = project_key(project_id)
+        manifest = self._manifest(key)
+        if manifest is None:
+            return None
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is None or loaded[0] != manifest["version"]:
+                segments = [self._segment(key, project_id, name) for name in manifest["segments"]]
+                index = segments[0] if len(segments) == 1 else SegmentedProjectIndex(project_id, segments)
+                loaded = (manifest["version"], index)
+                self._loaded[key] = loaded
+                for cached in [cached for cached in self._segments if cached[0] == key]:
+                    if cached[1] not in manifest["segments"]:
+                        del self._segments[cached]
+            return loaded[1]
+
+    def replace_project(self, project_id, ids, documents, metadatas, vectors):
+        """Atomically replace a project's index with the given rows."""
+        self._publish(project_id, lambda path: write_project_index(path, ids, documents, metadatas, vectors))
+
+    def install_project(self, project_id, source_dir):
+        """
+        Atomically make an already written index directory (e.g. an unpacked snapshot)
+        the project's only segment. The directory is moved, not copied.
+        """
+        self._publish(project_id, lambda path: shutil.move(source_dir, path))
+
+    def _publish(self, project_id, write_segment, keep=()):
+        """
+        Write a new segment with write_segment(path) and publish a manifest made of
+        the segments named in keep followed by the new one.
+        """
+        key = project_key(project_id)
+        with self._lock:
+            project_dir = self._project_dir(key)
+            os.makedirs(project_dir, exist_ok=True)
+            previous = self._manifest(key) or {"version": 0, "segments": [], "retired": []}
+            version = previous["version"] + 1
+            name = f"s{version:06d}"
+            write_segment(os.path.join(project_dir, name))
+            segments = list(keep) + [name]
+            self._write_manifest(key, project_id, version, segments, previous)
+
+    def _write_manifest(self, key, project_id, version, segments, previous):
+        project_dir = self._project_dir(key)
+        manifest = {
+            "project_id": project_id,
+            "version": version,
+            "segments": segments,
+            "retired": [name for name in previous["segments"] if name not in segments],
+        }
+        pointer = os.path.join(project_dir, "MANIFEST.json.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(pointer, os.path.join(project_dir, "MANIFEST.json"))
+        if os.path.exists(os.path.join(project_dir, "CURRENT")):
+            os.remove(os.path.join(project_dir, "CURRENT"))
+        # Segments dropped by the previous publish: readers have had a full version to move on
+        for name in previous["retired"]:
+            shutil.rmtree(os.path.join(project_dir, name), ignore_errors=True)
+
+    def _merge_segments(self, project_id, index, names, force=False):
+        """
+        Merge the trailing segments of a project while the older of the last two is
+        at most _MERGE_RATIO times the size of the newer (all of them when force).
+        """
+        key = project_key(project_id)
+        segments = index.segments if isinstance(index, SegmentedProjectIndex) else [index]
+        merge_from = len(segments) - 1
+        while merge_from > 0 and (
+            force or len(segments[merge_from - 1]) <= _MERGE_RATIO * sum(len(s) for s in segments[merge_from:])
+        ):
+            merge_from -= 1
+        if merge_from == len(segments) - 1 and not force:
+            return
+        merged = segments[merge_from:]
+        ids, documents, metadatas = [], [], []
+        for segment in merged:
+            rows = range(len(segment))
+            ids.extend(str(chunk_id) for chunk_id in segment.ids)
+            documents.extend(segment.document(row) for row in rows)
+            metadatas.extend(segment.metadata(row) for row in rows)
+        vectors = np.concatenate([np.asarray(segment.vectors) for segment in merged])
+        self._publish(
+            project_id, lambda path: write_project_index(path, ids, documents, metadatas, vectors),
+            keep=names[:merge_from]
+        )
+
+    def compact(self, rebuild: bool = False) -> int:
+        """
+        Merge every project into a single segment and remove directories and files
+        its manifest does not name (left behind by crashes, retired segments and
+        pre-manifest versions). With rebuild=True single-segment projects are also
+        rewritten, which adds int8 codes to versions written before they were stored.
+
+        Returns:
+            int: Bytes reclaimed
+        """
+        reclaimed = 0
+        with self._lock:
+            for key in sorted(os.listdir(self.directory)):
+                project_dir = self._project_dir(key)
+                manifest = self._manifest(key)
+                if manifest is not None and (rebuild or len(manifest["segments"]) > 1):
+                    self._merge_segments(manifest["project_id"], self.load(manifest["project_id"]),
+                                         manifest["segments"], force=True)
+                    manifest = self._manifest(key)
+                keep = {"MANIFEST.json"} | set(manifest["segments"] if manifest else ())
+                for entry in os.listdir(project_dir):
+                    if entry in keep:
+                        continue
+                    path = os.path.join(project_dir, entry)
+                    reclaimed += disk_usage(path)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+                if manifest is None:
+                    shutil.rmtree(project_dir, ignore_errors=True)
+                    self._loaded.pop(key, None)
+                else:
+                    manifest["retired"] = []
+                    self._write_manifest(key, manifest["project_id"], manifest["version"], manifest["segments"], manifest)
+        return reclaimed
+
+    # ---- ChromaDB collection API subset ----
+
+    def count(self) -> int:
+        total = 0
+        for project_id in self._project_ids():
+            index = self.load(project_id)
+            total += len(index) if index is not None else 0
+        return total
+
+    def add(self, ids, documents, metadatas, embeddings):
+        """Append chunks as a new segment per project; rows are grouped by their project_id metadata."""
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        by_project = {}
+        for row, metadata in enumerate(metadatas):
+            by_project.setdefault(metadata.get("project_id"), []).append(row)
+
+        with self._lock:
+            for project_id, rows in by_project.items():
+                manifest = self._manifest(project_key(project_id))
+                names = manifest["segments"] if manifest else []
+                self._publish(
+                    project_id,
+                    lambda path: write_project_index(
+                        path, [ids[row] for row in rows], [documents[row] for row in rows],
+                        [metadatas[row] for row in rows], vectors[rows]
+                    ),
+                    keep=names
+                )
+                if names:
+                    manifest = self._manifest(project_key(project_id))
+                    self._merge_segments(project_id, self.load(project_id), manifest["segments"])
+
+    def _parse_where(self, where):
+        """
+        Split a ChromaDB-style where filter into the project scope and column conditions.
+        Supports equality, $eq, $in and $and, which is all this app generates.
+        """
+        clauses = where.get("$and", [where]) if where else []
+        project_ids = None
+        conditions = []
+        for clause in clauses:
+            for field, value in clause.items():
+                if isinstance(value, dict):
+                    allowed = value.get("$in", [value.get("$eq")])
+                else:
+                    allowed = [value]
+                if field == "project_id":
+                    project_ids = allowed
+                else:
+                    conditions.append((field, allowed))
+        return project_ids, conditions
+
+    def _scoped_indexes(self, where):
+        project_ids, conditions = self._parse_where(where)
+        for project_id in (project_ids if project_ids is not None else self._project_ids()):
+            index = self.load(project_id)
+            if index is not None and len(index):
+                yield index, index.mask(conditions)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        """Exact top-k by cosine similarity for one or more query embeddings."""
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        # Per query: list of (score, index, row) candidates across scoped projects
+        candidates = [[] for _ in range(len(queries))]
+        for index, mask in self._scoped_indexes(where):
+            rows = None if mask.all() else np.flatnonzero(mask)
+            hits = index.search(queries, n_results, rows=rows,
+                                quantization=self.quantization, rescore_factor=self.rescore_factor)
+            for q, query_hits in enumerate(hits):
+                candidates[q].extend((score, index, row) for score, row in query_hits)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for hits in candidates:
+            hits.sort(key=lambda hit: hit[0], reverse=True)
+            hits = hits[:n_results]
+            results["ids"].append([str(index.ids[row]) for _, index, row in hits])
+            results["documents"].append([index.document(row) for _, index, row in hits])
+            results["metadatas"].append([index.metadata(row) for _, index, row in hits])
+            results["distances"].append([1.0 - score for score, _, _ in hits])
+        return results
+
+    def get(self, ids=None, where=None, offset=None, limit=None, include=None):
+        """
+        Return all matching chunks, optionally restricted to ids and paged with offset/limit.
+        Rows are numbered across projects in directory order; only the rows of the
+        requested page are read, so paging through a store costs O(rows) overall.
+        """
+        with_embeddings = include is not None and "embeddings" in include
+        results = {"ids": [], "documents": [], "metadatas": []}
+        if with_embeddings:
+            results["embeddings"] = []
+        skip = offset or 0
+        remaining = limit if limit is not None else None
+        for index, mask in self._scoped_indexes(where):
+            if remaining == 0:
+                break
+            if ids is not None:
+                mask = mask & np.isin(index.ids, list(ids))
+            rows = np.flatnonzero(mask)
+            if skip >= len(rows):
+                # The whole project lies before the page
+                skip -= len(rows)
+                continue
+            rows = rows[skip:] if remaining is None else rows[skip:skip + remaining]
+            skip = 0
+            if remaining is not None:
+                remaining -= len(rows)
+            for row in rows:
+                results["ids"].append(str(index.ids[row]))
+                results["documents"].append(index.document(row))
+                results["metadatas"].append(index.metadata(row))
+                if with_embeddings:
+                    results["embeddings"].append(index.vector(row))
+        return results
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_flat_store(directory: str = Config.FLAT_INDEX_DIRECTORY) -> FlatVectorStore:
+    """Shared FlatVectorStore per directory so loaded memmaps are reused across requests."""
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = FlatVectorStore(directory)
+        return _stores[directory]
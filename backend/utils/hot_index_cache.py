@@ -0,0 +1,269 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import Config
+from utils.embeddings import normalize_rows
+from utils.flat_index import FlatVectorStore
+from utils.retrieval_cache import retrieval_cache
+
+
+class HotProjectIndex:
+    """
+    A project's chunks held fully in memory: one contiguous float32 matrix plus ids,
+    documents, conversation ids and the rows of each topic. Search is a single
+    matrix-vector product over the project's rows, or just the rows of the topics a
+    query was routed to, ranked in the same space ("cosine", "l2" or "ip") as the
+    vector store the project was loaded from.
+
+    With int8 quantization (flat store only) the matrix is replaced by the project's
+    int8 codes and per-segment scales, a quarter of the float32 bytes, so four times
+    as many projects fit the budget. The scan then ranks by the codes and the best
+    k * rescore_factor candidates are rescored against the float32 rows of the
+    memory-mapped index passed as `quantized`, costing a few page reads per query.
+    """
+    def __init__(self, project_id, ids, documents, metadatas, embeddings, generation, space="cosine",
+                 quantized=None, rescore_factor=4):
+        if space not in ("cosine", "l2", "ip"):
+            raise ValueError(f"Unsupported distance space: {space}")
+        if quantized is not None and space != "cosine":
+            raise ValueError("Quantized hot indexes only rank by cosine")
+        self.project_id = project_id
+        self.generation = generation
+        self.space = space
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.conversation_ids = np.array([(m or {}).get("conversation_id", "") for m in metadatas])
+        topics = np.array([str((m or {}).get("topic") or "") for m in metadatas])
+        order = np.argsort(topics, kind="stable")
+        names, starts = np.unique(topics[order], return_index=True)
+        self.topic_rows = dict(zip(names, np.split(order, starts[1:])))
+        self.source = quantized
+        self.rescore_factor = rescore_factor
+        if quantized is not None:
+            # (first row, int8 codes, scales) per segment: every segment is quantized with its own scales
+            segments = getattr(quantized, "segments", [quantized])
+            offsets = np.cumsum([0] + [len(segment) for segment in segments])
+            self.code_blocks = [
+                (int(start), np.array(segment.codes, dtype=np.int8), np.asarray(segment.scales, dtype=np.float32))
+                for start, segment in zip(offsets, segments)
+            ]
+            self.vectors = None
+            vector_bytes = sum(codes.nbytes + scales.nbytes for _, codes, scales in self.code_blocks)
+        else:
+            self.code_blocks = None
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            self.vectors = np.ascontiguousarray(normalize_rows(vectors) if space == "cosine" else vectors)
+            vector_bytes = self.vectors.nbytes
+        # ||v||^2 per row: l2 ranks by ||v||^2 - 2 q.v, since ||q||^2 is the same for every row
+        self.squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors) if space == "l2" else None
+        self.nbytes = (
+            vector_bytes
+            + (self.squared_norms.nbytes if self.squared_norms is not None else 0)
+            + self.conversation_ids.nbytes
+            + len(self.ids) * order.itemsize
+            + sum(len(chunk_id) + len(document) for chunk_id, document in zip(self.ids, self.documents))
+        )
+
+    def _scores(self, queries, rows):
+        """Scores of the given rows for each query, higher is better; approximate for int8 codes."""
+        if self.code_blocks is None:
+            scores = queries @ (self.vectors if rows is None else self.vectors[rows]).T
+            if self.space == "l2":
+                # Higher is better throughout: the negated squared distance, up to a per-query constant
+                scores = 2 * scores - (self.squared_norms if rows is None else self.squared_norms[rows])
+            return scores
+        rows = np.arange(len(self.ids)) if rows is None else rows
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start, codes, scales in self.code_blocks:
+            selected = np.flatnonzero((rows >= start) & (rows < start + len(codes)))
+            if len(selected):
+                scores[:, selected] = (queries * scales) @ codes[rows[selected] - start].astype(np.float32).T
+        return scores
+
+    def search(self, query_embeddings, n_results, conversation_id=None, topics=None):
+        """
+        Exact top-k in the index's distance space.
+
+        Args:
+            query_embeddings: Query vectors
+            n_results: Results per query
+            conversation_id: Only return chunks of this conversation
+            topics: Only search the chunks of these topics
+
+        Returns:
+            list: One list of (chunk_id, document) tuples per query, best match first
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if self.space == "cosine":
+            queries = normalize_rows(queries)
+        if topics:
+            rows = np.sort(np.concatenate([self.topic_rows.get(topic, np.zeros(0, dtype=int)) for topic in topics]))
+            scores = self._scores(queries, rows)
+        else:
+            rows = np.arange(len(self.ids))
+            scores = self._scores(queries, None)
+        if conversation_id:
+            outside = self.conversation_ids[rows] != conversation_id
+            scores[:, outside] = -np.inf
+            available = len(rows) - int(np.count_nonzero(outside))
+        else:
+            available = len(rows)
+        k = min(n_results, available)
+        if k <= 0:
+            return [[] for _ in queries]
+        candidates = k if self.code_blocks is None else min(k * self.rescore_factor, available)
+
+        results = []
+        for query, query_scores in zip(queries, scores):
+            top = np.argpartition(-query_scores, candidates - 1)[:candidates]
+            if self.code_blocks is None:
+                top = rows[top[np.argsort(-query_scores[top])]]
+            else:
+                # Rescore the candidates against the float32 rows of the memory-mapped index
+                top = rows[top]
+                exact = np.stack([self.source.vector(int(row)) for row in top]) @ query
+                top = top[np.argsort(-exact)[:k]]
+            results.append([(self.ids[row], self.documents[row]) for row in top])
+        return results
+
+
+class HotIndexCache:
+    """
+    LRU cache of HotProjectIndex objects bounded by a memory budget in bytes.
+
+    Projects are loaded from the vector store on first access and reloaded when the
+    retrieval cache generation of the project moves (i.e. after new chunks were
+    indexed or a snapshot was restored). Projects larger than the whole budget are
+    never cached and keep using the vector store directly; they are remembered per
+    generation, so they are not loaded again until their index changes.
+    """
+    def __init__(self, max_bytes: int = Config.HOT_INDEX_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._oversized = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.oversized = 0
+        self.load_seconds = 0.0
+
+    def get(self, collection, project_id):
+        """
+        Return the in-memory index for a project, loading it from collection on a miss.
+
+        Args:
+            collection: ChromaDB collection or FlatVectorStore holding the project
+            project_id: Project to look up
+
+        Returns:
+            HotProjectIndex, or None if caching is disabled or the project does not fit
+        """
+        if not self.max_bytes or not project_id:
+            return None
+        generation = retrieval_cache.generation(project_id)
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is not None:
+                if entry.generation == generation:
+                    self._entries.move_to_end(project_id)
+                    self.hits += 1
+                    return entry
+                self._remove(project_id)
+                self.stale += 1
+            if self._oversized.get(project_id) == generation:
+                return None
+            self.misses += 1
+            # One loader per project; concurrent first requests wait for it
+            load_lock = self._loading.setdefault(project_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(project_id)
+                if entry is not None and entry.generation == generation:
+                    return entry
+            entry = self._load(collection, project_id, generation)
+        with self._lock:
+            self._loading.pop(project_id, None)
+            if entry is None:
+                return None
+            if entry.nbytes > self.max_bytes:
+                self._oversized[project_id] = generation
+                self.oversized += 1
+                return None
+            self._oversized.pop(project_id, None)
+            if project_id in self._entries:
+                self._remove(project_id)
+            self._entries[project_id] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                evicted, _ = next(iter(self._entries.items()))
+                self._remove(evicted)
+                self.evictions += 1
+            return entry
+
+    def _load(self, collection, project_id, generation):
+        started = time.perf_counter()
+        if isinstance(collection, FlatVectorStore):
+            # The flat store only ranks by cosine
+            # Read the memmapped version directly instead of going through get(); with int8
+            # quantization only the codes are copied into memory and the version is kept for rescoring
+            index = collection.load(project_id)
+            if index is None or not len(index):
+                return None
+            rows = range(len(index))
+            entry = HotProjectIndex(
+                project_id, [str(chunk_id) for chunk_id in index.ids], [index.document(row) for row in rows],
+                [{"conversation_id": conversation_id, "topic": topic}
+                 for conversation_id, topic in zip(index.columns["conversation_id"], index.columns["topic"])],
+                None if collection.quantization == "int8" else index.vectors, generation, space="cosine",
+                quantized=index if collection.quantization == "int8" else None,
+                rescore_factor=collection.rescore_factor
+            )
+        else:
+            result = collection.get(where={"project_id": project_id}, include=["documents", "metadatas", "embeddings"])
+            if not len(result["ids"]):
+                return None
+            # The collection's own space, which differs from HNSW_SPACE until the next rebuild
+            space = ((collection.configuration or {}).get("hnsw") or {}).get("space", "l2")
+            entry = HotProjectIndex(
+                project_id, result["ids"], result["documents"], result["metadatas"], result["embeddings"], generation,
+                space=space
+            )
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.load_seconds += elapsed
+        print(f"Hot index: loaded project {project_id} ({len(entry.ids)} chunks, "
+              f"{entry.nbytes / 1024 / 1024:.1f} MB) in {elapsed * 1000:.0f} ms")
+        return entry
+
+    def _remove(self, project_id):
+        entry = self._entries.pop(project_id)
+        self._bytes -= entry.nbytes
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and memory use."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "projects": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "oversized": self.oversized,
+                "load_seconds": round(self.load_seconds, 3),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache shared by every Retriever
+hot_index_cache = HotIndexCache()
@@ -0,0 +1,210 @@
+import os
+import re
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+from utils.flat_index import FlatVectorStore, disk_usage
+
+_SEGMENT_DIR_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def _read_all(collection, batch_size):
+    """ids, documents, metadatas and embeddings of every chunk, read in batches."""
+    ids, documents, metadatas, embeddings = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        batch = collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas", "embeddings"])
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        embeddings.extend(batch["embeddings"])
+    return ids, documents, metadatas, np.asarray(embeddings, dtype=np.float32)
+
+
+def rebuild_collection(client, name, configuration, batch_size: int = 1000):
+    """
+    Rebuild a ChromaDB collection offline with a new HNSW configuration.
+
+    Chunks are copied with their stored embeddings into a fresh collection, which
+    also drops the space held by deleted and replaced entries, and the copy then
+    takes over the original name. The original is renamed to a backup before the
+    copy takes its place and only deleted afterwards, so a crash at any point leaves
+    a complete collection that recover_collection() puts back under the name. Run
+    it while the API is stopped.
+
+    Args:
+        client: ChromaDB client holding the collection
+        name: Collection to rebuild
+        configuration: Collection configuration for the new index
+        batch_size: Chunks copied per add call
+
+    Returns:
+        dict: Chunk count and seconds taken
+    """
+    started = time.perf_counter()
+    recover_collection(client, name)
+    source = client.get_collection(name)
+    staging_name, backup_name = _staging_name(name), _backup_name(name)
+    if staging_name in [c.name for c in client.list_collections()]:
+        client.delete_collection(staging_name)
+    target = client.create_collection(staging_name, configuration=configuration)
+
+    total = source.count()
+    for offset in range(0, total, batch_size):
+        batch = source.get(offset=offset, limit=batch_size, include=["documents", "metadatas", "embeddings"])
+        target.add(ids=batch["ids"], documents=batch["documents"],
+                   metadatas=batch["metadatas"], embeddings=batch["embeddings"])
+        print(f"Rebuild: copied {min(offset + batch_size, total)}/{total} chunks")
+
+    if target.count() != total:
+        client.delete_collection(staging_name)
+        raise RuntimeError(f"Rebuild of {name} copied {target.count()} of {total} chunks; original kept")
+    source.modify(name=backup_name)
+    target.modify(name=name)
+    client.delete_collection(backup_name)
+    return {"count": total, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _staging_name(name):
+    return f"{name}_rebuild"
+
+
+def _backup_name(name):
+    return f"{name}_backup"
+
+
+def recover_collection(client, name):
+    """
+    Finish or undo a rebuild_collection() that was interrupted between renames.
+
+    The original only gives up its name once the staging copy holds every chunk,
+    so when the name is missing a staging copy is adopted if there is one, and the
+    backup is renamed back otherwise. A backup left next to the live collection is
+    deleted. An unfinished staging copy next to the original is left for the next
+    rebuild to replace.
+
+    Returns:
+        str: What was done ("adopted", "restored", "cleaned") or None
+    """
+    names = {c.name for c in client.list_collections()}
+    staging_name, backup_name = _staging_name(name), _backup_name(name)
+    if name not in names and staging_name in names:
+        client.get_collection(staging_name).modify(name=name)
+        action = "adopted"
+    elif name not in names and backup_name in names:
+        client.get_collection(backup_name).modify(name=name)
+        return "restored"
+    else:
+        action = None
+    if backup_name in names:
+        client.delete_collection(backup_name)
+        action = action or "cleaned"
+    return action
+
+
+def prune_orphaned_segments(persist_directory) -> int:
+    """
+    Delete HNSW segment directories that no collection references any more.
+    ChromaDB leaves them on disk when a collection is deleted, so without this a
+    rebuild would only add space.
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    connection = sqlite3.connect(f"file:{os.path.join(persist_directory, 'chroma.sqlite3')}?mode=ro", uri=True)
+    try:
+        live = {row[0] for row in connection.execute("SELECT id FROM segments")}
+    finally:
+        connection.close()
+    reclaimed = 0
+    for entry in os.listdir(persist_directory):
+        path = os.path.join(persist_directory, entry)
+        if _SEGMENT_DIR_RE.match(entry) and os.path.isdir(path) and entry not in live:
+            reclaimed += disk_usage(path)
+            shutil.rmtree(path, ignore_errors=True)
+    return reclaimed
+
+
+def _exact_neighbors(vectors, queries, k, space):
+    """Brute-force top-k rows under the collection's distance metric."""
+    if space == "l2":
+        distances = (
+            np.sum(queries ** 2, axis=1)[:, None] - 2 * queries @ vectors.T + np.sum(vectors ** 2, axis=1)[None, :]
+        )
+    else:
+        if space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        distances = -(queries @ vectors.T)
+    return np.argpartition(distances, k - 1, axis=1)[:, :k]
+
+
+def recall_report(collection, k: int = 10, samples: int = 200, ef_values=None,
+                  noise: float = 0.05, batch_size: int = 1000, seed: int = 0):
+    """
+    Measure ANN recall@k and per-query latency against exact brute-force search.
+
+    Queries are stored chunk embeddings with a little Gaussian noise, so the report
+    needs no external query set. On ChromaDB each value in ef_values is applied as
+    the collection's search ef in turn and the original value is restored afterwards.
+    The flat backend is exact for float32 and is reported once, for its configured
+    quantization.
+
+    Args:
+        collection: ChromaDB collection or FlatVectorStore
+        k: Neighbors per query
+        samples: Number of queries
+        ef_values: Search ef values to try (ChromaDB only; defaults to the current one)
+        noise: Standard deviation of the noise added to each sampled embedding
+        batch_size: Chunks read per get call when loading the ground truth
+        seed: Random seed for query sampling
+
+    Returns:
+        list: One dict per setting with recall and p50/p99 latency in ms
+    """
+    ids, _, _, vectors = _read_all(collection, batch_size)
+    if not ids:
+        return []
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(ids), size=min(samples, len(ids)), replace=False)
+    queries = vectors[rows] + noise * rng.standard_normal((len(rows), vectors.shape[1])).astype(np.float32)
+    k = min(k, len(ids))
+
+    if isinstance(collection, FlatVectorStore):
+        space = "cosine"
+        settings = [("quantization", collection.quantization)]
+    else:
+        hnsw = (collection.configuration or {}).get("hnsw") or {}
+        space = hnsw.get("space", "l2")
+        original_ef = hnsw.get("ef_search")
+        settings = [("ef_search", ef) for ef in (ef_values or [original_ef])]
+
+    truth = [set(ids[row] for row in top) for top in _exact_neighbors(vectors, queries, k, space)]
+    report = []
+    try:
+        for setting, value in settings:
+            if setting == "ef_search" and value is not None:
+                collection.modify(configuration={"hnsw": {"ef_search": int(value)}})
+            latencies = []
+            recalls = []
+            for query, relevant in zip(queries, truth):
+                started = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()], n_results=k)["ids"][0]
+                latencies.append(time.perf_counter() - started)
+                recalls.append(len(relevant.intersection(found)) / k)
+            report.append({
+                "space": space,
+                setting: value,
+                "k": k,
+                "queries": len(queries),
+                f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50) * 1000), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99) * 1000), 3),
+            })
+    finally:
+        if not isinstance(collection, FlatVectorStore) and original_ef is not None:
+            collection.modify(configuration={"hnsw": {"ef_search": original_ef}})
+    return report
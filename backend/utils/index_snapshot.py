@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.flat_index import FlatVectorStore, ProjectIndex, write_project_index
+from utils.retrieval_cache import retrieval_cache
+
+SNAPSHOT_FORMAT_VERSION = 1
+_RESTORE_BATCH_SIZE = 1000
+
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_all(archive, path):
+    """
+    Extract a snapshot archive into path. Python versions without extraction filters
+    (before 3.11.4) get the same guarantee from a check that every member is a plain
+    file or directory inside path.
+    """
+    if hasattr(tarfile, "data_filter"):
+        archive.extractall(path, filter="data")
+        return
+    root = os.path.realpath(path)
+    for member in archive.getmembers():
+        target = os.path.realpath(os.path.join(root, member.name))
+        if not (member.isfile() or member.isdir()) or os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Unsafe snapshot member: {member.name}")
+    archive.extractall(path)
+
+
+def _read_project(collection, project_id):
+    """
+    Read a project's ids, documents, metadatas and vectors in one consistent read.
+    Flat indexes are read from their immutable current version; ChromaDB is read
+    with a single get() so the rows come from one point in time.
+    """
+    if isinstance(collection, FlatVectorStore):
+        index = collection.load(project_id)
+        if index is None:
+            return [], [], [], np.zeros((0, 0), dtype=np.float32)
+        rows = range(len(index))
+        return (
+            [str(chunk_id) for chunk_id in index.ids],
+            [index.document(row) for row in rows],
+            [index.metadata(row) for row in rows],
+            np.asarray(index.vectors),
+        )
+    result = collection.get(where={"project_id": project_id}, include=["documents", "metadatas", "embeddings"])
+    return result["ids"], result["documents"], result["metadatas"], np.asarray(result["embeddings"], dtype=np.float32)
+
+
+def snapshot_project(collection, project_id, snapshot_path):
+    """
+    Write a compressed, self-describing snapshot of one project's vector index.
+
+    The archive holds the flat index layout (vectors, int8 codes, id/metadata columns
+    and the document blob) plus a manifest with row count and checksums, so it can be
+    restored on another node without re-embedding anything.
+
+    Args:
+        collection: ChromaDB collection or FlatVectorStore holding the project
+        project_id: Project to snapshot
+        snapshot_path: Destination .tar.gz file
+
+    Returns:
+        dict: The snapshot manifest
+    """
+    ids, documents, metadatas, vectors = _read_project(collection, project_id)
+    if not ids:
+        raise ValueError(f"No indexed chunks found for project {project_id}")
+
+    workdir = tempfile.mkdtemp(prefix="snapshot-")
+    try:
+        index_dir = os.path.join(workdir, "index")
+        write_project_index(index_dir, ids, documents, metadatas, vectors)
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "project_id": project_id,
+            "count": len(ids),
+            "dim": int(vectors.shape[1]),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "files": {name: _sha256(os.path.join(index_dir, name)) for name in sorted(os.listdir(index_dir))},
+        }
+        with open(os.path.join(workdir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        partial_path = f"{snapshot_path}.partial"
+        with tarfile.open(partial_path, "w:gz") as archive:
+            archive.add(os.path.join(workdir, "manifest.json"), arcname="manifest.json")
+            archive.add(index_dir, arcname="index")
+        os.replace(partial_path, snapshot_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Snapshot of project {project_id}: {manifest['count']} chunks -> {snapshot_path}")
+    return manifest
+
+
+def restore_project(collection, lexical_index, snapshot_path, project_id=None, topic_centroids=None,
+                    near_duplicates=None):
+    """
+    Restore a project from a snapshot, replacing whatever the node holds for it.
+
+    On the flat backend the unpacked index directory becomes the project's current
+    version as-is and is memory-mapped on first query. On ChromaDB the stored vectors
+    are upserted directly. Either way the lexical index (and topic centroids and
+    near-duplicate signatures, when given) are rebuilt for the project and this
+    process's cached retrieval results are invalidated. Other processes (the API)
+    only learn about the restore through DatabaseClient.log_vector_index_change().
+
+    Args:
+        collection: ChromaDB collection or FlatVectorStore to restore into
+        lexical_index: LexicalIndex kept in sync with the vector store
+        snapshot_path: Snapshot .tar.gz file
+        project_id: Restore under a different project id (defaults to the snapshot's)
+        topic_centroids: TopicCentroids to recompute for the project
+        near_duplicates: NearDuplicateIndex whose links and signatures are reset to the restored chunks
+
+    Returns:
+        dict: The snapshot manifest
+    """
+    workdir = tempfile.mkdtemp(prefix="restore-")
+    try:
+        with tarfile.open(snapshot_path, "r:gz") as archive:
+            _extract_all(archive, workdir)
+        with open(os.path.join(workdir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+
+        index_dir = os.path.join(workdir, "index")
+        for name, checksum in manifest["files"].items():
+            if _sha256(os.path.join(index_dir, name)) != checksum:
+                raise ValueError(f"Snapshot file {name} failed checksum verification")
+
+        project_id = project_id or manifest["project_id"]
+        index = ProjectIndex(project_id, index_dir)
+        rows = range(len(index))
+        ids = [str(chunk_id) for chunk_id in index.ids]
+        documents = [index.document(row) for row in rows]
+        metadatas = [{**index.metadata(row), "project_id": project_id} for row in rows]
+        if topic_centroids is not None:
+            topic_centroids.delete_project(project_id)
+            topic_centroids.add(metadatas, np.asarray(index.vectors))
+
+        if isinstance(collection, FlatVectorStore):
+            del index
+            collection.install_project(project_id, index_dir)
+        else:
+            if project_id != manifest["project_id"]:
+                # Chroma ids are collection-wide, so a copy must not reuse the source's ids
+                ids = [f"{project_id}:{chunk_id}" for chunk_id in ids]
+            collection.delete(where={"project_id": project_id})
+            for start in range(0, len(ids), _RESTORE_BATCH_SIZE):
+                end = start + _RESTORE_BATCH_SIZE
+                collection.upsert(
+                    ids=ids[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    embeddings=np.asarray(index.vectors[start:end])
+                )
+
+        lexical_index.delete_project(project_id)
+        lexical_index.add(ids, documents, metadatas)
+        if near_duplicates is not None:
+            near_duplicates.reset_project(project_id, ids, documents)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    retrieval_cache.bump_generation(project_id)
+    print(f"Restored project {project_id}: {manifest['count']} chunks from {snapshot_path}")
+    return manifest
@@ -0,0 +1,252 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from config import Config
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "of", "on", "or", "that", "the", "this", "to",
+    "was", "what", "when", "where", "which", "who", "why", "with", "you",
+}
+
+
+def fts_phrase(value) -> str:
+    """A value as the body of a quoted FTS5 phrase."""
+    return str(value).replace('"', '""')
+
+
+def query_terms(text: str, max_terms: int = 32) -> list:
+    """Distinct lowercase word tokens of free text, in order, at most max_terms."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in terms:
+            terms.append(token)
+        if len(terms) >= max_terms:
+            break
+    return terms
+
+
+def build_match_query(text: str, max_terms: int = 32, skip_stopwords: bool = False) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every term is quoted so user input can never be parsed as FTS5 syntax,
+    and terms are OR-ed so BM25 ranks chunks by how many of them they contain.
+
+    Args:
+        text: Raw user query
+        max_terms: Maximum number of distinct terms to keep
+        skip_stopwords: Leave out STOPWORDS unless the text has nothing else. They
+            match nearly every document, which FTS5 has to walk through
+
+    Returns:
+        str: MATCH expression, or an empty string when the text has no terms
+    """
+    terms = query_terms(text, max_terms)
+    if skip_stopwords:
+        terms = [term for term in terms if term not in STOPWORDS] or terms
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def rank_highlighted(documents, total_documents: int, k1: float = 1.2, b: float = 0.75) -> list:
+    """
+    Rank FTS5 matches with BM25 whose statistics come from the matches themselves.
+
+    FTS5's bm25() walks the whole index's list of documents for every query term to
+    count them, which takes longer the more common the term is across all users. Here
+    term frequencies are read from the markers highlight(..., char(1), char(2)) puts
+    around matched tokens and document frequencies are counted over the given matches,
+    so the cost depends only on how many matches there are. A matched token counts as
+    its lowercased surface form, so "plant" and "plants" (both matching the stem) are
+    scored as different terms.
+
+    Args:
+        documents: (key, text) pairs, text from highlight(..., char(1), char(2))
+        total_documents: Documents searched (the matches are a subset of them)
+        k1: Term frequency saturation
+        b: Document length normalization
+
+    Returns:
+        list: (key, score) pairs, best first; ties keep the order of documents
+    """
+    parsed = []
+    frequencies = Counter()
+    for key, text in documents:
+        text = (text or "").lower()
+        counts = Counter(marked[:marked.find("\x02")] for marked in text.split("\x01")[1:])
+        frequencies.update(counts.keys())
+        # Spaces approximate the tokenizer's document length
+        parsed.append((key, counts, text.count(" ") + 1))
+    if not parsed:
+        return []
+
+    total_documents = max(total_documents, len(parsed))
+    average_length = sum(length for _, _, length in parsed) / len(parsed)
+    idf = {
+        token: math.log((total_documents - frequency + 0.5) / (frequency + 0.5) + 1)
+        for token, frequency in frequencies.items()
+    }
+    scored = []
+    for key, counts, length in parsed:
+        norm = k1 * (1 - b + b * length / average_length)
+        score = sum(idf[token] * count * (k1 + 1) / (count + norm) for token, count in counts.items())
+        scored.append((key, score))
+    scored.sort(key=lambda hit: -hit[1])
+    return scored
+
+
+_CHUNKS_FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+        chunk_id UNINDEXED,
+        project_id,
+        conversation_id,
+        topic UNINDEXED,
+        content,
+        tokenize = 'porter unicode61'
+    );
+"""
+# Only content counts towards BM25; project_id and conversation_id are matched to scope the search
+_CONTENT_RANK = "bm25(chunks_fts, 0.0, 0.0, 0.0, 0.0, 1.0)"
+
+
+class LexicalIndex:
+    """
+    SQLite FTS5 index over chunk text, ranked with BM25.
+    Complements the vector index with exact term matches (formula names, dates, ...).
+
+    project_id and conversation_id are indexed columns, so a scoped search is matched
+    inside the index and never ranks other projects' chunks.
+    """
+    def __init__(self, db_file: str = Config.LEXICAL_INDEX_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        conn = self._get_connection()
+        with conn:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+            if row and "project_id UNINDEXED" in row[0]:
+                # Indexes created before the scope columns were indexed: copy them into the new layout
+                print("Rebuilding lexical index with indexed project_id and conversation_id")
+                conn.execute("BEGIN")
+                conn.execute("ALTER TABLE chunks_fts RENAME TO chunks_fts_unindexed")
+                conn.execute(_CHUNKS_FTS_SCHEMA)
+                conn.execute(
+                    """
+                    INSERT INTO chunks_fts (chunk_id, project_id, conversation_id, topic, content)
+                    SELECT chunk_id, project_id, conversation_id, topic, content FROM chunks_fts_unindexed
+                    """
+                )
+                conn.execute("DROP TABLE chunks_fts_unindexed")
+            else:
+                conn.execute(_CHUNKS_FTS_SCHEMA)
+
+    def _get_connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self) -> int:
+        """Number of chunks in the index."""
+        row = self._get_connection().execute("SELECT COUNT(*) FROM chunks_fts").fetchone()
+        return row[0]
+
+    def clear(self):
+        """Remove every chunk from the index."""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("DELETE FROM chunks_fts")
+
+    def delete_project(self, project_id):
+        """Remove every chunk of a project."""
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM chunks_fts WHERE chunks_fts MATCH ? AND project_id = ?",
+                (f'project_id : "{fts_phrase(project_id)}"', project_id)
+            )
+
+    def add(self, ids, documents, metadatas):
+        """
+        Add chunks to the index. Arguments mirror ChromaDB's collection.add.
+        """
+        rows = []
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            rows.append((
+                chunk_id,
+                metadata.get("project_id"),
+                metadata.get("conversation_id"),
+                metadata.get("topic"),
+                document,
+            ))
+        conn = self._get_connection()
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO chunks_fts (chunk_id, project_id, conversation_id, topic, content)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                rows
+            )
+
+    def search(self, query: str, n_results: int = 5, project_id=None, conversation_id=None):
+        """
+        BM25 search over chunk text.
+
+        Args:
+            query: User query
+            n_results: Maximum number of hits
+            project_id: Restrict hits to this project
+            conversation_id: Restrict hits to this conversation
+
+        Returns:
+            list: (chunk_id, document) tuples, best match first
+        """
+        match_query = build_match_query(query, skip_stopwords=True)
+        if not match_query:
+            return []
+
+        # The scope is matched inside the index; the exact comparisons guard against
+        # tokenizer case folding and ids that contain another id as a phrase
+        match = [f"content : ({match_query})"]
+        sql = "SELECT chunk_id, content FROM chunks_fts WHERE chunks_fts MATCH ?"
+        params = []
+        if project_id:
+            match.append(f'project_id : "{fts_phrase(project_id)}"')
+            sql += " AND project_id = ?"
+            params.append(project_id)
+        if conversation_id:
+            match.append(f'conversation_id : "{fts_phrase(conversation_id)}"')
+            sql += " AND conversation_id = ?"
+            params.append(conversation_id)
+        sql += f" ORDER BY {_CONTENT_RANK} LIMIT ?"
+        params = [" AND ".join(match)] + params + [n_results]
+
+        return self._get_connection().execute(sql, params).fetchall()
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = 60):
+    """
+    Fuse several ranked hit lists with reciprocal-rank fusion.
+
+    Args:
+        ranked_lists: Lists of (chunk_id, document) tuples, best match first
+        k: RRF damping constant; larger values flatten the rank weighting
+
+    Returns:
+        list: (chunk_id, document) tuples ordered by fused score
+    """
+    scores = {}
+    documents = {}
+    for hits in ranked_lists:
+        for rank, (chunk_id, document) in enumerate(hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(chunk_id, document)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [(chunk_id, documents[chunk_id]) for chunk_id in ordered]
@@ -0,0 +1,494 @@
+"""
+Versioned schema migrations for the application database.
+
+Every migration runs once, in version order, inside its own transaction, and is
+recorded in schema_migrations. Add new schema changes by appending a migration;
+never edit one that has shipped.
+"""
+import json
+
+from utils.compression import ContentCompressor
+from utils.queries import HOT_QUERIES
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    Key under which a project stores a topic: case- and whitespace-insensitive.
+    Stored keys depend on it, so changing it needs a migration that rewrites them.
+    """
+    return " ".join(topic.split()).casefold()
+
+
+def searchable_text(content) -> str:
+    """
+    Text of generated interactive content as indexed for search: every non-empty
+    string value of its JSON, in document order. Index rows depend on it, so
+    changing it needs a migration that rebuilds interactive_content_fts.
+    """
+    parts = []
+    pending = [content]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, str):
+            if value.strip():
+                parts.append(value.strip())
+        elif isinstance(value, dict):
+            pending.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            pending.extend(reversed(value))
+    return "\n".join(parts)
+
+
+def _create_base_tables(cursor):
+    # topics now uses project_id instead of conversation_id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS topics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id TEXT NOT NULL,
+            topics_json TEXT NOT NULL,
+            user_id TEXT,
+            UNIQUE(project_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id TEXT PRIMARY KEY,
+            title TEXT,
+            user_id TEXT,
+            project_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            message_type TEXT NOT NULL CHECK (message_type IN ('user', 'assistant')),
+            message_content TEXT NOT NULL,
+            user_id TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS interactive_content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            interact_id TEXT NOT NULL,
+            project_id TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            content_json TEXT NOT NULL,
+            topics_used TEXT NOT NULL,
+            user_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT,
+            email_verified BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS projects (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sources (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            project_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            content TEXT,
+            url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS interactive_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            project_id TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            topics TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def _columns(cursor, table):
+    if getattr(cursor, "dialect", "sqlite") == "postgres":
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = ?",
+            (table,)
+        )
+        return [col[0] for col in cursor.fetchall()]
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in cursor.fetchall()]
+
+
+def _add_isolation_columns(cursor):
+    """
+    Add user_id columns for user data isolation and project_id to conversations,
+    for databases created before those columns were part of the base tables.
+    """
+    for table in ("topics", "conversations", "chat_messages", "interactive_content"):
+        if "user_id" not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN user_id TEXT")
+            print(f"Added user_id column to {table} table")
+    if "project_id" not in _columns(cursor, "conversations"):
+        cursor.execute("ALTER TABLE conversations ADD COLUMN project_id TEXT")
+        print("Added project_id column to conversations table")
+
+
+def _add_access_path_indexes(cursor):
+    """Composite indexes matching the WHERE + ORDER BY of the DatabaseClient read paths."""
+    # read_chat_messages: conversation_id + user_id ORDER BY timestamp
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+        ON chat_messages (conversation_id, user_id, timestamp)
+    """)
+    # read_interactive_content: interact_id (+ user_id)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_interactive_content_interact
+        ON interactive_content (interact_id, user_id)
+    """)
+    # read_interactive_history: user_id + project_id ORDER BY created_at DESC
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_interactive_history_project
+        ON interactive_history (user_id, project_id, created_at)
+    """)
+    # list_sources: user_id + project_id ORDER BY created_at DESC
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sources_project
+        ON sources (user_id, project_id, created_at)
+    """)
+    # get_user_conversations: user_id (+ project_id) ORDER BY updated_at DESC
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_user
+        ON conversations (user_id, project_id, updated_at)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+        ON conversations (user_id, updated_at)
+    """)
+    # list_projects: user_id ORDER BY last_accessed_at DESC
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_projects_user
+        ON projects (user_id, last_accessed_at)
+    """)
+
+
+def _link_history_to_content(cursor):
+    """
+    Store interact_id on interactive_history rows. Existing rows are backfilled from
+    the content row of the same user, project and type created closest in time (at
+    most a few seconds apart), which also recovers rows whose two inserts landed in
+    different seconds.
+    """
+    if "interact_id" not in _columns(cursor, "interactive_history"):
+        cursor.execute("ALTER TABLE interactive_history ADD COLUMN interact_id TEXT")
+    # Only the backfill join needs this index; later reads go by interact_id
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_interactive_content_backfill
+        ON interactive_content (user_id, project_id, content_type, created_at)
+    """)
+    cursor.execute("""
+        UPDATE interactive_history
+        SET interact_id = nearest.interact_id
+        FROM (
+            SELECT h.id AS history_id, c.interact_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY h.id
+                       ORDER BY ABS(julianday(c.created_at) - julianday(h.created_at)), c.id
+                   ) AS rank
+            FROM interactive_history h
+            JOIN interactive_content c ON
+                c.user_id = h.user_id AND c.project_id = h.project_id AND c.content_type = h.content_type
+            WHERE h.interact_id IS NULL
+              AND ABS(julianday(c.created_at) - julianday(h.created_at)) * 86400 <= 5
+        ) AS nearest
+        WHERE nearest.history_id = interactive_history.id AND nearest.rank = 1
+    """)
+    print(f"Linked {cursor.rowcount} interactive history rows to their content")
+    cursor.execute("DROP INDEX idx_interactive_content_backfill")
+
+
+# Starting dictionaries: the JSON skeletons the generation prompts ask for
+_SEED_DICTIONARIES = {
+    "quiz": '{"title": "", "theme": "", "description": "", "questions": [{"id": 1, "type": "multiple_choice", '
+            '"subtype": "", "question": "", "statement": "", "sentence": "", "options": [], "answer": "", '
+            '"correct_answer": "", "hint": "", "explanation": "", "animation": "", "pairs": [{"left": "", "right": ""}]}]}',
+    "timeline": '{"title": "", "theme": "", "description": "", "eras": [{"id": 1, "name": "", "title": "", '
+                '"description": ""}], "events": [{"id": 1, "date": "", "title": "", "description": "", '
+                '"category": "", "importance": ""}]}',
+    "mindmap": '{"title": "", "theme": "", "levels": 3, "nodes": [{"id": "", "label": "", "parent": "", '
+               '"level": 1, "description": ""}, {"id": "", "label": "", "parent": "", "level": 2, "description": ""}]}',
+    "flashcard": '{"title": "", "theme": "", "description": "", "cards": [{"id": 1, "front": "", "back": "", '
+                 '"hint": "", "difficulty": "medium", "tags": []}]}',
+    "source": " the of and to in is that for it as with was on are be by this which or from an at",
+}
+
+
+def _add_compression_dictionaries(cursor):
+    """Preset dictionaries for compressed interactive content and source text."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS compression_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_type TEXT NOT NULL,
+            dictionary BLOB NOT NULL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.executemany(
+        "INSERT INTO compression_dictionaries (content_type, dictionary) VALUES (?, ?)",
+        [(content_type, dictionary.encode("utf-8")) for content_type, dictionary in _SEED_DICTIONARIES.items()]
+    )
+
+
+def _add_project_topics(cursor):
+    """One row per project topic with its chunk count, backfilled from topics.topics_json."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS project_topics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id TEXT NOT NULL,
+            user_id TEXT,
+            normalized_topic TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(project_id, normalized_topic)
+        )
+    """)
+    # (project_id, rowid) order: a project's topics in the order they were first seen
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_topics_project ON project_topics (project_id)")
+    rows = cursor.execute("SELECT project_id, topics_json, user_id FROM topics").fetchall()
+    for project_id, topics_json, user_id in rows:
+        cursor.executemany(
+            """
+            INSERT INTO project_topics (project_id, user_id, normalized_topic, topic)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(project_id, normalized_topic) DO NOTHING
+            """,
+            [(project_id, user_id, normalize_topic(topic), topic.strip())
+             for topic in json.loads(topics_json) if topic and topic.strip()]
+        )
+    print(f"Copied topics of {len(rows)} projects into project_topics")
+
+
+def _add_cache_invalidations(cursor):
+    """Log of cache keys changed by writers, polled by every worker's read cache."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            namespace TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _add_conversation_archival(cursor):
+    """archived_at marks conversations whose messages live in the archive database."""
+    if "archived_at" not in _columns(cursor, "conversations"):
+        cursor.execute("ALTER TABLE conversations ADD COLUMN archived_at TIMESTAMP")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)")
+
+
+def _add_full_text_search(cursor):
+    """
+    Full-text indexes for searching a user's history. Chat messages get an FTS5
+    external-content index kept in sync by triggers. Interactive content is stored
+    compressed, so its text is indexed in its own FTS5 table, written by
+    DatabaseClient next to every content row and backfilled here.
+    user_id (and project_id) are indexed columns so searches are scoped inside the
+    index instead of filtering every match afterwards.
+    """
+    if getattr(cursor, "dialect", "sqlite") == "postgres":
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_search
+            ON chat_messages USING GIN (to_tsvector('english', message_content))
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_interactive_content_search
+            ON interactive_content USING GIN (to_tsvector('english', content_json))
+        """)
+        return
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+            message_content,
+            user_id,
+            content = 'chat_messages',
+            content_rowid = 'id',
+            tokenize = 'porter unicode61'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (rowid, message_content, user_id)
+            VALUES (new.id, new.message_content, new.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, message_content, user_id)
+            VALUES ('delete', old.id, old.message_content, old.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, message_content, user_id)
+            VALUES ('delete', old.id, old.message_content, old.user_id);
+            INSERT INTO chat_messages_fts (rowid, message_content, user_id)
+            VALUES (new.id, new.message_content, new.user_id);
+        END
+    """)
+    cursor.execute("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')")
+
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS interactive_content_fts USING fts5(
+            body,
+            user_id,
+            project_id,
+            interact_id UNINDEXED,
+            content_type UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+    """)
+    compressor = ContentCompressor(enabled=True)
+    compressor.load(cursor)
+    last_id, indexed = 0, 0
+    while True:
+        rows = cursor.execute(
+            "SELECT id, content_json, user_id, project_id, interact_id, content_type FROM interactive_content "
+            "WHERE id > ? ORDER BY id LIMIT 500",
+            (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        cursor.executemany(
+            """
+            INSERT INTO interactive_content_fts (rowid, body, user_id, project_id, interact_id, content_type)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(row_id, searchable_text(json.loads(compressor.decompress(content_json))), user_id, project_id,
+              interact_id, content_type)
+             for row_id, content_json, user_id, project_id, interact_id, content_type in rows]
+        )
+        indexed += len(rows)
+    print(f"Indexed {indexed} interactive content rows for search")
+
+
+def _drop_history_join_index(cursor):
+    """
+    Earlier versions of migration 3 created an index on interactive_content
+    (user_id, project_id, content_type, created_at) for the history read's
+    timestamp join. interactive_history rows carry their interact_id since
+    migration 4, so databases migrated with it only pay for it on content writes.
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_interactive_content_history")
+
+
+# (version, description, step); append only
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "user_id and project_id isolation columns", _add_isolation_columns),
+    (3, "composite indexes for hot read paths", _add_access_path_indexes),
+    (4, "interact_id on interactive_history", _link_history_to_content),
+    (5, "compression dictionaries", _add_compression_dictionaries),
+    (6, "row-per-topic project_topics", _add_project_topics),
+    (7, "cache invalidation log", _add_cache_invalidations),
+    (8, "conversation archival marker", _add_conversation_archival),
+    (9, "full-text search over chat messages and interactive content", _add_full_text_search),
+    (10, "drop unused interactive content history index", _drop_history_join_index),
+]
+
+
+def applied_versions(conn):
+    """Versions already recorded in schema_migrations."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def apply_migrations(conn):
+    """
+    Apply every pending migration, each in its own transaction.
+
+    Concurrent workers starting at the same time are safe: the version check and the
+    step run under BEGIN IMMEDIATE (a table lock on Postgres), so a second worker
+    waits and then skips it.
+
+    Args:
+        conn: sqlite3 connection, or a Postgres connection from utils.db_backends
+
+    Returns:
+        list: Versions applied by this call
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    applied = []
+    try:
+        applied_versions(conn)
+        for version, description, step in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if getattr(conn, "dialect", "sqlite") == "postgres":
+                    conn.execute("LOCK TABLE schema_migrations IN EXCLUSIVE MODE")
+                if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                    conn.execute("COMMIT")
+                    continue
+                step(conn.cursor())
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (?, ?)", (version, description)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            print(f"Applied migration {version}: {description}")
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def check_query_plans(conn, queries=None):
+    """
+    EXPLAIN QUERY PLAN every hot query and report the ones that regressed.
+
+    A plan step fails when it scans a table instead of searching an index, or sorts
+    with a temporary B-tree instead of reading rows in index order.
+
+    Args:
+        conn: sqlite3 connection to a migrated database
+        queries: Mapping of name -> (sql, params); defaults to HOT_QUERIES
+
+    Returns:
+        dict: name -> list of offending plan steps (empty lists for good plans)
+    """
+    problems = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        steps = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        problems[name] = [
+            step for step in steps
+            if (step.startswith("SCAN ") and " USING " not in step) or "TEMP B-TREE" in step
+        ]
+    return problems
@@ -0,0 +1,281 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from config import Config
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = (1 << 31) - 1
+
+
+def _shingle_hashes(text: str, size: int) -> np.ndarray:
+    """crc32 of every word n-gram in the text (one shingle for texts shorter than n words)."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) <= size:
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return np.unique(np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint64))
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of chunk text, scoped per project.
+
+    Each stored chunk gets a MinHash signature over its word shingles, split into
+    LSH bands. A new chunk whose bands collide with a stored chunk and whose
+    estimated Jaccard similarity clears the threshold is a near-duplicate: it is
+    not embedded or stored again, only linked to the chunk it duplicates.
+    """
+    def __init__(self, db_file: str = Config.DEDUP_INDEX_FILE,
+                 threshold: float = Config.DEDUP_THRESHOLD,
+                 num_perm: int = 128, bands: int = 16, shingle_size: int = 5):
+        self.db_file = db_file
+        self.threshold = threshold
+        self.bands = bands
+        self.shingle_size = shingle_size
+        # Fixed seed: signatures are persisted and must be comparable across processes
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self._local = threading.local()
+        conn = self._get_connection()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_minhash (
+                chunk_id TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS minhash_buckets (
+                project_id TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_minhash_buckets ON minhash_buckets (project_id, band, bucket);
+            CREATE TABLE IF NOT EXISTS chunk_duplicates (
+                chunk_id TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                conversation_id TEXT,
+                topic TEXT,
+                canonical_id TEXT NOT NULL,
+                similarity REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunk_duplicates_topic ON chunk_duplicates (project_id, topic);
+            CREATE TABLE IF NOT EXISTS dedup_stats (
+                project_id TEXT PRIMARY KEY,
+                chunks_seen INTEGER NOT NULL,
+                duplicates INTEGER NOT NULL
+            );
+            """
+        )
+        conn.commit()
+
+    def _get_connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (one uint32 minimum per permutation) of the text's shingles."""
+        hashes = _shingle_hashes(text, self.shingle_size)
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray):
+        """(band, bucket) pairs; chunks sharing any pair are duplicate candidates."""
+        return [
+            (band, int.from_bytes(hashlib.blake2b(rows.tobytes(), digest_size=7).digest(), "big"))
+            for band, rows in enumerate(np.array_split(signature, self.bands))
+        ]
+
+    def session(self, project_id):
+        """Start a NearDuplicateSession for one indexing run."""
+        return NearDuplicateSession(self, project_id or "")
+
+    def reset_project(self, project_id, ids, documents):
+        """
+        Replace a project's signatures with those of the given chunks and drop its
+        duplicate links and counts, e.g. after its index was restored from a snapshot
+        (links would otherwise point at chunks the restored index may not hold).
+        """
+        project_id = project_id or ""
+        conn = self._get_connection()
+        with conn:
+            for table in ("chunk_minhash", "minhash_buckets", "chunk_duplicates", "dedup_stats"):
+                conn.execute(f"DELETE FROM {table} WHERE project_id = ?", (project_id,))
+        session = self.session(project_id)
+        session.commit({
+            "ids": list(ids),
+            "signatures": [self.signature(document) for document in documents],
+            "duplicates": [],
+        })
+
+    def linked_chunk_ids(self, project_id, topics):
+        """
+        Ids of the stored chunks that skipped duplicates with one of these topics point to,
+        so topic-based retrieval still sees the text of chunks that were not stored again.
+        """
+        topics = list(topics)
+        if not topics:
+            return []
+        placeholders = ", ".join("?" for _ in topics)
+        rows = self._get_connection().execute(
+            f"SELECT DISTINCT canonical_id FROM chunk_duplicates WHERE project_id = ? AND topic IN ({placeholders})",
+            [project_id or ""] + topics
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self, project_ids=None, limit: int = 20) -> dict:
+        """
+        Dedup ratio overall and per project (the projects with most duplicates).
+        With project_ids, both the totals and the per-project rows only cover those
+        projects, e.g. the ones the caller owns.
+        """
+        conn = self._get_connection()
+        where, params = "", []
+        if project_ids is not None:
+            project_ids = list(project_ids)
+            if not project_ids:
+                return {"chunks_seen": 0, "duplicates": 0, "dedup_ratio": 0.0, "projects": []}
+            where = f"WHERE project_id IN ({', '.join('?' for _ in project_ids)})"
+            params = project_ids
+        seen, duplicates = conn.execute(
+            f"SELECT COALESCE(SUM(chunks_seen), 0), COALESCE(SUM(duplicates), 0) FROM dedup_stats {where}", params
+        ).fetchone()
+        rows = conn.execute(
+            f"SELECT project_id, chunks_seen, duplicates FROM dedup_stats {where} ORDER BY duplicates DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return {
+            "chunks_seen": seen,
+            "duplicates": duplicates,
+            "dedup_ratio": duplicates / seen if seen else 0.0,
+            "projects": [
+                {"project_id": pid, "chunks_seen": s, "duplicates": d, "dedup_ratio": d / s if s else 0.0}
+                for pid, s, d in rows
+            ],
+        }
+
+
+class NearDuplicateSession:
+    """
+    Near-duplicate filtering for one indexing stream.
+
+    filter() runs before a batch is embedded and drops chunks that duplicate a stored
+    chunk or an earlier chunk of the same stream; commit() runs after the batch was
+    written and records signatures, links and counts. Chunks of batches that are
+    filtered but not yet committed are tracked in memory so that consecutive batches
+    in the pipeline are still compared with each other.
+    """
+    def __init__(self, index: NearDuplicateIndex, project_id: str):
+        self.index = index
+        self.project_id = project_id
+        # filter() runs on the embedder thread and commit() on the writer thread
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def _stored_candidates(self, keys):
+        values = ", ".join("(?, ?)" for _ in keys)
+        params = [self.project_id] + [value for key in keys for value in key]
+        rows = self.index._get_connection().execute(
+            f"""
+            SELECT DISTINCT m.chunk_id, m.signature
+            FROM minhash_buckets b JOIN chunk_minhash m ON m.chunk_id = b.chunk_id
+            WHERE b.project_id = ? AND (b.band, b.bucket) IN (VALUES {values})
+            """,
+            params
+        ).fetchall()
+        return [(chunk_id, np.frombuffer(blob, dtype=np.uint32)) for chunk_id, blob in rows]
+
+    def filter(self, batch):
+        """
+        Remove near-duplicates from a batch in place.
+
+        The batch keeps its "ids", "documents" and "metadatas" for the chunks to store
+        and gains "signatures" for them plus "duplicates" as (chunk_id, metadata,
+        canonical_id, similarity) tuples for the chunks that were dropped.
+        """
+        kept = {"ids": [], "documents": [], "metadatas": [], "signatures": []}
+        duplicates = []
+        for chunk_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            signature = self.index.signature(document)
+            keys = self.index.band_keys(signature)
+            candidates = self._stored_candidates(keys)
+            with self._lock:
+                for key in keys:
+                    candidates.extend(self._pending.get(key, []))
+
+            best_id, best_similarity = None, 0.0
+            for candidate_id, candidate_signature in candidates:
+                similarity = float(np.mean(candidate_signature == signature))
+                if similarity > best_similarity:
+                    best_id, best_similarity = candidate_id, similarity
+            if best_id is not None and best_similarity >= self.index.threshold:
+                duplicates.append((chunk_id, metadata, best_id, best_similarity))
+                continue
+
+            with self._lock:
+                for key in keys:
+                    self._pending.setdefault(key, []).append((chunk_id, signature))
+            kept["ids"].append(chunk_id)
+            kept["documents"].append(document)
+            kept["metadatas"].append(metadata)
+            kept["signatures"].append(signature)
+        batch.update(kept)
+        batch["duplicates"] = duplicates
+        return batch
+
+    def commit(self, batch):
+        """Persist signatures, bands, duplicate links and counts for a written batch."""
+        conn = self.index._get_connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_minhash (chunk_id, project_id, signature) VALUES (?, ?, ?)",
+                [(chunk_id, self.project_id, signature.tobytes())
+                 for chunk_id, signature in zip(batch["ids"], batch["signatures"])]
+            )
+            conn.executemany(
+                "INSERT INTO minhash_buckets (project_id, band, bucket, chunk_id) VALUES (?, ?, ?, ?)",
+                [(self.project_id, band, bucket, chunk_id)
+                 for chunk_id, signature in zip(batch["ids"], batch["signatures"])
+                 for band, bucket in self.index.band_keys(signature)]
+            )
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO chunk_duplicates
+                    (chunk_id, project_id, conversation_id, topic, canonical_id, similarity)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [(chunk_id, self.project_id, metadata.get("conversation_id"), metadata.get("topic"),
+                  canonical_id, similarity)
+                 for chunk_id, metadata, canonical_id, similarity in batch["duplicates"]]
+            )
+            conn.execute(
+                """
+                INSERT INTO dedup_stats (project_id, chunks_seen, duplicates) VALUES (?, ?, ?)
+                ON CONFLICT(project_id) DO UPDATE SET
+                    chunks_seen = chunks_seen + excluded.chunks_seen,
+                    duplicates = duplicates + excluded.duplicates
+                """,
+                (self.project_id, len(batch["ids"]) + len(batch["duplicates"]), len(batch["duplicates"]))
+            )
+        # Written chunks are found through the database from now on
+        written = set(batch["ids"])
+        with self._lock:
+            for key in list(self._pending):
+                rows = [row for row in self._pending[key] if row[0] not in written]
+                if rows:
+                    self._pending[key] = rows
+                else:
+                    del self._pending[key]
+        self.duplicates += len(batch["duplicates"])
@@ -0,0 +1,26 @@
+import base64
+import json
+
+
+def encode_cursor(key) -> str:
+    """Opaque page cursor for a row's sort key, e.g. (timestamp, id)."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    """
+    Sort key from a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or a key value is not a string or number
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid page cursor") from e
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError("Invalid page cursor")
+    # Key values are bound as SQL parameters; bool is an int but never a sort key
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float)) for value in key):
+        raise ValueError("Invalid page cursor")
+    return key
@@ -0,0 +1,101 @@
+# Hot DatabaseClient reads. DatabaseClient runs these exact statements and
+# check_query_plans() (db_admin.py check-plans, tests/test_query_plans.py) explains
+# them, so a plan regression in a statement that actually runs is caught before deploy.
+
+READ_CHAT_MESSAGES = (
+    "SELECT message_type, message_content, timestamp FROM chat_messages "
+    "WHERE conversation_id = ? AND user_id = ? ORDER BY timestamp ASC"
+)
+READ_INTERACTIVE_CONTENT = (
+    "SELECT content_type, content_json, topics_used, created_at FROM interactive_content "
+    "WHERE interact_id = ? AND user_id = ?"
+)
+READ_INTERACTIVE_HISTORY = (
+    "SELECT id, content_type, topics, created_at, interact_id FROM interactive_history "
+    "WHERE user_id = ? AND project_id = ? ORDER BY created_at DESC LIMIT ?"
+)
+LIST_SOURCES = (
+    "SELECT id, name, type, created_at FROM sources WHERE user_id = ? AND project_id = ? "
+    "ORDER BY created_at DESC"
+)
+USER_CONVERSATIONS = (
+    "SELECT conversation_id, title, created_at, updated_at FROM conversations "
+    "WHERE user_id = ? AND project_id = ? ORDER BY updated_at DESC"
+)
+USER_CONVERSATIONS_ALL_PROJECTS = (
+    "SELECT conversation_id, title, created_at, updated_at FROM conversations "
+    "WHERE user_id = ? ORDER BY updated_at DESC"
+)
+LIST_PROJECTS = (
+    "SELECT id, name, created_at, last_accessed_at FROM projects WHERE user_id = ? "
+    "ORDER BY last_accessed_at DESC"
+)
+GET_PROJECT = "SELECT id, name, created_at, last_accessed_at FROM projects WHERE id = ? AND user_id = ?"
+PROJECT_TOPIC_COUNTS = (
+    "SELECT topic, chunk_count FROM project_topics WHERE project_id = ? AND user_id = ? ORDER BY id"
+)
+
+# Keyset pages as (select, where, sort key columns), turned into SQL by keyset_page_sql()
+CHAT_MESSAGES_PAGE = (
+    "SELECT message_type, message_content, timestamp, id FROM chat_messages",
+    "conversation_id = ? AND user_id = ?",
+    ("timestamp", "id"),
+)
+USER_CONVERSATIONS_PAGE = (
+    "SELECT conversation_id, title, created_at, updated_at, rowid FROM conversations",
+    "user_id = ? AND project_id = ?",
+    ("updated_at", "rowid"),
+)
+USER_CONVERSATIONS_ALL_PROJECTS_PAGE = (
+    "SELECT conversation_id, title, created_at, updated_at, rowid FROM conversations",
+    "user_id = ?",
+    ("updated_at", "rowid"),
+)
+SOURCES_PAGE = (
+    "SELECT id, name, type, created_at, rowid FROM sources",
+    "user_id = ? AND project_id = ?",
+    ("created_at", "rowid"),
+)
+INTERACTIVE_HISTORY_PAGE = (
+    "SELECT id, content_type, topics, interact_id, created_at, id FROM interactive_history",
+    "user_id = ? AND project_id = ?",
+    ("created_at", "id"),
+)
+
+
+def keyset_page_sql(select, where, key_columns, after=False):
+    """
+    Statement for one keyset page, newest first. Its parameters are those of where,
+    then (with after) the two sort key values of the last row of the previous page,
+    then the row limit.
+    """
+    if after:
+        where = f"{where} AND ({key_columns[0]}, {key_columns[1]}) < (?, ?)"
+    return f"{select} WHERE {where} ORDER BY {key_columns[0]} DESC, {key_columns[1]} DESC LIMIT ?"
+
+
+def _page_queries(name, page, params):
+    """The first page and a later page of a keyset query, with sample parameters."""
+    return {
+        f"{name}_first": (keyset_page_sql(*page), params + (50,)),
+        name: (keyset_page_sql(*page, after=True), params + ("2025-01-01 00:00:00", 1, 50)),
+    }
+
+
+# Every hot statement with sample parameters, as explained by check_query_plans()
+HOT_QUERIES = {
+    "read_chat_messages": (READ_CHAT_MESSAGES, ("c", "u")),
+    "read_interactive_content": (READ_INTERACTIVE_CONTENT, ("i", "u")),
+    "read_interactive_history": (READ_INTERACTIVE_HISTORY, ("u", "p", 10)),
+    "list_sources": (LIST_SOURCES, ("u", "p")),
+    "get_user_conversations": (USER_CONVERSATIONS, ("u", "p")),
+    "get_user_conversations_all": (USER_CONVERSATIONS_ALL_PROJECTS, ("u",)),
+    "list_projects": (LIST_PROJECTS, ("u",)),
+    "get_project": (GET_PROJECT, ("p", "u")),
+    "read_project_topics": (PROJECT_TOPIC_COUNTS, ("p", "u")),
+    **_page_queries("read_chat_messages_page", CHAT_MESSAGES_PAGE, ("c", "u")),
+    **_page_queries("get_user_conversations_page", USER_CONVERSATIONS_PAGE, ("u", "p")),
+    **_page_queries("get_user_conversations_all_page", USER_CONVERSATIONS_ALL_PROJECTS_PAGE, ("u",)),
+    **_page_queries("list_sources_page", SOURCES_PAGE, ("u", "p")),
+    **_page_queries("read_interactive_history_page", INTERACTIVE_HISTORY_PAGE, ("u", "p")),
+}
@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class ReadThroughCache:
+    """
+    Bounded LRU + TTL cache in front of rarely-changing database reads.
+
+    Entries are grouped by (namespace, key), e.g. ("topics", project_id), with any
+    number of variants per key (e.g. the user_id filter); invalidating a key drops
+    all of its variants. Writers in this process invalidate directly. Writers in
+    other workers are seen through poll(), which returns the (namespace, key) pairs
+    invalidated since the last call and is run at most every poll_interval seconds
+    by lookups (also with the cache disabled) and by poll_invalidations(), so a
+    worker serves a value at most that long after another worker changed it (and
+    never longer than the TTL).
+    """
+    def __init__(self, max_entries: int = Config.READ_CACHE_SIZE,
+                 ttl_seconds: float = Config.READ_CACHE_TTL_SECONDS,
+                 poll=None, poll_interval: float = Config.READ_CACHE_POLL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict()
+        self._variants = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._next_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _drop(self, entry_key):
+        del self._entries[entry_key]
+        namespace, key, variant = entry_key
+        variants = self._variants[(namespace, key)]
+        variants.discard(variant)
+        if not variants:
+            del self._variants[(namespace, key)]
+
+    def poll_invalidations(self, force: bool = False):
+        """
+        Apply other workers' invalidations if poll_interval has passed (or force).
+        A poll already running on another thread is not waited for.
+        """
+        now = time.monotonic()
+        if self.poll is None or (now < self._next_poll and not force) or not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = now + self.poll_interval
+            for namespace, key in self.poll():
+                self.invalidate(namespace, key)
+        finally:
+            self._poll_lock.release()
+
+    def get_or_load(self, namespace, key, loader, variant=None):
+        """
+        Cached value of (namespace, key, variant), loading it with loader() on a miss.
+        Callers get their own copy, so mutating a result never changes the cache.
+        """
+        # Polled even when disabled: the log also carries invalidations for other caches
+        self.poll_invalidations()
+        if self.max_entries <= 0:
+            return loader()
+        entry_key = (namespace, key, variant)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                self._drop(entry_key)
+                self.expired += 1
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        with self._lock:
+            # An invalidation while loading means the value may predate that write
+            if generation == self._generation:
+                self._entries[entry_key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+                self._variants.setdefault((namespace, key), set()).add(variant)
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, namespace, key):
+        """Drop every cached variant of (namespace, key)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for variant in list(self._variants.get((namespace, key), ())):
+                self._drop((namespace, key, variant))
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._variants.clear()
+
+    def stats(self) -> dict:
+        """Hit ratio and counters since startup."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,159 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import Config
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used as a cache key (case, whitespace and trailing punctuation folded)."""
+    return _WHITESPACE_RE.sub(" ", query.lower()).strip().rstrip("?!. ")
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results keyed by (scope, normalized query).
+
+    Every project has a generation counter that the indexer bumps after new chunks
+    are written; entries stored under an older generation are treated as misses.
+    Generations live in this process only: with a publisher set, every bump is also
+    recorded for the other processes, which bump their own counters when they see it.
+    Optionally a query whose embedding is close enough to a cached query in the
+    same scope is served from that entry as well.
+    """
+    def __init__(self, max_entries: int = Config.RETRIEVAL_CACHE_SIZE,
+                 similarity_threshold: float = Config.RETRIEVAL_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._publisher = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def generation(self, project_id) -> int:
+        """Current generation of a project's index."""
+        with self._lock:
+            return self._generations.get(project_id, 0)
+
+    def set_publisher(self, publisher):
+        """
+        Call publisher(project_id) on every index change made in this process, e.g.
+        DatabaseClient.log_vector_index_change so other API workers invalidate too.
+        """
+        self._publisher = publisher
+
+    def bump_generation(self, project_id, publish: bool = True):
+        """
+        Invalidate every cached result for a project; call after its index changes.
+        publish=False only invalidates this process, for changes another process
+        already published.
+        """
+        with self._lock:
+            # Unscoped (project_id=None) searches also see the project's chunks
+            for key in {project_id, None}:
+                self._generations[key] = self._generations.get(key, 0) + 1
+        if publish and self._publisher is not None:
+            try:
+                self._publisher(project_id)
+            except Exception as e:
+                print(f"Could not publish index change for project {project_id}: {e}")
+
+    def _is_current(self, key, entry) -> bool:
+        project_id = key[0][0]
+        if entry["generation"] == self._generations.get(project_id, 0):
+            return True
+        del self._entries[key]
+        self.stale += 1
+        return False
+
+    def get(self, scope, query):
+        """
+        Exact lookup.
+
+        Args:
+            scope: Tuple whose first element is the project_id
+            query: Raw query text
+
+        Returns:
+            Cached value or None
+        """
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_current(key, entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+            return None
+
+    def get_similar(self, scope, embedding):
+        """
+        Near-duplicate lookup: return the value of the most similar cached query in
+        the same scope if its cosine similarity clears the threshold.
+        Counts a miss when nothing qualifies, so call it after get().
+        """
+        with self._lock:
+            if self.similarity_threshold:
+                candidates = [
+                    (key, entry) for key, entry in self._entries.items()
+                    if key[0] == scope and entry["embedding"] is not None
+                ]
+                if candidates:
+                    matrix = np.stack([entry["embedding"] for _, entry in candidates])
+                    query = embedding / (np.linalg.norm(embedding) or 1.0)
+                    similarities = matrix @ query
+                    best = int(np.argmax(similarities))
+                    key, entry = candidates[best]
+                    if similarities[best] >= self.similarity_threshold and self._is_current(key, entry):
+                        self._entries.move_to_end(key)
+                        self.near_hits += 1
+                        return entry["value"]
+            self.misses += 1
+            return None
+
+    def put(self, scope, query, value, generation, embedding=None):
+        """
+        Store a result computed against the given project generation.
+        The generation must be read before the search started so that an upload
+        landing mid-search does not leave a stale entry behind.
+        """
+        key = (scope, normalize_query(query))
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            if generation != self._generations.get(scope[0], 0):
+                return
+            self._entries[key] = {"value": value, "generation": generation, "embedding": embedding}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and ratios."""
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache shared by every Retriever and Indexer
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+from config import Config
+from utils.embeddings import normalize_rows
+
+
+class TopicCentroids:
+    """
+    Per-project, per-topic centroid embeddings, kept up to date at index time.
+
+    Each (project, topic) row stores the running sum of its chunks' normalized
+    embeddings and the chunk count, so new batches are folded in without rereading
+    old chunks. Queries are routed to the few topics whose centroids are closest,
+    and only those topics' chunks are searched.
+    """
+    def __init__(self, db_file: str = Config.TOPIC_CENTROID_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        conn = self._get_connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS topic_centroids (
+                project_id TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                vector_sum BLOB NOT NULL,
+                PRIMARY KEY (project_id, topic)
+            );
+            """
+        )
+        conn.commit()
+
+    def _get_connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _invalidate(self, project_ids):
+        with self._cache_lock:
+            for project_id in project_ids:
+                self._cache.pop(project_id or "", None)
+
+    def invalidate(self, project_id):
+        """Drop a project's cached centroids, e.g. after another process rewrote them."""
+        self._invalidate([project_id])
+
+    def count(self) -> int:
+        """Number of (project, topic) centroids."""
+        return self._get_connection().execute("SELECT COUNT(*) FROM topic_centroids").fetchone()[0]
+
+    def clear(self):
+        """Remove every centroid."""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("DELETE FROM topic_centroids")
+        with self._cache_lock:
+            self._cache.clear()
+
+    def delete_project(self, project_id):
+        """Remove every centroid of a project."""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("DELETE FROM topic_centroids WHERE project_id = ?", (project_id or "",))
+        self._invalidate([project_id])
+
+    def add(self, metadatas, embeddings):
+        """
+        Fold a batch of chunk embeddings into their topics' centroids.
+
+        Args:
+            metadatas: Chunk metadata dicts (project_id and topic are used)
+            embeddings: Chunk vectors, in the same order
+        """
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        groups = {}
+        for metadata, vector in zip(metadatas, vectors):
+            key = (metadata.get("project_id") or "", str(metadata.get("topic") or ""))
+            total, count = groups.get(key, (0.0, 0))
+            groups[key] = (total + vector, count + 1)
+
+        conn = self._get_connection()
+        with conn:
+            # Read-modify-write of the sums must not interleave with another writer
+            conn.execute("BEGIN IMMEDIATE")
+            for (project_id, topic), (total, count) in groups.items():
+                row = conn.execute(
+                    "SELECT chunk_count, vector_sum FROM topic_centroids WHERE project_id = ? AND topic = ?",
+                    (project_id, topic)
+                ).fetchone()
+                if row:
+                    count += row[0]
+                    total = total + np.frombuffer(row[1], dtype=np.float32)
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO topic_centroids (project_id, topic, chunk_count, vector_sum)
+                    VALUES (?, ?, ?, ?);
+                    """,
+                    (project_id, topic, count, np.asarray(total, dtype=np.float32).tobytes())
+                )
+        self._invalidate({project_id for project_id, _ in groups})
+
+    def _project_centroids(self, project_id):
+        """(topics, normalized centroid matrix, chunk counts) for a project, cached in memory."""
+        key = project_id or ""
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        rows = self._get_connection().execute(
+            "SELECT topic, chunk_count, vector_sum FROM topic_centroids WHERE project_id = ?", (key,)
+        ).fetchall()
+        if rows:
+            cached = (
+                [topic for topic, _, _ in rows],
+                normalize_rows(np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])),
+                np.array([count for _, count, _ in rows]),
+            )
+        else:
+            cached = ([], np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=int))
+        with self._cache_lock:
+            self._cache[key] = cached
+        return cached
+
+    def route(self, project_id, query_embeddings, n_results,
+              max_topics: int = Config.TOPIC_ROUTING_TOPICS,
+              min_chunks: int = Config.TOPIC_ROUTING_MIN_CHUNKS,
+              min_similarity: float = Config.TOPIC_ROUTING_MIN_SIMILARITY):
+        """
+        Pick the topics to search for each query.
+
+        Routing is skipped (None) for the whole project when it is small or has too
+        few topics for routing to save anything, and per query when the best centroid
+        is not similar enough or the chosen topics hold fewer than n_results chunks.
+
+        Args:
+            project_id: Project to route within
+            query_embeddings: Query vectors
+            n_results: Chunks the caller needs per query
+            max_topics: Topics searched per query
+            min_chunks: Projects smaller than this are always searched in full
+            min_similarity: Cosine similarity the best centroid must reach
+
+        Returns:
+            list: Per query, a list of topic names, or None to search the whole project
+        """
+        topics, centroids, counts = self._project_centroids(project_id)
+        if not max_topics or len(topics) <= max_topics or counts.sum() < min_chunks:
+            return [None] * len(query_embeddings)
+
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        similarities = queries @ centroids.T
+        routes = []
+        for query_similarities in similarities:
+            best = np.argsort(-query_similarities)[:max_topics]
+            if query_similarities[best[0]] < min_similarity or counts[best].sum() < n_results:
+                routes.append(None)
+            else:
+                routes.append([topics[i] for i in best])
+        return routes
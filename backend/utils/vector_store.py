@@ -1,18 +1,116 @@
 import uuid
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 import chromadb
 from chromadb.config import Settings
 
+from config import Config
+from utils.context_compressor import ContextCompressor
+from utils.embeddings import embed_texts
+from utils.flat_index import get_flat_store
+from utils.hot_index_cache import hot_index_cache
+from utils.index_maintenance import recover_collection
+from utils.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from utils.near_duplicates import NearDuplicateIndex
+from utils.retrieval_cache import retrieval_cache
+from utils.topic_router import TopicCentroids
+
+# Shared FTS5 index and worker pool used to run vector and lexical searches side by side
+lexical_index = LexicalIndex()
+topic_centroids = TopicCentroids()
+near_duplicates = NearDuplicateIndex()
+search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+context_compressor = ContextCompressor()
+
+
+def invalidate_project_index(project_id):
+    """
+    Drop everything this process caches about a project's index (retrieval results,
+    the hot in-memory copy, topic centroids), e.g. after another process indexed or restored it.
+    """
+    # The hot index cache is keyed on the retrieval generation, so one bump covers both;
+    # not published again, the change came from the log
+    retrieval_cache.bump_generation(project_id, publish=False)
+    topic_centroids.invalidate(project_id)
+
+
+def hnsw_configuration():
+    """ChromaDB collection configuration for the configured HNSW parameters."""
+    return {
+        "hnsw": {
+            "space": Config.HNSW_SPACE,
+            "max_neighbors": Config.HNSW_M,
+            "ef_construction": Config.HNSW_CONSTRUCTION_EF,
+            "ef_search": Config.HNSW_SEARCH_EF,
+        }
+    }
+
+
 class Indexer:
     """
     Handles indexing of chunks and topics into ChromaDB.
     """
-    def __init__(self, persist_directory: str = "./chroma_db"):
-        self.client = chromadb.PersistentClient(path=persist_directory)
+    def __init__(self, persist_directory: str = "./chroma_db", lexical=None):
         self.collection_name = "whizardlm_chunks"
-        if self.collection_name not in [c.name for c in self.client.list_collections()]:
-            self.collection = self.client.create_collection(self.collection_name)
+        if Config.VECTOR_BACKEND == "flat":
+            # In-process memmap index; exposes the same add/query/get/count surface
+            self.collection = get_flat_store()
         else:
-            self.collection = self.client.get_collection(self.collection_name)
+            self.client = chromadb.PersistentClient(path=persist_directory)
+            recovered = recover_collection(self.client, self.collection_name)
+            if recovered:
+                print(f"Recovered {self.collection_name} from an interrupted rebuild ({recovered})")
+            if self.collection_name not in [c.name for c in self.client.list_collections()]:
+                self.collection = self.client.create_collection(self.collection_name, configuration=hnsw_configuration())
+            else:
+                self.collection = self.client.get_collection(self.collection_name)
+                self._apply_hnsw_configuration()
+        self.lexical_index = lexical or lexical_index
+        self.topic_centroids = topic_centroids
+        self._backfill_lexical_index()
+        self._backfill_topic_centroids()
+
+    def _apply_hnsw_configuration(self):
+        """
+        Bring an existing collection's search ef in line with the config. The other
+        HNSW parameters are fixed at creation, so a mismatch is only reported.
+        """
+        current = (self.collection.configuration or {}).get("hnsw") or {}
+        wanted = hnsw_configuration()["hnsw"]
+        if current.get("ef_search") != wanted["ef_search"]:
+            self.collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+            print(f"Set HNSW search ef of {self.collection_name} to {wanted['ef_search']}")
+        fixed = [name for name in ("space", "max_neighbors", "ef_construction") if current.get(name) != wanted[name]]
+        if fixed:
+            print(f"HNSW {', '.join(fixed)} of {self.collection_name} differ from the config; "
+                  f"run `python index_admin.py rebuild` to apply them")
+
+    def _backfill_lexical_index(self, batch_size: int = 1000):
+        """
+        Populate the FTS5 index from ChromaDB when it is missing chunks,
+        e.g. on the first start after hybrid retrieval was introduced.
+        """
+        total = self.collection.count()
+        if self.lexical_index.count() >= total:
+            return
+        print(f"Backfilling lexical index with {total} chunks")
+        self.lexical_index.clear()
+        for offset in range(0, total, batch_size):
+            batch = self.collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+            self.lexical_index.add(batch["ids"], batch["documents"], batch["metadatas"])
+
+    def _backfill_topic_centroids(self, batch_size: int = 1000):
+        """Compute topic centroids from the stored embeddings when none exist yet."""
+        total = self.collection.count()
+        if not total or self.topic_centroids.count():
+            return
+        print(f"Computing topic centroids for {total} chunks")
+        for offset in range(0, total, batch_size):
+            batch = self.collection.get(offset=offset, limit=batch_size, include=["metadatas", "embeddings"])
+            self.topic_centroids.add(batch["metadatas"], batch["embeddings"])
 
     def get_conversation_id(self):
         """Generate a unique conversation ID (can be replaced with a more robust method)."""
@@ -22,11 +120,13 @@ class Indexer:
         """
         Indexes the chunks and topics into ChromaDB with a conversation ID and project ID.
         """
-        documents = []
-        metadatas = []
-        ids = []
-        for idx, (chunk, topic) in enumerate(zip(chunks, topics)):
-            documents.append(chunk)
+        self.index_stream(conversation_id, zip(chunks, topics), project_id=project_id)
+        return True
+
+    def _iter_batches(self, conversation_id, chunk_stream, project_id, batch_size):
+        """Group a (chunk, topic) stream into batches of documents, metadatas and ids."""
+        batch = {"documents": [], "metadatas": [], "ids": []}
+        for idx, (chunk, topic) in enumerate(chunk_stream):
             metadata = {
                 "conversation_id": conversation_id,
                 "topic": topic
@@ -34,62 +134,367 @@ class Indexer:
             # Add project_id if provided for proper project isolation
             if project_id:
                 metadata["project_id"] = project_id
-            
-            metadatas.append(metadata)
-            ids.append(f"{conversation_id}_{idx}")
-        
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        return True
+
+            batch["documents"].append(chunk)
+            batch["metadatas"].append(metadata)
+            batch["ids"].append(f"{conversation_id}_{idx}")
+            if len(batch["ids"]) >= batch_size:
+                yield batch
+                batch = {"documents": [], "metadatas": [], "ids": []}
+        if batch["ids"]:
+            yield batch
+
+    def index_stream(self, conversation_id, chunk_stream, project_id=None,
+                     batch_size: int = Config.INDEX_BATCH_SIZE, on_progress=None):
+        """
+        Index a stream of (chunk, topic) pairs in bounded batches.
+
+        A background thread embeds batch N+1 while batch N is written to ChromaDB and
+        the lexical index. The queue between them holds at most INDEX_PIPELINE_DEPTH
+        batches, so a slow writer stalls the embedder instead of buffering the whole
+        source in memory. Batches written before a failure stay indexed.
+
+        Chunks that near-duplicate a chunk already stored in the project (or an
+        earlier chunk of the stream) are dropped before embedding and only linked
+        to the chunk they duplicate.
+
+        Args:
+            conversation_id: Conversation the chunks belong to (also the id prefix)
+            chunk_stream: Iterable of (chunk, topic) tuples; may be a generator
+            project_id: Project ID for project isolation
+            batch_size: Chunks per embedding call and per write
+            on_progress: Optional callback receiving the number of chunks indexed so far
+
+        Returns:
+            int: Number of chunks indexed
+        """
+        batches = queue.Queue(maxsize=Config.INDEX_PIPELINE_DEPTH)
+        stop = threading.Event()
+        dedup = near_duplicates.session(project_id) if Config.DEDUP_ENABLED else None
+
+        def put(item):
+            # Block while the writer is behind, but give up once it has stopped
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def embed_batches():
+            try:
+                for batch in self._iter_batches(conversation_id, chunk_stream, project_id, batch_size):
+                    if dedup:
+                        dedup.filter(batch)
+                    batch["embeddings"] = embed_texts(batch["documents"])
+                    if not put(batch):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        embedder = threading.Thread(target=embed_batches, name="index-embedder", daemon=True)
+        embedder.start()
+
+        indexed = 0
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                if batch["ids"]:
+                    self.collection.add(
+                        documents=batch["documents"],
+                        metadatas=batch["metadatas"],
+                        ids=batch["ids"],
+                        embeddings=batch["embeddings"]
+                    )
+                    # Keep the lexical index in sync so hybrid retrieval sees the same chunks
+                    self.lexical_index.add(batch["ids"], batch["documents"], batch["metadatas"])
+                    self.topic_centroids.add(batch["metadatas"], batch["embeddings"])
+                if dedup:
+                    dedup.commit(batch)
+                indexed += len(batch["ids"])
+                print(f"Indexed {indexed} chunks for conversation {conversation_id}")
+                if on_progress:
+                    on_progress(indexed)
+        except Exception as e:
+            print(f"Indexing failed after {indexed} chunks for conversation {conversation_id}: {e}")
+            raise
+        finally:
+            stop.set()
+            embedder.join()
+            if dedup and dedup.duplicates:
+                print(f"Skipped {dedup.duplicates} near-duplicate chunks for conversation {conversation_id}")
+            # Cached retrieval results for this project no longer reflect its chunks
+            if indexed:
+                retrieval_cache.bump_generation(project_id)
+        return indexed
 
 class Retriever:
     """
     Retrieves relevant chunks from ChromaDB by semantic search or by topic.
     """
-    def __init__(self, conversation_id=None, project_id=None, persist_directory: str = "./chroma_db"):
+    def __init__(self, conversation_id=None, project_id=None, persist_directory: str = "./chroma_db", lexical=None):
         self.conversation_id = conversation_id
         self.project_id = project_id
-        self.client = chromadb.PersistentClient(path=persist_directory)
         self.collection_name = "whizardlm_chunks"
-        self.collection = self.client.get_collection(self.collection_name)
+        if Config.VECTOR_BACKEND == "flat":
+            self.collection = get_flat_store()
+        else:
+            self.client = chromadb.PersistentClient(path=persist_directory)
+            self.collection = self.client.get_collection(self.collection_name)
+        self.lexical_index = lexical or lexical_index
 
-    def semantic_search(self, query, n_results=5):
+    def _where_clause(self, topics=None):
         """
-        Retrieve the most relevant chunks for a query using ChromaDB's query API.
-        Now properly filters by project_id when provided.
+        Build the ChromaDB where filter for this retriever's conversation/project scope,
+        optionally restricted to a set of topics.
+        ChromaDB requires an explicit $and when more than one field is filtered.
         """
-        print("all item in collections:", self.collection.get())
-        
-        # Build where clause for filtering
-        where_clause = {}
-        
+        conditions = []
         # Filter by conversation_id if provided
         if self.conversation_id:
-            where_clause["conversation_id"] = self.conversation_id
-        
+            conditions.append({"conversation_id": self.conversation_id})
         # Filter by project_id if provided (for project-level isolation)
         if self.project_id:
-            where_clause["project_id"] = self.project_id
-        
-        # Execute query with appropriate filtering
+            conditions.append({"project_id": self.project_id})
+        if topics:
+            conditions.append({"topic": {"$in": list(topics)}})
+
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    def _vector_search(self, query_embedding, n_results):
+        """
+        Run a vector similarity query for an already embedded query.
+        Returns a list of (chunk_id, document) tuples, best match first.
+        """
+        return self._vector_search_many([query_embedding], n_results)[0]
+
+    def _vector_search_many(self, query_embeddings, n_results):
+        """
+        Run several vector similarity queries, batched into one search where possible.
+        Returns one list of (chunk_id, document) tuples per query embedding.
+        Project-scoped searches are answered from the hot index cache when the
+        project fits in its memory budget, and routed to the closest topics when
+        the project is large enough for routing to pay off.
+        """
+        hot_index = hot_index_cache.get(self.collection, self.project_id)
+        if hot_index is not None:
+            def search(embeddings, topics=None):
+                return hot_index.search(embeddings, n_results, conversation_id=self.conversation_id, topics=topics)
+        else:
+            def search(embeddings, topics=None):
+                return self._query(embeddings, n_results, self._where_clause(topics))
+
+        # Large projects: search only the chunks of each query's closest topics
+        routes = [None] * len(query_embeddings)
+        if self.project_id:
+            routes = topic_centroids.route(self.project_id, query_embeddings, n_results)
+
+        # Queries routed to the same topics are searched together in one pass
+        by_route = {}
+        for i, topics in enumerate(routes):
+            if topics is not None:
+                by_route.setdefault(tuple(sorted(topics)), []).append(i)
+
+        hits = [None] * len(query_embeddings)
+        for topics, members in by_route.items():
+            routed = search([query_embeddings[i] for i in members], list(topics))
+            for i, query_hits in zip(members, routed):
+                # Too few hits in the routed topics (e.g. a narrow conversation filter): search everything
+                if len(query_hits) >= n_results:
+                    hits[i] = query_hits
+        routed_count = sum(query_hits is not None for query_hits in hits)
+        if routed_count:
+            print(f"Topic routing: {routed_count}/{len(query_embeddings)} queries searched their closest topics only "
+                  f"({len(by_route)} searches)")
+
+        full = [i for i, query_hits in enumerate(hits) if query_hits is None]
+        if full:
+            for i, query_hits in zip(full, search([query_embeddings[i] for i in full])):
+                hits[i] = query_hits
+        return hits
+
+    def _query(self, query_embeddings, n_results, where_clause):
+        """One collection.query call; returns a list of (chunk_id, document) tuples per query."""
+        embeddings = [embedding.tolist() for embedding in query_embeddings]
         if where_clause:
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=embeddings,
                 n_results=n_results,
                 where=where_clause
             )
         else:
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=embeddings,
                 n_results=n_results
             )
-        
-        print(f"Search results: {results}")
+        ids = results.get("ids") or [[] for _ in embeddings]
+        documents = results.get("documents") or [[] for _ in embeddings]
+        return [list(zip(query_ids, query_documents)) for query_ids, query_documents in zip(ids, documents)]
+
+    def _lexical_search(self, query, n_results):
+        """Run a BM25 query over the FTS5 index with the same scope as the vector search."""
+        return self.lexical_index.search(
+            query,
+            n_results=n_results,
+            project_id=self.project_id,
+            conversation_id=self.conversation_id
+        )
+
+    def _cached_search(self, mode, query, n_results, search):
+        """
+        Serve a search from the retrieval cache, falling back to search(query_embedding)
+        on a miss. Results are cached per (project, conversation, mode, n_results).
+        """
+        scope = (self.project_id, self.conversation_id, mode, n_results)
+        cached = retrieval_cache.get(scope, query)
+        if cached is not None:
+            return cached
+
+        # Embed once: used for the near-duplicate lookup and the vector search itself
+        query_embedding = embed_texts([query])[0]
+        cached = retrieval_cache.get_similar(scope, query_embedding)
+        if cached is not None:
+            return cached
+
+        generation = retrieval_cache.generation(self.project_id)
+        hits = search(query_embedding)
+        retrieval_cache.put(scope, query, hits, generation, embedding=query_embedding)
+        return hits
+
+    def semantic_search(self, query, n_results=5):
+        """
+        Retrieve the most relevant chunks for a query using ChromaDB's query API.
+        Now properly filters by project_id when provided.
+        """
+        hits = self._cached_search(
+            "vector", query, n_results,
+            lambda query_embedding: self._vector_search(query_embedding, n_results)
+        )
+        print(f"Vector search returned {len(hits)} chunks")
         # Return the matched documents (chunks)
-        return results.get("documents", [[]])[0]
+        return [document for _, document in hits]
+
+    def batch_search(self, queries, n_results=5):
+        """
+        Vector search for several queries at once (e.g. one per selected topic, or a
+        chat query plus reformulations).
+
+        Cached queries are answered from the retrieval cache; the rest are embedded in
+        one batch and searched with one collection.query call.
+
+        Args:
+            queries: List of query strings
+            n_results: Chunks per query
+
+        Returns:
+            dict: "results" holds the documents for each query in input order, and
+                  "merged" holds the deduplicated union ranked by reciprocal-rank fusion
+        """
+        scope = (self.project_id, self.conversation_id, "vector", n_results)
+        hits = [retrieval_cache.get(scope, query) for query in queries]
+        missing = [i for i, cached in enumerate(hits) if cached is None]
+
+        if missing:
+            query_embeddings = embed_texts([queries[i] for i in missing])
+            to_search = []
+            for i, query_embedding in zip(missing, query_embeddings):
+                hits[i] = retrieval_cache.get_similar(scope, query_embedding)
+                if hits[i] is None:
+                    to_search.append((i, query_embedding))
+
+            if to_search:
+                generation = retrieval_cache.generation(self.project_id)
+                searched = self._vector_search_many([embedding for _, embedding in to_search], n_results)
+                for (i, query_embedding), query_hits in zip(to_search, searched):
+                    hits[i] = query_hits
+                    retrieval_cache.put(scope, queries[i], query_hits, generation, embedding=query_embedding)
+
+        print(f"Batch search: {len(queries)} queries, {len(missing)} not in the exact-match cache")
+        return {
+            "results": [[document for _, document in query_hits] for query_hits in hits],
+            "merged": [document for _, document in reciprocal_rank_fusion(hits, k=Config.RRF_K)],
+        }
+
+    def hybrid_search(self, query, n_results=5):
+        """
+        Retrieve chunks with vector and BM25 search run concurrently, fused with
+        reciprocal-rank fusion. Results are served from the retrieval cache when possible.
+        """
+        hits = self._cached_search(
+            "hybrid", query, n_results,
+            lambda query_embedding: self._hybrid_hits(query, query_embedding, n_results)
+        )
+        print(f"Hybrid search returned {len(hits)} chunks")
+        return [document for _, document in hits]
+
+    def retrieve_context(self, query, n_results=5):
+        """
+        Retrieve prompt-ready context for chat: hybrid candidates with near-duplicates
+        dropped, diversified with MMR and trimmed to the sentences relevant to the query.
+        """
+        hits = self._cached_search(
+            "context", query, n_results,
+            lambda query_embedding: self._compressed_hits(query, query_embedding, n_results)
+        )
+        return [document for _, document in hits]
+
+    def _compressed_hits(self, query, query_embedding, n_results):
+        """Over-fetch hybrid candidates and compress them down to n_results chunks."""
+        candidates = self._hybrid_hits(query, query_embedding, n_results * Config.CONTEXT_CANDIDATE_FACTOR)
+        if not candidates:
+            return []
+        # Reuse the stored chunk embeddings rather than embedding the candidates again;
+        # the scope keeps the flat backend from opening every other project's index
+        candidate_ids = [chunk_id for chunk_id, _ in candidates]
+        where_clause = self._where_clause()
+        if where_clause:
+            stored = self.collection.get(ids=candidate_ids, where=where_clause, include=["embeddings"])
+        else:
+            stored = self.collection.get(ids=candidate_ids, include=["embeddings"])
+        vectors_by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        hits = [hit for hit in candidates if hit[0] in vectors_by_id]
+        compressed = context_compressor.compress(
+            query, query_embedding, hits, [vectors_by_id[chunk_id] for chunk_id, _ in hits], n_results
+        )
+        before = sum(len(document) for _, document in candidates[:n_results])
+        after = sum(len(document) for _, document in compressed)
+        print(f"Context compression: {len(candidates)} candidates -> {len(compressed)} chunks, {before} -> {after} chars")
+        return compressed
+
+    def _hybrid_hits(self, query, query_embedding, n_results):
+        """
+        Run vector and BM25 search concurrently and fuse them. Searches that miss the
+        latency budget are left out of the fusion; if neither finishes in time we
+        wait for the vector search.
+        """
+        candidates = max(n_results, Config.HYBRID_CANDIDATES)
+        vector_future = search_executor.submit(self._vector_search, query_embedding, candidates)
+        lexical_future = search_executor.submit(self._lexical_search, query, candidates)
+
+        deadline = time.monotonic() + Config.RETRIEVAL_LATENCY_BUDGET_MS / 1000
+        ranked_lists = []
+        for name, future in (("vector", vector_future), ("lexical", lexical_future)):
+            try:
+                ranked_lists.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                print(f"Hybrid search: {name} search exceeded latency budget, skipping")
+            except Exception as e:
+                print(f"Hybrid search: {name} search failed: {e}")
+
+        if not ranked_lists:
+            ranked_lists.append(vector_future.result())
+
+        return reciprocal_rank_fusion(ranked_lists, k=Config.RRF_K)[:n_results]
 
     def retrieve_content_with_topics(self, topics):
         """
@@ -116,7 +521,7 @@ class Retriever:
         for metadata, doc in zip(metadatas, documents):
             if metadata.get("topic") in topics:
                 all_chunks.append(doc)
-        return all_chunks
+        return all_chunks + self._linked_duplicates(self.project_id, topics, results, where_clause)
 
     def retrieve_content_by_project(self, project_id, topics):
         """
@@ -139,6 +544,24 @@ class Retriever:
             if metadata.get("topic") in topics:
                 all_chunks.append(doc)
         
-        return all_chunks
+        return all_chunks + self._linked_duplicates(project_id, topics, results, where_clause)
+
+    def _linked_duplicates(self, project_id, topics, results, where_clause):
+        """
+        Text of stored chunks that skipped near-duplicates with one of these topics link to,
+        when the stored chunk itself has another topic and is not in the results yet.
+        """
+        returned = {
+            chunk_id for chunk_id, metadata in zip(results.get("ids", []), results.get("metadatas", []))
+            if metadata.get("topic") in topics
+        }
+        linked = [chunk_id for chunk_id in near_duplicates.linked_chunk_ids(project_id, topics) if chunk_id not in returned]
+        if not linked:
+            return []
+        if where_clause:
+            linked_results = self.collection.get(ids=linked, where=where_clause)
+        else:
+            linked_results = self.collection.get(ids=linked)
+        return linked_results.get("documents", [])
 
 
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import Config
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread that commits queued writes in groups.
+
+    Writes from all requests are queued as (DatabaseClient method, arguments) with a
+    Future each. The writer takes whatever is queued, waits up to window_ms for more,
+    and runs the whole group in one transaction, so a burst of chat turns costs one
+    commit instead of one per message. Each write runs in its own savepoint: a write
+    that fails only fails its own Future. Futures resolve after the group commits.
+    """
+    def __init__(self, client, window_ms: float = Config.SQLITE_GROUP_COMMIT_MS,
+                 max_batch: int = Config.SQLITE_GROUP_COMMIT_MAX):
+        self.client = client
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"writes": 0, "failed": 0, "commits": 0, "largest_group": 0}
+        self._thread = threading.Thread(target=self._run, name="db-write", daemon=True)
+        self._thread.start()
+
+    def submit(self, method, *args, **kwargs) -> Future:
+        """
+        Queue a DatabaseClient write call; the Future gets its return value.
+        Raises RuntimeError once close() was called, as nothing would run the write.
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("GroupCommitWriter is closed")
+            self._queue.put((method, args, kwargs, future))
+        return future
+
+    def _next_group(self):
+        """Block for one write, then gather more until the window closes or the group is full."""
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        group = [first]
+        deadline = time.monotonic() + self.window
+        while len(group) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return group, True
+            group.append(item)
+        return group, False
+
+    def _commit(self, group):
+        outcomes = []
+        try:
+            with self.client.group_transaction():
+                for method, args, kwargs, _ in group:
+                    try:
+                        outcomes.append((method(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((None, e))
+        except Exception as e:
+            print(f"Group commit of {len(group)} writes failed: {e}")
+            outcomes = [(None, e)] * len(group)
+
+        failed = 0
+        for (_, _, _, future), (result, error) in zip(group, outcomes):
+            if error is not None:
+                failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        with self._stats_lock:
+            self._stats["writes"] += len(group)
+            self._stats["failed"] += failed
+            self._stats["commits"] += 1
+            self._stats["largest_group"] = max(self._stats["largest_group"], len(group))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            group, stopping = self._next_group()
+            if group:
+                self._commit(group)
+
+    def stats(self) -> dict:
+        """Writes, commits and average group size since startup."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["writes_per_commit"] = stats["writes"] / stats["commits"] if stats["commits"] else 0.0
+        return stats
+
+    def close(self):
+        """Commit everything queued so far and stop the writer thread."""
+        with self._close_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
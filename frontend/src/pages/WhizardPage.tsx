@@ -32,6 +32,7 @@ import {
   Add as AddIcon,
 } from '@mui/icons-material';
 import { ROUTES } from '../services/routes';
+import { fetchAllPages } from '../services/pagination';
 
 interface Message {
   sender: 'user' | 'whizard';
@@ -104,10 +105,9 @@ export const WhizardPage = () => {
   const fetchSources = async () => {
     if (projectId && token) {
       try {
-        const resp = await fetch(ROUTES.SOURCES(projectId), {
+        const data = await fetchAllPages(ROUTES.SOURCES(projectId), 'sources', {
           headers: { Authorization: `Bearer ${token}` }
         });
-        const data = await resp.json();
         setSources(data.sources || []);
       } catch (e) {
         setSources([]);
@@ -145,39 +145,25 @@ export const WhizardPage = () => {
 
     try {
       // First check if we have any sources
-      const sourcesResponse = await fetch(ROUTES.SOURCES(projectId), {
+      const sourcesData = await fetchAllPages(ROUTES.SOURCES(projectId), 'sources', {
         headers: { 
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
         }
-      });
-
-      if (!sourcesResponse.ok) {
+      }).catch(() => {
         throw new Error('Failed to fetch sources');
-      }
-
-      const sourcesData = await sourcesResponse.json();
+      });
       const hasSources = sourcesData.sources && sourcesData.sources.length > 0;
       setSources(sourcesData.sources || []);
 
       // Fetch conversations
       console.log('Fetching conversations for project:', projectId);
-      const resp = await fetch(ROUTES.AUTH_CONVERSATIONS(projectId), {
+      const data = await fetchAllPages(ROUTES.AUTH_CONVERSATIONS(projectId), 'conversations', {
         headers: { 
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
         }
       });
-
-      if (!resp.ok) {
-        const errorData = await resp.json().catch(() => ({}));
-        throw new Error(
-          errorData.detail || 
-          `Failed to fetch conversations: ${resp.status} ${resp.statusText}`
-        );
-      }
-
-      const data = await resp.json();
       console.log('Fetched conversations:', data);
       
       if (!data || typeof data !== 'object') {
@@ -195,7 +181,9 @@ export const WhizardPage = () => {
         return;
       }
 
-      // Validate conversation objects and filter out invalid ones
+      // Validate conversation objects and filter out invalid ones; a conversation that moved
+      // to the front while the pages were fetched can show up twice
+      const seenIds = new Set<string>();
       const validConversations = data.conversations.filter((conv: Conversation) => {
         if (!conv || typeof conv !== 'object') {
           console.warn('Invalid conversation object:', conv);
@@ -205,6 +193,10 @@ export const WhizardPage = () => {
           console.warn('Conversation missing valid ID:', conv);
           return false;
         }
+        if (seenIds.has(conv.id)) {
+          return false;
+        }
+        seenIds.add(conv.id);
         return true;
       });
 
@@ -264,16 +256,11 @@ export const WhizardPage = () => {
       if (conversationId && token) {
         console.log('Loading selected conversation:', conversationId);
         try {
-          const response = await fetch(ROUTES.CONVERSATIONS(conversationId), {
+          // Pages run from the newest messages back; load them all, oldest first
+          const data = await fetchAllPages(ROUTES.CONVERSATIONS(conversationId), 'messages', {
             method: 'GET',
             headers: { 'Authorization': `Bearer ${token}` }
-          });
-
-          if (!response.ok) {
-            throw new Error('Failed to load conversation');
-          }
-
-          const data = await response.json();
+          }, true);
           if (data.messages) {
             const msgs = data.messages.map((msg: { type: string; content: string }) => ({
               sender: msg.type === 'user' ? 'user' as const : 'whizard' as const,
@@ -312,23 +299,13 @@ export const WhizardPage = () => {
     setIsChatLoading(true);
 
     try {
-      const response = await fetch(ROUTES.CONVERSATIONS(selectedConversationId), {
+      const data = await fetchAllPages(ROUTES.CONVERSATIONS(selectedConversationId), 'messages', {
         method: 'GET',
         headers: { 
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
         }
-      });
-
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({}));
-        throw new Error(
-          errorData.detail || 
-          `Failed to fetch conversation: ${response.status} ${response.statusText}`
-        );
-      }
-
-      const data = await response.json();
+      }, true);
       console.log('Conversation data:', data);
       
       if (!data.messages || !Array.isArray(data.messages)) {
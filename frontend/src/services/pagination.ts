@@ -0,0 +1,36 @@
+// Paged list endpoints return one page per request plus a next_cursor (null on the last page)
+
+const withCursor = (url: string, cursor: string) =>
+  `${url}${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`;
+
+/**
+ * Fetch every page of a paged list endpoint by following next_cursor.
+ * Returns the first page's response body with `key` holding the items of all pages.
+ * Chat message pages run from the newest messages back, so pass olderPagesFirst
+ * to keep the merged list in chronological order.
+ */
+export async function fetchAllPages(
+  url: string,
+  key: string,
+  init?: RequestInit,
+  olderPagesFirst = false
+): Promise<any> {
+  let data: any = null;
+  let cursor: string | null = null;
+  do {
+    const response: Response = await fetch(cursor ? withCursor(url, cursor) : url, init);
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || `Request failed: ${response.status} ${response.statusText}`);
+    }
+    const page = await response.json();
+    if (data === null) {
+      data = page;
+    } else if (Array.isArray(page[key])) {
+      const items = Array.isArray(data[key]) ? data[key] : [];
+      data[key] = olderPagesFirst ? [...page[key], ...items] : [...items, ...page[key]];
+    }
+    cursor = page && page.next_cursor ? page.next_cursor : null;
+  } while (cursor);
+  return data;
+}